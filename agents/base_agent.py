@@ -4,16 +4,19 @@ Provides common functionality for all agents in the system.
 """
 
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from typing import Annotated, Any, Dict, List, Optional
 from langgraph.graph import StateGraph
+from langgraph.graph.message import add_messages
 from langchain_core.messages import BaseMessage, HumanMessage
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class AgentState(BaseModel):
     """Base state for agents"""
     
-    messages: List[BaseMessage]
+    # Appended to (not replaced) by each node / turn, so checkpointed
+    # sessions keep the full conversation
+    messages: Annotated[List[BaseMessage], add_messages] = Field(default_factory=list)
     current_tool: Optional[str] = None
     tool_result: Optional[str] = None
     final_response: Optional[str] = None
@@ -5,29 +5,157 @@ Routes user queries to appropriate tools based on intent.
 
 import json
 import os
+import time
+import uuid
 import asyncio
-from typing import Any, Dict, Optional, List
+from collections import OrderedDict
+from typing import Annotated, Any, Dict, Optional, List
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
-from pydantic import BaseModel
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, RemoveMessage
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send, CachePolicy
+from langgraph.cache.memory import InMemoryCache
+from langgraph.checkpoint.memory import InMemorySaver
+from pydantic import BaseModel, Field
 
 from agents.base_agent import BaseAgent, AgentState, BaseTool
 from agents.tools import PestsDiseasesTool, GovtSchemesTool
+from services.rate_limiter import rate_governor, PRIORITY_BATCH
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Batch execution settings (see run_farm_agent_batch)
+AGENT_BATCH_CONCURRENCY = int(os.getenv("AGENT_BATCH_CONCURRENCY", "4"))
+
+
+# Graph caching / session settings
+AGENT_NODE_CACHE_TTL = int(os.getenv("AGENT_NODE_CACHE_TTL", "600"))
+AGENT_NODE_CACHE_SIZE = int(os.getenv("AGENT_NODE_CACHE_SIZE", "2000"))
+AGENT_MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", "1000"))
+AGENT_SESSION_RESULTS_LIMIT = 20
+# Messages kept per session (oldest are dropped from the checkpointed state)
+AGENT_SESSION_MESSAGES_LIMIT = 20
+
+
+class BoundedNodeCache(InMemoryCache):
+    """
+    InMemoryCache that doesn't grow without bound: InMemoryCache only drops
+    an expired entry when it's read again, so every distinct query would
+    stay forever. Expired entries are swept on write (at most once per
+    sweep_interval seconds, or when full) and past max_entries the oldest
+    writes are evicted.
+    """
+
+    def __init__(self, max_entries: int = AGENT_NODE_CACHE_SIZE, sweep_interval: float = 60.0):
+        super().__init__()
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+
+    def _size(self) -> int:
+        return sum(len(entries) for entries in self._cache.values())
+
+    def _sweep_expired(self) -> None:
+        now = time.time()
+        self._last_sweep = now
+        for entries in self._cache.values():
+            for key in [k for k, (_, _, expiry) in entries.items() if expiry is not None and expiry <= now]:
+                del entries[key]
+
+    def set(self, keys) -> None:
+        with self._lock:
+            # Re-written keys move to the end (dicts evict in insertion order)
+            for ns, key in keys:
+                self._cache.get(ns, {}).pop(key, None)
+            super().set(keys)
+            size = self._size()
+            if size > self.max_entries or time.time() - self._last_sweep > self.sweep_interval:
+                self._sweep_expired()
+                size = self._size()
+            while size > self.max_entries:
+                oldest = min(
+                    (entries for entries in self._cache.values() if entries),
+                    key=lambda entries: next(iter(entries.values()))[2] or float("inf")
+                )
+                del oldest[next(iter(oldest))]
+                size -= 1
+
+    async def aset(self, keys) -> None:
+        self.set(keys)
+
+
+# Shared by every agent instance: the checkpointer holds per-session state,
+# the node cache holds route/retrieve results across sessions
+_checkpointer = InMemorySaver()
+_node_cache = BoundedNodeCache()
+_sessions: "OrderedDict[str, None]" = OrderedDict()
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for cache keys (case and whitespace insensitive)"""
+    return " ".join(query.lower().split())
+
+
+def _result_key(tool_name: str, query: str) -> str:
+    """Key of a tool result in FarmAgentState.tool_results"""
+    return f"{tool_name}::{normalize_query(query)}"
+
+
+def merge_tool_results(left: Dict[str, str], right: Dict[str, str]) -> Dict[str, str]:
+    """Reducer for tool_results: merge parallel retrieve outputs, keep the most recent entries"""
+    merged = {**(left or {}), **(right or {})}
+    if len(merged) > AGENT_SESSION_RESULTS_LIMIT:
+        merged = dict(list(merged.items())[-AGENT_SESSION_RESULTS_LIMIT:])
+    return merged
+
+
+def trim_messages(messages: List[BaseMessage], new_count: int) -> List[RemoveMessage]:
+    """
+    RemoveMessage updates (for the add_messages reducer) dropping the oldest
+    session messages so that, with new_count messages about to be added, at
+    most AGENT_SESSION_MESSAGES_LIMIT remain
+    """
+    excess = len(messages) + new_count - AGENT_SESSION_MESSAGES_LIMIT
+    if excess <= 0:
+        return []
+    return [RemoveMessage(id=message.id) for message in messages[:excess] if message.id]
+
+
+def _touch_session(session_id: str) -> None:
+    """Mark a session as recently used, dropping the oldest sessions past AGENT_MAX_SESSIONS"""
+    _sessions[session_id] = None
+    _sessions.move_to_end(session_id)
+    while len(_sessions) > AGENT_MAX_SESSIONS:
+        expired, _ = _sessions.popitem(last=False)
+        _checkpointer.delete_thread(expired)
+
+
 class ToolSelection(BaseModel):
     """Model for tool selection response"""
     tool_name: str
+    tool_names: List[str] = []
     confidence: float
     reasoning: str
 
 
+class FarmAgentState(AgentState):
+    """Graph state for the farm agent (checkpointed per session)"""
+    
+    query: str = ""
+    tool_selection: Optional[Dict[str, Any]] = None
+    # Tool output keyed by tool + normalized query, so an unchanged question
+    # in the same session skips the retrieve step
+    tool_results: Annotated[Dict[str, str], merge_tool_results] = Field(default_factory=dict)
+    error: Optional[str] = None
+
+
 class FarmAssistantAgent(BaseAgent):
     """
     Farm Assistant Agent using LangGraph.
     Routes queries to pests/diseases or government schemes tools.
+    
+    Graph: route -> retrieve (one branch per selected tool, run in parallel) -> generate
     """
     
     def __init__(
@@ -53,22 +181,105 @@ class FarmAssistantAgent(BaseAgent):
     def build_graph(self):
         """
         Build the LangGraph graph.
-        Current implementation: Simple tool routing without StateGraph
-        (can be upgraded to full StateGraph later)
+        
+        route and retrieve are memoized in the shared node cache (keyed on the
+        normalized query), and the graph is compiled with a checkpointer so
+        sessions resume with their previous tool results.
+        """
+        builder = StateGraph(FarmAgentState)
+        
+        builder.add_node(
+            "route",
+            self._route_node,
+            cache_policy=CachePolicy(
+                key_func=lambda state: normalize_query(state.query),
+                ttl=AGENT_NODE_CACHE_TTL
+            )
+        )
+        builder.add_node(
+            "retrieve",
+            self._retrieve_node,
+            cache_policy=CachePolicy(
+                key_func=lambda task: _result_key(task["tool_name"], task["query"]),
+                ttl=AGENT_NODE_CACHE_TTL
+            )
+        )
+        builder.add_node("generate", self._generate_node)
+        
+        builder.add_edge(START, "route")
+        builder.add_conditional_edges("route", self._fan_out, ["retrieve", "generate"])
+        builder.add_edge("retrieve", "generate")
+        builder.add_edge("generate", END)
+        
+        return builder.compile(checkpointer=_checkpointer, cache=_node_cache)
+    
+    async def _route_node(self, state: FarmAgentState) -> Dict[str, Any]:
+        """Graph node: select the tool(s) for the current query"""
+        tool_selection = await self._select_tool(state.query)
+        
+        tool_names = [name for name in tool_selection.tool_names if name in self.tools]
+        if not tool_names:
+            return {
+                "tool_selection": None,
+                "error": f"Tool '{tool_selection.tool_name}' not found"
+            }
+        
+        return {
+            "tool_selection": {
+                "tool_name": tool_names[0],
+                "tool_names": tool_names,
+                "confidence": tool_selection.confidence,
+                "reasoning": tool_selection.reasoning
+            },
+            "error": None
+        }
+    
+    def _fan_out(self, state: FarmAgentState):
+        """
+        Conditional edge after route: one parallel retrieve branch per selected
+        tool, skipping tools whose result for this query is already in the session.
         """
-        # Note: Full graph implementation would use StateGraph
-        # For now, we use a simpler routing mechanism
-        return None
+        if state.error or not state.tool_selection:
+            return "generate"
+        
+        sends = [
+            Send("retrieve", {"tool_name": tool_name, "query": state.query})
+            for tool_name in state.tool_selection["tool_names"]
+            if _result_key(tool_name, state.query) not in state.tool_results
+        ]
+        return sends or "generate"
+    
+    async def _retrieve_node(self, task: Dict[str, str]) -> Dict[str, Any]:
+        """Graph node: execute a single tool"""
+        tool: BaseTool = self.tools[task["tool_name"]]
+        result = await tool.execute({"query": task["query"]})
+        return {"tool_results": {_result_key(task["tool_name"], task["query"]): result}}
+    
+    def _generate_node(self, state: FarmAgentState) -> Dict[str, Any]:
+        """Graph node: combine tool results into the final response"""
+        if state.error or not state.tool_selection:
+            return {"final_response": None, "messages": trim_messages(state.messages, 0)}
+        
+        tool_names = state.tool_selection["tool_names"]
+        results = [state.tool_results.get(_result_key(name, state.query), "") for name in tool_names]
+        final_response = "\n\n".join(results)
+        
+        return {
+            "current_tool": tool_names[0],
+            "tool_result": final_response,
+            "final_response": final_response,
+            "messages": trim_messages(state.messages, 1) + [AIMessage(content=final_response)]
+        }
     
     async def _select_tool(self, user_message: str) -> ToolSelection:
         """
-        Use LLM to select the appropriate tool based on user message.
+        Use LLM to select the appropriate tool(s) based on user message.
         
         Args:
             user_message: The user's input query
         
         Returns:
-            ToolSelection with tool name and confidence
+            ToolSelection with tool name(s) and confidence
         """
         
         prompt = f"""You are a farm assistant that helps farmers with agricultural queries.
@@ -79,9 +290,11 @@ Available tools:
 
 User Query: {user_message}
 
-Based on the user query, select the BEST matching tool. Respond in JSON format:
+Based on the user query, select the BEST matching tool. If the query clearly needs
+both tools (e.g. a subsidy for a pest-control product), list both. Respond in JSON format:
 {{
     "tool_name": "pests_and_diseases" or "govt_schemes",
+    "tool_names": ["the best matching tool", "optionally the other tool"],
     "confidence": 0.0 to 1.0,
     "reasoning": "Brief explanation of why this tool was selected"
 }}
@@ -90,7 +303,11 @@ Important: You MUST respond ONLY with valid JSON, no additional text."""
         
         messages = [HumanMessage(content=prompt)]
         
-        response = await self.llm.ainvoke(messages)
+        # Paced by the shared Gemini rate limiter (retries 429s)
+        response = await rate_governor.call(
+            lambda: self.llm.ainvoke(messages),
+            ("gemini", self.model_name)
+        )
         
         try:
             # Parse the JSON response
@@ -104,7 +321,10 @@ Important: You MUST respond ONLY with valid JSON, no additional text."""
                 content = content[:-3]
             
             tool_data = json.loads(content.strip())
-            return ToolSelection(**tool_data)
+            tool_selection = ToolSelection(**tool_data)
+            if tool_selection.tool_name not in tool_selection.tool_names:
+                tool_selection.tool_names.insert(0, tool_selection.tool_name)
+            return tool_selection
         
         except json.JSONDecodeError:
             # Fallback if JSON parsing fails
@@ -112,53 +332,68 @@ Important: You MUST respond ONLY with valid JSON, no additional text."""
             # Default to pests_and_diseases as fallback
             return ToolSelection(
                 tool_name="pests_and_diseases",
+                tool_names=["pests_and_diseases"],
                 confidence=0.5,
                 reasoning="Fallback selection due to parsing error"
             )
     
-    async def process_message(self, message: str) -> Dict[str, Any]:
+    def _graph_input(self, message: str, session_id: Optional[str]):
+        """Build graph input and config; anonymous calls get a throwaway thread"""
+        thread_id = session_id or f"anon-{uuid.uuid4().hex}"
+        if session_id:
+            _touch_session(session_id)
+        
+        inputs = {"query": message, "messages": [HumanMessage(content=message)]}
+        config = {"configurable": {"thread_id": thread_id}}
+        return inputs, config, thread_id
+    
+    async def process_message(self, message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Process a user message through the agent.
         
         Args:
             message: User's input query
+            session_id: Optional session to resume (reuses its previous tool results)
         
         Returns:
             Dictionary containing tool selection and results
         """
         
-        # Step 1: Select appropriate tool
-        tool_selection = await self._select_tool(message)
+        inputs, config, thread_id = self._graph_input(message, session_id)
         
-        # Step 2: Get the selected tool
-        selected_tool: BaseTool = self.tools.get(tool_selection.tool_name)
+        try:
+            state = await self.graph.ainvoke(inputs, config)
+        finally:
+            if not session_id:
+                _checkpointer.delete_thread(thread_id)
         
-        if not selected_tool:
+        if state.get("error"):
             return {
                 "status": "error",
-                "message": f"Tool '{tool_selection.tool_name}' not found",
+                "message": state["error"],
                 "tool_selected": None
             }
         
-        # Step 3: Execute the tool
-        tool_result = await selected_tool.execute({"query": message})
+        tool_selection = state["tool_selection"]
         
-        # Step 4: Format response
         return {
             "status": "success",
             "user_query": message,
-            "tool_selected": tool_selection.tool_name,
-            "tool_confidence": tool_selection.confidence,
-            "tool_reasoning": tool_selection.reasoning,
-            "tool_result": tool_result
+            "tool_selected": tool_selection["tool_name"],
+            "tools_selected": tool_selection["tool_names"],
+            "tool_confidence": tool_selection["confidence"],
+            "tool_reasoning": tool_selection["reasoning"],
+            "tool_result": state["final_response"],
+            "session_id": session_id
         }
     
-    async def process_message_streaming(self, message: str):
+    async def process_message_streaming(self, message: str, session_id: Optional[str] = None):
         """
         Process a message with streaming output.
         
         Args:
             message: User's input query
+            session_id: Optional session to resume
         
         Yields:
             Tool selection updates and results
@@ -169,60 +404,137 @@ Important: You MUST respond ONLY with valid JSON, no additional text."""
             "data": "Analyzing your query..."
         }
         
-        # Select tool
-        tool_selection = await self._select_tool(message)
+        inputs, config, thread_id = self._graph_input(message, session_id)
         
-        yield {
-            "event": "tool_selected",
-            "data": {
-                "tool_name": tool_selection.tool_name,
-                "confidence": tool_selection.confidence,
-                "reasoning": tool_selection.reasoning
-            }
-        }
-        
-        # Execute tool
-        selected_tool = self.tools.get(tool_selection.tool_name)
-        if selected_tool:
-            result = await selected_tool.execute({"query": message})
-            
-            yield {
-                "event": "result",
-                "data": result
-            }
-        else:
-            yield {
-                "event": "error",
-                "data": f"Tool '{tool_selection.tool_name}' not found"
-            }
+        try:
+            async for update in self.graph.astream(inputs, config, stream_mode="updates"):
+                if "route" in update:
+                    route_update = update["route"]
+                    if route_update.get("error"):
+                        yield {
+                            "event": "error",
+                            "data": route_update["error"]
+                        }
+                        continue
+                    
+                    tool_selection = route_update["tool_selection"]
+                    yield {
+                        "event": "tool_selected",
+                        "data": {
+                            "tool_name": tool_selection["tool_name"],
+                            "tool_names": tool_selection["tool_names"],
+                            "confidence": tool_selection["confidence"],
+                            "reasoning": tool_selection["reasoning"]
+                        }
+                    }
+                
+                elif "generate" in update and update["generate"].get("final_response"):
+                    yield {
+                        "event": "result",
+                        "data": update["generate"]["final_response"]
+                    }
+        finally:
+            if not session_id:
+                _checkpointer.delete_thread(thread_id)
 
 
 # Standalone functions for integration with FastAPI
 
-async def run_farm_agent(message: str) -> Dict[str, Any]:
+_farm_agent: Optional[FarmAssistantAgent] = None
+
+
+def get_farm_agent() -> FarmAssistantAgent:
+    """Get the shared agent instance (created on first use)"""
+    global _farm_agent
+    if _farm_agent is None:
+        _farm_agent = FarmAssistantAgent()
+    return _farm_agent
+
+
+async def run_farm_agent(message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Standalone function to run the farm agent.
     
     Args:
         message: User query
+        session_id: Optional session to resume
     
     Returns:
         Agent response
     """
-    agent = FarmAssistantAgent()
-    return await agent.process_message(message)
+    return await get_farm_agent().process_message(message, session_id)
 
 
-async def run_farm_agent_streaming(message: str):
+async def run_farm_agent_streaming(message: str, session_id: Optional[str] = None):
     """
     Standalone function to run the farm agent with streaming.
     
     Args:
         message: User query
+        session_id: Optional session to resume
     
     Yields:
         Streaming responses
     """
-    agent = FarmAssistantAgent()
-    async for event in agent.process_message_streaming(message):
-        yield event
\ No newline at end of file
+    async for event in get_farm_agent().process_message_streaming(message, session_id):
+        yield event
+
+
+async def _run_batch_item(
+    agent: FarmAssistantAgent,
+    index: int,
+    message: str,
+    semaphore: asyncio.Semaphore
+) -> Dict[str, Any]:
+    """
+    Run a single batch item, isolating its errors from the rest of the batch.
+    Rate-limited (429) upstream calls are already retried and paced by the
+    rate governor, so errors reaching here are reported, not retried.
+    """
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            result = await agent.process_message(message)
+            status = result.get("status", "error")
+            return {
+                "index": index,
+                "message": message,
+                "status": status,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+                "result": result if status == "success" else None,
+                "error": None if status == "success" else result.get("message")
+            }
+        except Exception as e:
+            return {
+                "index": index,
+                "message": message,
+                "status": "error",
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+                "result": None,
+                "error": str(e)
+            }
+
+
+async def run_farm_agent_batch(
+    messages: List[str],
+    max_concurrency: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Run the farm agent over many messages concurrently.
+    
+    Args:
+        messages: User queries
+        max_concurrency: Max items in flight (defaults to AGENT_BATCH_CONCURRENCY)
+    
+    Returns:
+        One result dict per message, in the same order as the input
+    """
+    agent = get_farm_agent()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or AGENT_BATCH_CONCURRENCY))
+    
+    # Batch items queue behind interactive requests in the rate limiter
+    with rate_governor.priority_scope(PRIORITY_BATCH):
+        return await asyncio.gather(*[
+            _run_batch_item(agent, i, message, semaphore)
+            for i, message in enumerate(messages)
+        ])
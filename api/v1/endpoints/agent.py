@@ -6,11 +6,24 @@ Handles /agent endpoint that accepts user messages and routes them to appropriat
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+import os
 import json
+import time
 import asyncio
-from typing import Optional
+from typing import List, Optional
 
-from agents.farm_agent import run_farm_agent, run_farm_agent_streaming
+
+def farm_agent():
+    """
+    agents.farm_agent, imported on first use: it pulls in langgraph and
+    langchain_google_genai, which would otherwise slow down app startup
+    """
+    import agents.farm_agent as module
+    return module
+
+
+# Upper bound on messages accepted by a single /agent/batch call
+AGENT_BATCH_MAX_ITEMS = int(os.getenv("AGENT_BATCH_MAX_ITEMS", "100"))
 
 
 # Request/Response Models
@@ -18,12 +31,14 @@ class AgentRequest(BaseModel):
     """Request model for agent endpoint"""
     message: str = Field(..., description="User's query message")
     stream: Optional[bool] = Field(False, description="Enable streaming response")
+    session_id: Optional[str] = Field(None, description="Session to resume for multi-turn conversations")
     
     class Config:
         json_schema_extra = {
             "example": {
                 "message": "What are the best ways to prevent rice leaf blast?",
-                "stream": False
+                "stream": False,
+                "session_id": "farmer-42"
             }
         }
 
@@ -40,9 +55,11 @@ class AgentResponse(BaseModel):
     status: str
     user_query: str
     tool_selected: str
+    tools_selected: List[str] = []
     tool_confidence: float
     tool_reasoning: str
     tool_result: str
+    session_id: Optional[str] = None
     
     class Config:
         json_schema_extra = {
@@ -50,13 +67,52 @@ class AgentResponse(BaseModel):
                 "status": "success",
                 "user_query": "What are the best ways to prevent rice leaf blast?",
                 "tool_selected": "pests_and_diseases",
+                "tools_selected": ["pests_and_diseases"],
                 "tool_confidence": 0.95,
                 "tool_reasoning": "User is asking about crop disease prevention",
-                "tool_result": "[PESTS & DISEASES TOOL]..."
+                "tool_result": "[PESTS & DISEASES TOOL]...",
+                "session_id": "farmer-42"
+            }
+        }
+
+
+class AgentBatchRequest(BaseModel):
+    """Request model for batch agent endpoint"""
+    messages: List[str] = Field(..., min_length=1, description="User query messages")
+    max_concurrency: Optional[int] = Field(None, ge=1, le=32, description="Max messages processed concurrently")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "messages": [
+                    "How can I prevent powdery mildew on wheat?",
+                    "Tell me about PM-KISAN scheme eligibility"
+                ],
+                "max_concurrency": 4
             }
         }
 
 
+class AgentBatchItem(BaseModel):
+    """Result for a single message in a batch"""
+    index: int
+    message: str
+    status: str
+    elapsed_ms: float
+    result: Optional[AgentResponse] = None
+    error: Optional[str] = None
+
+
+class AgentBatchResponse(BaseModel):
+    """Response model for batch agent endpoint"""
+    status: str
+    count: int
+    succeeded: int
+    failed: int
+    total_elapsed_ms: float
+    results: List[AgentBatchItem]
+
+
 # Create router
 router = APIRouter(prefix="/agent", tags=["agent"])
 
@@ -87,7 +143,7 @@ async def agent_endpoint(request: AgentRequest):
     
     try:
         # Process the message through the agent
-        result = await run_farm_agent(request.message)
+        result = await farm_agent().run_farm_agent(request.message, request.session_id)
         
         if result["status"] != "success":
             raise HTTPException(
@@ -151,14 +207,64 @@ async def test_agent():
         "Tell me about PM-KISAN scheme eligibility",
     ]
     
-    results = []
-    
-    for query in test_queries:
-        result = await run_farm_agent(query)
-        results.append(result)
+    items = await farm_agent().run_farm_agent_batch(test_queries)
     
     return {
         "status": "success",
         "test_count": len(test_queries),
-        "results": results
-    }
\ No newline at end of file
+        "results": [
+            item["result"] or {"status": "error", "message": item["error"]}
+            for item in items
+        ],
+        "elapsed_ms": [item["elapsed_ms"] for item in items]
+    }
+
+
+@router.post(
+    "/batch",
+    response_model=AgentBatchResponse,
+    summary="Process a batch of messages through farm agent",
+    description="Runs many user queries concurrently; failures are reported per item"
+)
+async def agent_batch_endpoint(request: AgentBatchRequest):
+    """
+    Batch endpoint for bulk question sets (e.g. from extension officers).
+    
+    Messages are processed concurrently (bounded by max_concurrency) and a
+    failure in one message does not fail the rest of the batch.
+    
+    Args:
+        request: AgentBatchRequest containing the messages
+    
+    Returns:
+        AgentBatchResponse with results in the same order as the input
+    
+    Raises:
+        HTTPException: If the batch is too large
+    """
+    
+    if len(request.messages) > AGENT_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(request.messages)} messages (max {AGENT_BATCH_MAX_ITEMS})"
+        )
+    
+    start = time.perf_counter()
+    items = await farm_agent().run_farm_agent_batch(request.messages, request.max_concurrency)
+    succeeded = sum(1 for item in items if item["status"] == "success")
+    
+    if succeeded == len(items):
+        status = "success"
+    elif succeeded == 0:
+        status = "error"
+    else:
+        status = "partial"
+    
+    return AgentBatchResponse(
+        status=status,
+        count=len(items),
+        succeeded=succeeded,
+        failed=len(items) - succeeded,
+        total_elapsed_ms=round((time.perf_counter() - start) * 1000, 2),
+        results=[AgentBatchItem(**item) for item in items]
+    )
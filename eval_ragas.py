@@ -5,13 +5,14 @@ Metrics: Faithfulness, Answer Relevance, Context Relevance
 
 import asyncio
 from services.rag_service import RAGService
-from typing import List, Dict
+from typing import Any, List, Dict
 import json
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 import os
 from dotenv import load_dotenv
 import numpy as np
+from services.embedding_codec import as_matrix, as_vector, cosine_similarities, to_list
 
 load_dotenv()
 
@@ -71,11 +72,9 @@ TEST_CASES = [
 ]
 
 
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
-    """Calculate cosine similarity between two vectors"""
-    vec1 = np.array(vec1)
-    vec2 = np.array(vec2)
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+def cosine_similarity(vec1: Any, vec2: Any) -> float:
+    """Calculate cosine similarity between two vectors (float32 arrays, no list round trip)"""
+    return float(cosine_similarities(vec1, as_matrix(vec2))[0])
 
 
 async def extract_statements(answer: str) -> List[str]:
@@ -174,21 +173,21 @@ async def calculate_answer_relevance(query: str, answer: str) -> Dict:
         return {"score": 0.0, "details": "Could not generate proxy questions"}
     
     # Step 2: Calculate embeddings and similarities
-    query_embedding = await embeddings.aembed_query(query)
+    query_embedding = as_vector(await embeddings.aembed_query(query))
     
-    similarities = []
-    for pq in proxy_questions:
-        pq_embedding = await embeddings.aembed_query(pq)
-        sim = cosine_similarity(query_embedding, pq_embedding)
-        similarities.append(sim)
+    # Proxy question embeddings as one (n, d) float32 matrix, compared in one pass
+    pq_embeddings = np.empty((len(proxy_questions), query_embedding.shape[0]), dtype=np.float32)
+    for row, pq in enumerate(proxy_questions):
+        pq_embeddings[row] = await embeddings.aembed_query(pq)
+    similarities = cosine_similarities(query_embedding, pq_embeddings)
     
     # Average similarity
-    score = sum(similarities) / len(similarities) if similarities else 0.0
+    score = float(similarities.mean()) if len(similarities) else 0.0
     
     return {
         "score": score,
         "proxy_questions": proxy_questions,
-        "similarities": similarities
+        "similarities": to_list(similarities)
     }
 
 
@@ -7,7 +7,7 @@ import asyncio
 import json
 import os
 import sys
-from typing import List, Dict
+from typing import Any, List, Dict
 from dotenv import load_dotenv
 import numpy as np
 
@@ -16,6 +16,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Import after path is set
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from services.embedding_codec import as_matrix, as_vector, cosine_similarities
 
 load_dotenv()
 
@@ -41,11 +42,9 @@ embeddings = None
 rag_service = None
 
 
-def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
-    """Calculate cosine similarity"""
-    vec1 = np.array(vec1)
-    vec2 = np.array(vec2)
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+def cosine_similarity(vec1: Any, vec2: Any) -> float:
+    """Calculate cosine similarity between two vectors (float32 arrays, no list round trip)"""
+    return float(cosine_similarities(vec1, as_matrix(vec2))[0])
 
 
 async def extract_statements(answer: str) -> List[str]:
@@ -129,15 +128,14 @@ async def calculate_answer_relevance(query: str, answer: str) -> float:
         return 0.0
     
     # Get embeddings
-    query_emb = await embeddings.aembed_query(query)
+    query_emb = as_vector(await embeddings.aembed_query(query))
     
-    similarities = []
-    for pq in proxy_qs:
-        pq_emb = await embeddings.aembed_query(pq)
-        sim = cosine_similarity(query_emb, pq_emb)
-        similarities.append(sim)
+    pq_embs = np.empty((len(proxy_qs), query_emb.shape[0]), dtype=np.float32)
+    for row, pq in enumerate(proxy_qs):
+        pq_embs[row] = await embeddings.aembed_query(pq)
+    similarities = cosine_similarities(query_emb, pq_embs)
     
-    score = sum(similarities) / len(similarities)
+    score = float(similarities.mean())
     print(f"    Answer Relevance: avg similarity = {score:.3f}")
     return score
 
@@ -1,8 +1,9 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 import os
+import sys
 import asyncio
 import logging
 
@@ -11,8 +12,19 @@ import logging
 load_dotenv()
 
 # Import Routers and Services
-from routes.rag_routes import router as rag_router, rag_service
-from api.v1.endpoints.agent import router as agent_router
+from routes.rag_routes import router as rag_router, rag_service, rag_query_flight, chat_summarizer
+from api.v1.endpoints.agent import router as agent_router, farm_agent
+from services.rate_limiter import rate_governor
+from services.user_service import user_service
+from services.chat_service import chat_service
+from services.mongo_client import mongo_client_factory
+from services.static_files import CachedStaticFiles
+from services.local_storage_service import local_storage
+from services.r2_storage_service import r2_storage
+from services.image_derivatives import shutdown_derivative_pool
+from services.warmup import WarmupStage
+from services.clip_weights import process_memory
+from services.upload_stream import UploadLimitMiddleware
 
 
 # CLIP imports - wrapped in try-except to allow server to start even if CLIP has issues
@@ -39,6 +51,16 @@ app = FastAPI(
 services_ready = False
 initialization_error = None
 
+# Background warm-up (clients, models, caches) gating /ready
+warmup = WarmupStage()
+
+# CLIP is heavy (torch + weights); only warm it when the CLIP service is in use
+CLIP_WARMUP = os.getenv("CLIP_WARMUP", "false").lower() in ("1", "true", "yes")
+
+# Cap multipart bodies at MAX_UPLOAD_MB before the form is parsed and spooled
+# (added first so CORS wraps it and its 413s carry CORS headers)
+app.add_middleware(UploadLimitMiddleware)
+
 # Enable CORS for React frontend - MUST be before routes
 app.add_middleware(
     CORSMiddleware,
@@ -46,13 +68,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Next-page cursor of the legacy GET /chats list
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Mount static files for serving images
+# Mount static files for serving images (ETags, immutable caching, ranges)
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if not os.path.exists(static_dir):
     os.makedirs(static_dir, exist_ok=True)
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+static_files = CachedStaticFiles(directory=static_dir)
+app.mount("/static", static_files, name="static")
 
 # Include Routers
 #app.include_router(rag_router)
@@ -65,20 +90,86 @@ app.include_router(agent_router, prefix="/api/v1")
 
 
 async def initialize_services_background():
-    """Initialize services in background after server starts"""
+    """Initialize and warm up services in background after server starts"""
     global services_ready, initialization_error
-#   try:
-#        print("🚀 Starting background initialization...")
-#       await rag_service.initialize()
-#       if clip_ingest_service is not None:
-#            await clip_ingest_service.initialize()
-#        else:
-#            print("⚠️ Skipping CLIP service initialization (import failed)")
-#       services_ready = True
-#        print("✅✅✅ ALL SERVICES READY ✅✅✅")
-#    except Exception as e:
-#        initialization_error = str(e)
-#        print(f"❌ Background initialization failed: {e}")
+    print("🚀 Starting background initialization...")
+    await warmup.run()
+    services_ready = warmup.ready
+    if warmup.failed:
+        initialization_error = f"Warm-up failed: {', '.join(warmup.failed)}"
+        print(f"❌ Background initialization failed: {initialization_error}")
+    else:
+        initialization_error = None
+        print("✅✅✅ ALL SERVICES READY ✅✅✅")
+
+
+async def bootstrap_mongo_indexes():
+    """
+    Open the shared MongoDB pool, then create the users/chats indexes if
+    missing. Returns the index report.
+    """
+    await mongo_client_factory.connect()
+    reports = {}
+    for name, service in (("users", user_service), ("chats", chat_service)):
+        try:
+            reports[name] = await service.ensure_indexes()
+            print(f"📇 {name} indexes: {reports[name]}")
+        except Exception as e:
+            # Missing indexes slow queries down but don't stop the service
+            reports[name] = f"error: {e}"
+            print(f"❌ Failed to ensure {name} indexes: {e}")
+    return reports
+
+
+async def warm_agent():
+    """Import langgraph / Gemini and compile the farm agent graph"""
+    await asyncio.to_thread(lambda: farm_agent().get_farm_agent())
+
+
+async def init_r2():
+    """Build the R2 client for direct uploads"""
+    await asyncio.to_thread(r2_storage.initialize)
+    return {"bucket": r2_storage.bucket_name} if r2_storage.initialized else "R2 credentials incomplete"
+
+
+async def warm_clip():
+    """Initialize the CLIP service, load the weights and run dummy forward passes"""
+    from services.clip_ingest_service import clip_ingest_service
+    if not clip_ingest_service.initialized:
+        await clip_ingest_service.initialize()
+    return await asyncio.to_thread(clip_ingest_service.warm_up)
+
+
+def clip_stats():
+    """CLIP load time / RSS before and after and embedding cache, if this worker has imported the CLIP service"""
+    clip_module = sys.modules.get("services.clip_ingest_service")
+    if clip_module is None:
+        return None
+    service = clip_module.clip_ingest_service
+    return {
+        "load": service.clip_load_stats,
+        "embedding_cache": service.embedding_cache.stats() if service.embedding_cache is not None else None
+    }
+
+
+def register_warmup_steps():
+    rag_configured = bool(os.getenv("GOOGLE_API_KEY") and os.getenv("PINECONE_API_KEY"))
+    warmup.register("mongo", bootstrap_mongo_indexes,
+                    enabled=bool(os.getenv("MONGODB_URI")), reason="MONGODB_URI not set")
+    warmup.register("rag", rag_service.initialize,
+                    enabled=rag_configured, reason="GOOGLE_API_KEY / PINECONE_API_KEY not set")
+    warmup.register("pinecone", rag_service.warm_up_pinecone, depends_on=["rag"],
+                    enabled=rag_configured, reason="PINECONE_API_KEY not set")
+    warmup.register("gemini", rag_service.warm_up_gemini, depends_on=["rag"],
+                    enabled=rag_configured, reason="GOOGLE_API_KEY not set")
+    warmup.register("agent", warm_agent,
+                    enabled=bool(os.getenv("GOOGLE_API_KEY")), reason="GOOGLE_API_KEY not set")
+    warmup.register("r2", init_r2, required=False,
+                    enabled=bool(os.getenv("R2_ACCOUNT_ID")), reason="R2_ACCOUNT_ID not set")
+    warmup.register("clip", warm_clip, enabled=CLIP_WARMUP, reason="CLIP_WARMUP not enabled")
+
+
+register_warmup_steps()
 
 
 @app.on_event("startup")
@@ -86,7 +177,20 @@ async def startup_event():
     """Start background initialization - doesn't block server startup"""
     print("🌐 Server starting - port will open immediately")
     print("📦 Services will initialize in background...")
-    asyncio.create_task(initialize_services_background())
+    # Keep a reference so the task isn't garbage-collected mid-run
+    app.state.warmup_task = asyncio.create_task(initialize_services_background())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Flush buffered chat writes, then close the shared MongoDB client and
+    Pinecone async client, and stop the image derivative worker processes
+    """
+    await chat_service.close()
+    mongo_client_factory.close()
+    await rag_service.close()
+    shutdown_derivative_pool()
 
 
 @app.get("/health")
@@ -103,12 +207,35 @@ async def health_check():
 
 @app.get("/ready")
 async def readiness_check():
-    """Readiness check - returns 503 if services are still initializing"""
+    """
+    Readiness check - per-component warm-up status and timings; 503 while
+    required components are still warming up or if one of them failed
+    """
+    report = warmup.report()
     if initialization_error:
-        raise HTTPException(status_code=503, detail=f"Initialization failed: {initialization_error}")
+        return JSONResponse(status_code=503, content={"status": "failed", "error": initialization_error, **report})
     if not services_ready:
-        raise HTTPException(status_code=503, detail="Services are still initializing...")
-    return {"status": "ready", "services_ready": True}
+        return JSONResponse(status_code=503, content={"status": "initializing", **report})
+    return {"status": "ready", "services_ready": True, **report}
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Runtime metrics - rate limiter queue depth / throttles, request coalescing
+    counters, Mongo pool waits, static file caching and this worker's memory
+    """
+    return {
+        "rate_limits": rate_governor.stats(),
+        "rag_query_coalescing": rag_query_flight.stats(),
+        "chat_write_behind": chat_service.write_behind_stats(),
+        "chat_summarizer": chat_summarizer.stats(),
+        "mongo_pool": mongo_client_factory.stats(),
+        "static_files": static_files.stats(),
+        "local_storage": local_storage.stats(),
+        "process_memory": process_memory(),
+        "clip": clip_stats()
+    }
 
 
 if __name__ == "__main__":
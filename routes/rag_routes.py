@@ -1,20 +1,43 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Response
 from pydantic import BaseModel, RootModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from datetime import datetime
 import tempfile
 import os
-from services.rag_service import RAGService
+from services.rag_service import RAGService, NAMESPACES
 from services.user_service import user_service
-from services.chat_service import chat_service
+from services.chat_service import chat_service, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from services.chat_summarizer import ChatSummarizer
+from services.single_flight import SingleFlight, coalesce_key
+from services.r2_storage_service import r2_storage
+from services.storage_io import run_storage
+from services.upload_stream import saved_upload, UploadTooLarge, MAX_UPLOAD_BYTES
 
 router = APIRouter(tags=["RAG"])
 
 # Initialize RAG service instance (initialization happens in main.py)
 rag_service = RAGService()
 
+# Identical in-flight questions (e.g. after a broadcast) share one RAG execution
+rag_query_flight = SingleFlight()
+
+# Long server-side chats are condensed into a stored summary in the background
+chat_summarizer = ChatSummarizer(rag_service)
+
 class ChatRequest(BaseModel):
     query: str
     chat_history: Optional[List[dict]] = []
+    # If provided (with email), history is loaded server-side from this chat
+    # instead of chat_history, and the new turn is appended to it
+    chatId: Optional[str] = None
+    email: Optional[str] = None
+
+class MultiChatRequest(BaseModel):
+    query: str
+    chat_history: Optional[List[dict]] = []
+    chatId: Optional[str] = None
+    email: Optional[str] = None
+    document_types: List[str] = ["citrus", "schemes"]
 
 class ChatResponse(BaseModel):
     response: str
@@ -43,6 +66,26 @@ class ChatListResponse(RootModel[List[ChatThread]]):
     pass
 
 
+class ChatSummary(BaseModel):
+    chatId: str
+    lastMessage: Optional[ChatMessage] = None
+    messageCount: int
+    updatedAt: Optional[datetime] = None
+
+
+class ChatSummaryPage(BaseModel):
+    chats: List[ChatSummary]
+    nextCursor: Optional[str] = None
+
+
+class ChatMessagesPage(BaseModel):
+    chatId: str
+    messages: List[ChatMessage]
+    offset: int
+    limit: int
+    total: int
+
+
 class ChatPostRequest(BaseModel):
     email: str
     messageSource: str
@@ -54,6 +97,58 @@ class ChatPostResponse(BaseModel):
     chatId: str
     status: str
 
+
+class UploadPresignRequest(BaseModel):
+    filename: str
+    content_type: str = "application/pdf"
+    size: Optional[int] = None
+
+
+class UploadPart(BaseModel):
+    part_number: int
+    etag: str
+
+
+class UploadCompleteRequest(BaseModel):
+    key: str
+    upload_id: str
+    parts: List[UploadPart]
+
+
+class UploadedPdfRequest(BaseModel):
+    key: str
+    filename: str
+    document_type: str = "citrus"
+
+
+async def resolve_chat_history(request) -> Tuple[List[dict], Optional[str]]:
+    """
+    (chat_history, summary) for the prompt. With a chatId: the chat's rolling
+    summary plus the turns after it; otherwise the client-sent chat_history.
+    Both are capped at CHAT_HISTORY_MAX_MESSAGES so a client can't inflate the prompt.
+    """
+    if not request.chatId:
+        return (request.chat_history or [])[-chat_service.history_max_messages:], None
+    if not request.email:
+        raise HTTPException(status_code=400, detail="email is required when chatId is provided")
+    try:
+        context = await chat_service.get_history_context(request.chatId, request.email)
+    except RuntimeError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    summary, chat_history = chat_summarizer.prompt_history(context)
+    return chat_history, summary
+
+
+async def record_turn(request, response: str) -> None:
+    """Append the question and answer to the server-side chat (if one was referenced)"""
+    if not request.chatId:
+        return
+    try:
+        await chat_service.append_turn(request.chatId, request.email, request.query, response)
+        chat_summarizer.maybe_summarize(request.chatId, request.email)
+    except Exception as e:
+        print(f"⚠️ Failed to save turn to chat {request.chatId}: {e}")
+
 @router.post("/upload-crop-data", response_model=dict)
 async def upload_pdf(file: UploadFile = File(...)):
     """Upload and process PDF file for CITRUS CROP"""
@@ -61,32 +156,34 @@ async def upload_pdf(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-        
-        # Process the PDF with document_type="citrus"
-        num_chunks = await rag_service.process_pdf(temp_file_path, file.filename, "citrus")
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
+        # Stream the upload to a temp file (removed on exit, even on errors)
+        async with saved_upload(file, suffix='.pdf') as upload:
+            # Process the PDF with document_type="citrus"
+            num_chunks = await rag_service.process_pdf(upload.path, file.filename, "citrus")
         
         return {
             "message": f"Citrus crop PDF processed successfully. Added {num_chunks} chunks to knowledge base.",
             "filename": file.filename,
-            "chunks": num_chunks
+            "chunks": num_chunks,
+            "sha256": upload.sha256,
+            "size": upload.size
         }
     
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
 @router.post("/ask-consultant", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Chat with the RAG system about CITRUS CROP"""
+    chat_history, summary = await resolve_chat_history(request)
     try:
-        response, sources = await rag_service.query(request.query, "citrus", request.chat_history)
+        key = coalesce_key("ask-consultant", "citrus", request.query, chat_history, summary)
+        response, sources = await rag_query_flight.do(
+            key, lambda: rag_service.query(request.query, "citrus", chat_history, summary)
+        )
+        await record_turn(request, response)
         return ChatResponse(response=response, sources=sources)
     
     except Exception as e:
@@ -99,32 +196,133 @@ async def upload_government_schemes(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
     
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-        
-        # Process the PDF with document_type="schemes"
-        num_chunks = await rag_service.process_pdf(temp_file_path, file.filename, "schemes")
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
+        # Stream the upload to a temp file (removed on exit, even on errors)
+        async with saved_upload(file, suffix='.pdf') as upload:
+            # Process the PDF with document_type="schemes"
+            num_chunks = await rag_service.process_pdf(upload.path, file.filename, "schemes")
         
         return {
             "message": f"Government schemes processed successfully. Added {num_chunks} chunks to knowledge base.",
             "filename": file.filename,
-            "chunks": num_chunks
+            "chunks": num_chunks,
+            "sha256": upload.sha256,
+            "size": upload.size
         }
     
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
+def require_r2():
+    """R2 storage for direct uploads (503 if it isn't configured; it's initialized once at startup)"""
+    if not r2_storage.initialized:
+        raise HTTPException(status_code=503, detail="Direct uploads are not configured")
+    return r2_storage
+
+@router.post("/uploads/presign", response_model=dict)
+async def presign_upload(request: UploadPresignRequest):
+    """
+    Presigned URL(s) for uploading a file straight to R2. Large files get a
+    multipart upload (PUT each part, then call /uploads/complete with the
+    part ETags); either way the client passes the returned key on.
+    """
+    storage = require_r2()
+    # A single presigned PUT doesn't bind the object size, so this is advisory;
+    # ingestion re-checks the stored size before downloading
+    if request.size is not None and request.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=str(UploadTooLarge(MAX_UPLOAD_BYTES)))
+    try:
+        return await run_storage(storage.presign_upload, request.filename, request.content_type, request.size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error presigning upload: {str(e)}")
+
+@router.post("/uploads/complete", response_model=dict)
+async def complete_upload(request: UploadCompleteRequest):
+    """Finish a presigned multipart upload"""
+    storage = require_r2()
+    if not storage.is_upload_key(request.key):
+        raise HTTPException(status_code=400, detail="Unknown upload key")
+    try:
+        await run_storage(
+            storage.complete_multipart_upload,
+            request.key,
+            request.upload_id,
+            [part.model_dump() for part in request.parts],
+        )
+        return {"key": request.key, "status": "completed"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error completing upload: {str(e)}")
+
+@router.post("/ingest-uploaded-pdf", response_model=dict)
+async def ingest_uploaded_pdf(request: UploadedPdfRequest):
+    """Process a PDF the client uploaded directly to R2 (by its key)"""
+    if request.document_type not in NAMESPACES:
+        raise HTTPException(status_code=400, detail=f"document_type must be one of {list(NAMESPACES)}")
+    if not request.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+    storage = require_r2()
+    if not storage.is_upload_key(request.key):
+        raise HTTPException(status_code=400, detail="Unknown upload key")
+    info = await run_storage(storage.object_info, request.key)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Uploaded object not found")
+    if info["size"] > MAX_UPLOAD_BYTES:
+        await run_storage(storage.delete_object, request.key)
+        raise HTTPException(status_code=413, detail=str(UploadTooLarge(MAX_UPLOAD_BYTES)))
+
+    fd, temp_file_path = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
+    try:
+        await run_storage(storage.download_to_file, request.key, temp_file_path)
+        num_chunks = await rag_service.process_pdf(temp_file_path, request.filename, request.document_type)
+        return {
+            "message": f"PDF processed successfully. Added {num_chunks} chunks to knowledge base.",
+            "filename": request.filename,
+            "key": request.key,
+            "chunks": num_chunks
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+    finally:
+        os.unlink(temp_file_path)
+
 @router.post("/query-government-schemes", response_model=ChatResponse)
 async def query_government_schemes(request: ChatRequest):
     """Query government schemes"""
+    chat_history, summary = await resolve_chat_history(request)
+    try:
+        key = coalesce_key("query-government-schemes", "schemes", request.query, chat_history, summary)
+        response, sources = await rag_query_flight.do(
+            key, lambda: rag_service.query(request.query, "schemes", chat_history, summary)
+        )
+        await record_turn(request, response)
+        return ChatResponse(response=response, sources=sources)
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
+
+@router.post("/query-knowledge-base", response_model=ChatResponse)
+async def query_knowledge_base(request: MultiChatRequest):
+    """
+    Query several knowledge bases in one request (e.g. citrus + schemes for
+    "subsidy for citrus drip irrigation"). Results are merged into one answer.
+    """
+    document_types = list(dict.fromkeys(request.document_types))
+    invalid = [doc_type for doc_type in document_types if doc_type not in NAMESPACES]
+    if not document_types or invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"document_types must be a non-empty subset of {list(NAMESPACES)}"
+        )
+    
+    chat_history, summary = await resolve_chat_history(request)
     try:
-        response, sources = await rag_service.query(request.query, "schemes", request.chat_history)
+        key = coalesce_key("query-knowledge-base", ",".join(sorted(document_types)), request.query, chat_history, summary)
+        response, sources = await rag_query_flight.do(
+            key, lambda: rag_service.query_multi(request.query, document_types, chat_history, summary)
+        )
+        await record_turn(request, response)
         return ChatResponse(response=response, sources=sources)
     
     except Exception as e:
@@ -162,19 +360,66 @@ async def ensure_user(request: UserEnsureRequest):
 
 
 @router.get("/chats", response_model=ChatListResponse)
-async def list_chats_get(email: str = Query(..., description="Email address of the user")):
+async def list_chats_get(
+    response: Response,
+    email: str = Query(..., description="Email address of the user"),
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Chats per page"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page")
+):
     """
-    Fetch list of chats for a given user email.
+    Fetch a user's chats with their messages, newest first, up to limit per
+    call. The body stays a plain list; the cursor for the next page (if any)
+    is in the X-Next-Cursor header. Prefer /chats/summary for listing.
     """
     try:
-        chats = await chat_service.get_chats_by_email(email)
-        return ChatListResponse(chats)
+        page = await chat_service.get_chats_by_email(email, limit, cursor)
+        if page["nextCursor"]:
+            response.headers["X-Next-Cursor"] = page["nextCursor"]
+        return ChatListResponse(page["chats"])
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching chats: {str(e)}")
 
 
+@router.get("/chats/summary", response_model=ChatSummaryPage)
+async def list_chat_summaries(
+    email: str = Query(..., description="Email address of the user"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Chats per page"),
+    cursor: Optional[str] = Query(None, description="nextCursor from the previous page")
+):
+    """
+    Fetch one page of a user's chats (newest first) as summaries:
+    last message, message count and last update time.
+    """
+    try:
+        page = await chat_service.list_chat_summaries(email, limit, cursor)
+        return ChatSummaryPage(**page)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching chats: {str(e)}")
+
+
+@router.get("/chats/{chat_id}/messages", response_model=ChatMessagesPage)
+async def get_chat_messages(
+    chat_id: str,
+    email: str = Query(..., description="Email address of the user"),
+    offset: int = Query(0, ge=0, description="Index of the first message to return"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Messages per page")
+):
+    """
+    Fetch one page of messages from a single chat (oldest first).
+    """
+    try:
+        page = await chat_service.get_chat_messages(chat_id, email, offset, limit)
+        return ChatMessagesPage(**page)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching messages: {str(e)}")
+
+
 @router.post("/chats", response_model=ChatPostResponse)
 async def post_chat(request: ChatPostRequest):
     """
@@ -0,0 +1,117 @@
+"""
+Benchmark append and read latency for embedded vs bucketed chat storage.
+
+For each layout, builds one chat of --messages messages through
+ChatService.append_message, sampling append latency as the chat grows,
+then measures reading the latest page, a page from the middle and the
+whole chat, and reports the largest document size.
+
+Usage:
+    python scripts/bench_chat_storage.py --messages 10000 --reads 200
+
+Requires a local mongod (default mongodb://localhost:27017). The benchmark
+database (agrigpt_bench) is dropped at the end unless --keep is given.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_DB = "agrigpt_bench"
+EMAIL = "storage@bench.local"
+PAGE = 20
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(label: str, samples) -> None:
+    print(
+        f"  {label:<24} p50={statistics.median(samples):8.2f}ms "
+        f"p99={percentile(samples, 99):8.2f}ms max={max(samples):8.2f}ms"
+    )
+
+
+async def timed(fn) -> float:
+    start = time.perf_counter()
+    await fn()
+    return (time.perf_counter() - start) * 1000
+
+
+async def bench_layout(chat_service, layout: str, messages: int, reads: int) -> None:
+    chat_service.storage_mode = layout
+    chat_id = await chat_service.create_chat(EMAIL)
+
+    # Append latency in the first and last 10% of the chat's growth
+    early, late = [], []
+    window = max(1, messages // 10)
+    for i in range(messages):
+        text = f"Message {i}: how much urea per acre for paddy at tillering stage?"
+        elapsed = await timed(lambda: chat_service.append_message(chat_id, "user", text, EMAIL))
+        if i < window:
+            early.append(elapsed)
+        elif i >= messages - window:
+            late.append(elapsed)
+    await chat_service.flush()
+
+    latest = [await timed(lambda: chat_service.get_chat_messages(chat_id, EMAIL, messages - PAGE, PAGE)) for _ in range(reads)]
+    middle = [await timed(lambda: chat_service.get_chat_messages(chat_id, EMAIL, messages // 2, PAGE)) for _ in range(reads)]
+    full = [await timed(lambda: chat_service.get_chats_by_email(EMAIL)) for _ in range(max(1, reads // 10))]
+
+    db = chat_service.collection.database
+    sizes = await db.command(
+        "aggregate", chat_service.collection_name,
+        pipeline=[{"$project": {"size": {"$bsonSize": "$$ROOT"}}}, {"$group": {"_id": None, "max": {"$max": "$size"}}}],
+        cursor={},
+    )
+    bucket_sizes = await db.command(
+        "aggregate", chat_service.buckets_collection_name,
+        pipeline=[{"$project": {"size": {"$bsonSize": "$$ROOT"}}}, {"$group": {"_id": None, "max": {"$max": "$size"}}}],
+        cursor={},
+    )
+    largest = max(
+        [batch["max"] for batch in sizes["cursor"]["firstBatch"]] +
+        [batch["max"] for batch in bucket_sizes["cursor"]["firstBatch"]] + [0]
+    )
+
+    print(f"\n{layout} ({messages} messages, largest document {largest / 1024:.1f} KB):")
+    report("append (first 10%)", early)
+    report("append (last 10%)", late)
+    report(f"read latest {PAGE}", latest)
+    report(f"read middle {PAGE}", middle)
+    report("read full chat", full)
+
+    await chat_service.collection.delete_many({"email": EMAIL})
+    await chat_service.buckets.delete_many({})
+
+
+async def run(args) -> None:
+    # Point the service at the benchmark database before importing it
+    os.environ["MONGODB_URI"] = args.uri
+    os.environ["MONGODB_DB_NAME"] = BENCH_DB
+    from services.chat_service import chat_service, STORAGE_EMBEDDED, STORAGE_BUCKETED
+
+    await chat_service.ensure_indexes()
+    for layout in (STORAGE_EMBEDDED, STORAGE_BUCKETED):
+        await bench_layout(chat_service, layout, args.messages, args.reads)
+
+    if not args.keep:
+        await chat_service.client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedded vs bucketed chat storage")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--messages", type=int, default=10_000, help="Messages per chat")
+    parser.add_argument("--reads", type=int, default=200, help="Reads per measurement")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database afterwards")
+    args = parser.parse_args()
+    asyncio.run(run(args))
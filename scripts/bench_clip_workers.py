@@ -0,0 +1,107 @@
+"""
+Per-worker memory of N processes that each load CLIP, the way N uvicorn
+workers would.
+
+Each worker is a fresh (spawned) process that loads CLIP, runs one text and
+one image forward pass, then reports its memory from /proc/self/smaps_rollup
+while all workers are still alive, so PSS splits the shared pages fairly.
+`from_pretrained` is the default load (private copy of the weights per
+worker); `mmap` loads from a safetensors file via CLIP_WEIGHTS_PATH so the
+weight pages are shared page cache. Compare total PSS between the two to
+size the worker count.
+
+Usage:
+    python scripts/bench_clip_workers.py --export data/clip-vit-base-patch32.safetensors
+    python scripts/bench_clip_workers.py --workers 4 --mode both \
+        --weights data/clip-vit-base-patch32.safetensors
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def worker(weights_path, barrier, results):
+    import io
+    from PIL import Image
+    from transformers import CLIPProcessor
+    import torch
+    from services.clip_weights import CLIP_MODEL_NAME, load_clip_model, process_memory
+
+    before = process_memory()
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+    model = load_clip_model(CLIP_MODEL_NAME, weights_path)
+    loaded = process_memory()
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (224, 224), (96, 140, 60)).save(buffer, format="PNG")
+    with torch.no_grad():
+        model.get_text_features(**processor(text=["warm-up"], return_tensors="pt", padding=True))
+        model.get_image_features(**processor(images=Image.open(buffer), return_tensors="pt"))
+
+    # Measure once every worker holds the model, so shared pages are split between them
+    barrier.wait()
+    results.put({"before": before, "loaded": loaded, "after_forward": process_memory()})
+    barrier.wait()
+
+
+def run_mode(mode: str, workers: int, weights_path):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(weights_path if mode == "mmap" else None, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    print(f"\n{mode} ({workers} workers)")
+    print(f"  {'pid':>8}  {'rss before':>10}  {'rss loaded':>10}  {'rss':>8}  {'pss':>8}  {'private':>8}  {'shared':>8}")
+    for report in sorted(reports, key=lambda r: r["after_forward"]["pid"]):
+        after = report["after_forward"]
+        private = after.get("private_clean_mb", 0) + after.get("private_dirty_mb", 0)
+        shared = after.get("shared_clean_mb", 0) + after.get("shared_dirty_mb", 0)
+        print(
+            f"  {after['pid']:>8}  {report['before'].get('rss_mb', 0):>10.1f}  {report['loaded'].get('rss_mb', 0):>10.1f}  "
+            f"{after.get('rss_mb', 0):>8.1f}  {after.get('pss_mb', 0):>8.1f}  {private:>8.1f}  {shared:>8.1f}"
+        )
+    total_pss = sum(r["after_forward"].get("pss_mb", 0) for r in reports)
+    print(f"  total PSS: {total_pss:.1f} MB ({total_pss / workers:.1f} MB per worker)")
+    return total_pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CLIP per-worker memory benchmark")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--mode", choices=["from_pretrained", "mmap", "both"], default="both")
+    parser.add_argument("--weights", default=os.getenv("CLIP_WEIGHTS_PATH"), help="safetensors file for mmap mode")
+    parser.add_argument("--export", default=None, help="Write the CLIP weights to this safetensors file and exit")
+    args = parser.parse_args()
+
+    if args.export:
+        from services.clip_weights import export_clip_weights
+        count = export_clip_weights(args.export)
+        print(f"✅ Wrote {count} tensors to {args.export} ({os.path.getsize(args.export) / (1024 * 1024):.1f} MB)")
+        print(f"   Set CLIP_WEIGHTS_PATH={args.export} to share the weights between workers")
+        return
+
+    modes = ["from_pretrained", "mmap"] if args.mode == "both" else [args.mode]
+    if "mmap" in modes and not args.weights:
+        parser.error("mmap mode needs --weights (or CLIP_WEIGHTS_PATH); create the file with --export")
+
+    totals = {mode: run_mode(mode, args.workers, args.weights) for mode in modes}
+    if len(totals) == 2:
+        saved = totals["from_pretrained"] - totals["mmap"]
+        print(f"\nmmap saves {saved:.1f} MB total PSS across {args.workers} workers")
+
+
+if __name__ == "__main__":
+    main()
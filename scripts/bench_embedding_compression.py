@@ -0,0 +1,104 @@
+"""
+Recall / size benchmark for compressed embedding encodings.
+
+Encodes a set of vectors as float32, float16, int8 and product-quantized
+(services.embedding_codec), runs brute-force top-k for a set of queries
+against each, and reports bytes per vector, compression versus float32 and
+recall@k against exact float32 search.
+
+By default the vectors are synthetic: normalized 512-d points around a few
+hundred random cluster centres, a rough stand-in for CLIP embeddings. Real
+vectors can be passed as a .npy (n, d) matrix, e.g. exported from Pinecone.
+
+Usage:
+    python scripts/bench_embedding_compression.py
+    python scripts/bench_embedding_compression.py --vectors 50000 --queries 500 --k 10
+    python scripts/bench_embedding_compression.py --npy data/clip_vectors.npy --pq-subspaces 128
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from services.embedding_codec import (  # noqa: E402
+    FLOAT32, FLOAT16, INT8, PQ, EmbeddingBatch, ProductQuantizer, encoding_sizes, recall_at_k
+)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def synthetic_vectors(count: int, dim: int, clusters: int, noise: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = normalize(rng.standard_normal((clusters, dim)).astype(np.float32))
+    members = centres[rng.integers(0, clusters, count)]
+    # noise is the norm of the per-vector offset from its (unit) cluster centre
+    return normalize(members + noise * rng.standard_normal((count, dim)).astype(np.float32) / np.sqrt(dim))
+
+
+def top_k_all(batch: EmbeddingBatch, queries: np.ndarray, k: int) -> np.ndarray:
+    return np.stack([batch.top_k(query, k)[0] for query in queries])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding compression recall / size benchmark")
+    parser.add_argument("--npy", default=None, help="(n, d) float matrix of real embeddings")
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=1.4, help="Spread of synthetic vectors around their cluster")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--pq-subspaces", type=int, default=64, help="PQ bytes per vector (0 skips PQ)")
+    parser.add_argument("--pq-train", type=int, default=5000, help="Vectors used to train the PQ codebooks")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.npy:
+        data = normalize(np.load(args.npy).astype(np.float32))
+    else:
+        data = synthetic_vectors(args.vectors + args.queries, args.dim, args.clusters, args.noise, args.seed)
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(len(data))
+    queries, vectors = data[order[:args.queries]], data[order[args.queries:]]
+    dim = vectors.shape[1]
+    print(f"{len(vectors)} vectors x {dim}d, {len(queries)} queries, recall@{args.k}")
+
+    exact_batch = EmbeddingBatch.from_vectors(vectors, FLOAT32)
+    exact = top_k_all(exact_batch, queries, args.k)
+
+    encodings = [FLOAT32, FLOAT16, INT8] + ([PQ] if args.pq_subspaces else [])
+    sizes = encoding_sizes(dim, args.pq_subspaces)
+    python_mb = sizes["python_list"] * len(vectors) / (1024 * 1024)
+    print(f"\nlist of Python float lists: ~{python_mb:.1f} MB ({sizes['python_list']} bytes/vector)")
+    print(f"\n  {'encoding':<9} {'bytes/vec':>9} {'total MB':>9} {'vs f32':>7} {'vs list':>8} {'recall':>7} {'encode s':>9} {'query ms':>9}")
+    for encoding in encodings:
+        started = time.perf_counter()
+        quantizer = None
+        if encoding == PQ:
+            train = vectors[rng.choice(len(vectors), min(args.pq_train, len(vectors)), replace=False)]
+            quantizer = ProductQuantizer(subspaces=args.pq_subspaces, seed=args.seed).train(train)
+        batch = EmbeddingBatch.from_vectors(vectors, encoding, quantizer)
+        encode_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        approx = top_k_all(batch, queries, args.k)
+        query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        total_bytes = batch.nbytes + (quantizer.nbytes if quantizer else 0)
+        print(
+            f"  {encoding:<9} {total_bytes / len(vectors):>9.1f} {total_bytes / (1024 * 1024):>9.2f} "
+            f"{exact_batch.nbytes / total_bytes:>6.1f}x {python_mb * 1024 * 1024 / total_bytes:>7.1f}x "
+            f"{recall_at_k(exact, approx):>7.3f} {encode_seconds:>9.2f} {query_ms:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark user lookup and chat listing latency with and without indexes.
+
+Seeds a throwaway database on a local mongod, then measures
+the user lookup by email (the query ensure_user runs) and ChatService.list_chat_summaries
+before and after ensure_indexes().
+
+Usage:
+    python scripts/bench_mongo_indexes.py --docs 1000000 --queries 200
+
+Requires a local mongod (default mongodb://localhost:27017). The benchmark
+database (agrigpt_bench) is dropped at the end unless --keep is given.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_DB = "agrigpt_bench"
+CHATS_PER_USER = 10
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def seed(uri: str, docs: int, batch_size: int = 10000) -> None:
+    """Insert `docs` users and `docs` chats (CHATS_PER_USER chats per email)"""
+    from pymongo import MongoClient
+
+    db = MongoClient(uri)[BENCH_DB]
+    db.users.drop()
+    db.chats.drop()
+
+    start = time.perf_counter()
+    for offset in range(0, docs, batch_size):
+        count = min(batch_size, docs - offset)
+        db.users.insert_many(
+            [{"email": f"user{offset + i}@bench.local", "userType": "user"} for i in range(count)],
+            ordered=False,
+        )
+        db.chats.insert_many(
+            [
+                {
+                    "email": f"user{(offset + i) // CHATS_PER_USER}@bench.local",
+                    "messages": [
+                        {"messageSource": "user", "message": "How do I treat citrus canker?"},
+                        {"messageSource": "assistant", "message": "Remove infected twigs and spray copper."},
+                    ],
+                }
+                for i in range(count)
+            ],
+            ordered=False,
+        )
+        print(f"\rSeeded {offset + count}/{docs}", end="", flush=True)
+    print(f"\nSeeding took {time.perf_counter() - start:.1f}s")
+
+
+async def measure(label: str, fn, queries: int) -> None:
+    samples = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(
+        f"  {label:<28} p50={statistics.median(samples):8.2f}ms "
+        f"p99={percentile(samples, 99):8.2f}ms max={max(samples):8.2f}ms"
+    )
+
+
+async def run(args) -> None:
+    # Point the services at the benchmark database before importing them
+    os.environ["MONGODB_URI"] = args.uri
+    os.environ["MONGODB_DB_NAME"] = BENCH_DB
+    from services.user_service import user_service
+    from services.chat_service import chat_service
+
+    users = args.docs
+    emails_with_chats = max(1, args.docs // CHATS_PER_USER)
+
+    async def lookup():
+        # The email lookup itself: ensure_user is an upsert (which would insert
+        # duplicates while the unique index is dropped) behind a TTL cache
+        await user_service.collection.find_one(
+            {"email": f"user{random.randrange(users)}@bench.local"}, {"_id": 0, "userType": 1}
+        )
+
+    async def listing():
+        await chat_service.list_chat_summaries(f"user{random.randrange(emails_with_chats)}@bench.local", limit=20)
+
+    await user_service.collection.drop_indexes()
+    await chat_service.collection.drop_indexes()
+    print("\nWithout indexes:")
+    await measure("users lookup (by email)", lookup, args.queries)
+    await measure("chats listing (summaries)", listing, args.queries)
+
+    start = time.perf_counter()
+    await user_service.ensure_indexes()
+    await chat_service.ensure_indexes()
+    print(f"\nIndex build took {time.perf_counter() - start:.1f}s")
+
+    print("With indexes:")
+    await measure("users lookup (by email)", lookup, args.queries)
+    await measure("chats listing (summaries)", listing, args.queries)
+
+    if not args.keep:
+        await user_service.client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark MongoDB lookups with/without indexes")
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--docs", type=int, default=1_000_000, help="Users and chats to seed (each)")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per measurement")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark database afterwards")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse an already seeded database")
+    args = parser.parse_args()
+
+    if not args.skip_seed:
+        seed(args.uri, args.docs)
+    asyncio.run(run(args))
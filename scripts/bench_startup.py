@@ -0,0 +1,102 @@
+"""
+Benchmark cold start: time from launching uvicorn until the port accepts
+connections and until /health answers.
+
+Each run starts a fresh `python -m uvicorn main:app` process on a free
+port (so imports are not cached in-process), polls the port, then
+requests /health and stops the server. Reports min / median / max over
+--runs and fails (exit 1) if the median time to open the port is above
+--target-s (default 1s).
+
+Usage:
+    python scripts/bench_startup.py --runs 5
+    python scripts/bench_startup.py --runs 3 --target-s 0.8
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def port_open(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+            return True
+    except OSError:
+        return False
+
+
+def run_once(timeout: float):
+    """(seconds until the port opened, seconds until /health returned 200)"""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        while not port_open(port):
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited: {server.stderr.read().decode()[-2000:]}")
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"port {port} not open after {timeout}s")
+            time.sleep(0.005)
+        port_seconds = time.perf_counter() - started
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=timeout) as response:
+            if response.status != 200:
+                raise RuntimeError(f"/health returned {response.status}")
+        health_seconds = time.perf_counter() - started
+        return port_seconds, health_seconds
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Give up on a run after this many seconds")
+    parser.add_argument("--target-s", type=float, default=1.0, help="Median time-to-port target")
+    args = parser.parse_args()
+
+    port_times, health_times = [], []
+    for run in range(1, args.runs + 1):
+        port_seconds, health_seconds = run_once(args.timeout)
+        port_times.append(port_seconds)
+        health_times.append(health_seconds)
+        print(f"run {run}: port open {port_seconds * 1000:7.1f}ms, /health {health_seconds * 1000:7.1f}ms")
+
+    for label, samples in (("port open", port_times), ("/health", health_times)):
+        print(
+            f"{label:<10} min={min(samples) * 1000:7.1f}ms "
+            f"median={statistics.median(samples) * 1000:7.1f}ms max={max(samples) * 1000:7.1f}ms"
+        )
+
+    median_port = statistics.median(port_times)
+    if median_port > args.target_s:
+        print(f"❌ Median time to open the port ({median_port:.2f}s) is above the {args.target_s}s target")
+        sys.exit(1)
+    print(f"✅ Port opens within the {args.target_s}s target")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Report which imports dominate start-up, from `python -X importtime`.
+
+Imports the given module (main by default) in a fresh interpreter and
+prints the slowest imports by cumulative time (the module plus everything
+it pulls in) and by self time, and the total. With --budget-ms the exit
+status is 1 when the total exceeds the budget, so it can guard CI.
+
+Usage:
+    python scripts/importtime_report.py
+    python scripts/importtime_report.py --module routes.rag_routes --top 30
+    python scripts/importtime_report.py --budget-ms 800
+    python scripts/importtime_report.py --filter langchain
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from typing import List, NamedTuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ImportTiming(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(stderr: str) -> List[ImportTiming]:
+    """Parse `import time: self | cumulative | module` lines"""
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            timings.append(ImportTiming(
+                module=name.strip(),
+                self_us=int(self_us),
+                cumulative_us=int(cumulative_us),
+                depth=(len(name) - len(name.lstrip())) // 2,
+            ))
+        except ValueError:
+            continue
+    return timings
+
+
+def run_importtime(module: str) -> List[ImportTiming]:
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:], file=sys.stderr)
+        raise SystemExit(f"import {module} failed")
+    return parse_importtime(result.stderr)
+
+
+def print_table(title: str, rows: List[ImportTiming], key: str) -> None:
+    print(f"\n{title}")
+    print(f"  {'ms':>9}  module")
+    for row in rows:
+        print(f"  {getattr(row, key) / 1000:9.1f}  {row.module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time report")
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--top", type=int, default=20, help="Rows per table")
+    parser.add_argument("--filter", default=None, help="Only show modules containing this string")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if the total import time exceeds this")
+    args = parser.parse_args()
+
+    timings = run_importtime(args.module)
+    root = next((t for t in timings if t.module == args.module and t.depth == 0), None)
+    total_ms = root.cumulative_us / 1000 if root else sum(t.self_us for t in timings) / 1000
+
+    rows = [t for t in timings if args.filter is None or args.filter in t.module]
+    # Cumulative view: skip the root itself, it is the total
+    by_cumulative = sorted((t for t in rows if t is not root), key=lambda t: t.cumulative_us, reverse=True)
+    print_table(f"Slowest imports by cumulative time ({args.module})", by_cumulative[:args.top], "cumulative_us")
+    print_table("Slowest imports by self time", sorted(rows, key=lambda t: t.self_us, reverse=True)[:args.top], "self_us")
+
+    heavy = ("torch", "transformers", "langchain", "langgraph", "google.genai", "pinecone", "pypdf", "fitz", "boto3")
+    loaded = sorted({t.module.split(".")[0] for t in timings if t.module.split(".")[0] in {h.split(".")[0] for h in heavy}})
+    print(f"\nHeavy packages imported: {', '.join(loaded) if loaded else 'none'}")
+    print(f"Total import time for {args.module}: {total_ms:.1f} ms ({len(timings)} modules)")
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"❌ Over budget ({args.budget_ms:.0f} ms)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
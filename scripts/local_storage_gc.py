@@ -0,0 +1,40 @@
+"""
+Garbage-collect locally stored images.
+
+Removes content-addressed images (static/images/ab/cd/<sha256>.<ext>) that
+no upload name references any more, plus temp files older than
+--temp-max-age. Legacy uuid-named images are never removed: Pinecone
+metadata may still point at them. Use --dry-run to see what would go.
+
+Usage:
+    python scripts/local_storage_gc.py --dry-run
+    python scripts/local_storage_gc.py --temp-max-age 600
+"""
+
+import os
+import sys
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from services.local_storage_service import local_storage  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local image storage garbage collection")
+    parser.add_argument("--dry-run", action="store_true", help="Report without deleting")
+    parser.add_argument("--temp-max-age", type=float, default=3600.0, help="Seconds before a temp file counts as stale")
+    args = parser.parse_args()
+
+    local_storage.initialize()
+    report = local_storage.collect_garbage(temp_max_age=args.temp_max_age, dry_run=args.dry_run)
+    print(
+        f"{'Would remove' if args.dry_run else 'Removed'} {report['removed']} unreferenced images and "
+        f"{report['temp_removed']} stale temp files; kept {report['referenced']} referenced and "
+        f"{report['legacy_skipped']} legacy images; {report['sidecars_removed']} empty reference sidecars"
+    )
+
+
+if __name__ == "__main__":
+    main()
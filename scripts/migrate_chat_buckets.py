@@ -0,0 +1,102 @@
+"""
+Migrate embedded chats (one document with a messages array) to the bucketed
+layout: a header document plus fixed-size message buckets.
+
+Usage:
+    python scripts/migrate_chat_buckets.py --dry-run          # report what would move
+    python scripts/migrate_chat_buckets.py                    # migrate every embedded chat
+    python scripts/migrate_chat_buckets.py --email a@b.com    # one user's chats only
+    python scripts/migrate_chat_buckets.py --min-messages 200 # only large chats
+
+Each chat is converted independently: its buckets are written first, then the
+header is swapped in only if the messages array is still the size that was
+copied. If a message was appended in between, the buckets are removed again
+and the chat is reported as skipped, so re-running the script picks it up.
+Running it in a quiet period (or with write-behind off) keeps skips rare.
+Both layouts are readable by ChatService, so the migration can be partial.
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.chat_service import chat_service, STORAGE_BUCKETED
+
+
+def build_buckets(chat_id, messages, bucket_size):
+    """Split a messages array into bucket documents (positions are kept on each message)"""
+    buckets = []
+    for seq, start in enumerate(range(0, len(messages), bucket_size)):
+        chunk = [{**message, "pos": start + i} for i, message in enumerate(messages[start:start + bucket_size])]
+        buckets.append({"chatId": chat_id, "seq": seq, "count": len(chunk), "messages": chunk})
+    return buckets
+
+
+async def migrate_chat(doc, bucket_size: int, dry_run: bool) -> str:
+    messages = doc.get("messages", [])
+    if dry_run:
+        return "would migrate"
+
+    # Leftovers from an interrupted run would collide with the unique (chatId, seq) index
+    await chat_service.buckets.delete_many({"chatId": doc["_id"]})
+    buckets = build_buckets(doc["_id"], messages, bucket_size)
+    if buckets:
+        await chat_service.buckets.insert_many(buckets, ordered=True)
+
+    result = await chat_service.collection.update_one(
+        {"_id": doc["_id"], "storage": {"$ne": STORAGE_BUCKETED}, "messages": {"$size": len(messages)}},
+        {
+            "$set": {
+                "storage": STORAGE_BUCKETED,
+                "bucketSize": bucket_size,
+                "messageCount": len(messages),
+                "lastMessage": messages[-1] if messages else None,
+            },
+            "$unset": {"messages": ""},
+        },
+    )
+    if result.modified_count == 0:
+        await chat_service.buckets.delete_many({"chatId": doc["_id"]})
+        return "skipped (changed during migration)"
+    return "migrated"
+
+
+async def main(args) -> int:
+    if not os.getenv("MONGODB_URI"):
+        print("❌ MONGODB_URI is not configured")
+        return 1
+
+    await chat_service.ensure_indexes()
+    bucket_size = args.bucket_size or chat_service.bucket_size
+
+    query = {"storage": {"$ne": STORAGE_BUCKETED}}
+    if args.email:
+        query["email"] = args.email
+    if args.min_messages:
+        query[f"messages.{args.min_messages - 1}"] = {"$exists": True}
+
+    counts = {}
+    async for doc in chat_service.collection.find(query):
+        status = await migrate_chat(doc, bucket_size, args.dry_run)
+        counts[status] = counts.get(status, 0) + 1
+        print(f"  {doc['_id']} ({len(doc.get('messages', []))} messages): {status}")
+
+    print(f"\nDone (bucket size {bucket_size}): " + (", ".join(f"{n} {s}" for s, n in counts.items()) or "nothing to migrate"))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate embedded chats to bucketed storage")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which chats would be migrated")
+    parser.add_argument("--email", help="Only migrate this user's chats")
+    parser.add_argument("--min-messages", type=int, default=0, help="Only migrate chats with at least this many messages")
+    parser.add_argument("--bucket-size", type=int, default=0, help="Messages per bucket (default: CHAT_BUCKET_SIZE)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,55 @@
+"""
+Check / create the MongoDB indexes used by UserService and ChatService.
+
+Usage:
+    python scripts/mongo_indexes.py            # report index status
+    python scripts/mongo_indexes.py --ensure   # create missing indexes, then report
+
+Exits with status 1 if any expected index is missing or doesn't match.
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.user_service import user_service
+from services.chat_service import chat_service
+
+
+async def main(ensure: bool) -> int:
+    if not os.getenv("MONGODB_URI"):
+        print("❌ MONGODB_URI is not configured")
+        return 1
+
+    services = (("users", user_service), ("chats", chat_service))
+    healthy = True
+
+    for name, service in services:
+        if ensure:
+            report = await service.ensure_indexes()
+            for index_name, result in report.items():
+                print(f"[ensure] {name}.{index_name}: {result}")
+
+        status = await service.check_indexes()
+        stats = await service.collection.database.command("collStats", service.collection.name)
+        print(f"\n{name} ({stats.get('count', 0)} documents, {stats.get('totalIndexSize', 0) / 1024 / 1024:.1f} MB of indexes)")
+        for index_name, state in status.items():
+            marker = "✅" if state == "present" else "❌"
+            print(f"  {marker} {index_name}: {state}")
+            healthy = healthy and state == "present"
+
+    return 0 if healthy else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check or create MongoDB indexes")
+    parser.add_argument("--ensure", action="store_true", help="Create missing indexes before reporting")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.ensure)))
@@ -1,47 +1,482 @@
 import os
-from typing import List, Dict, Any, Optional
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
 from bson import ObjectId
 
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from services.user_service import index_status
+from services.ttl_cache import TTLCache
+from services.mongo_client import get_mongo_client
+
+
+# Page size limits for chat listing / message paging
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Indexes bootstrapped at startup (see ensure_indexes)
+CHAT_INDEXES: List[Dict[str, Any]] = [
+    # list by user, newest first / cursor on _id
+    {"name": "email_id", "keys": [("email", 1), ("_id", -1)]},
+    # list by user ordered by last activity
+    {"name": "email_updatedAt", "keys": [("email", 1), ("updatedAt", -1)]},
+]
+BUCKET_INDEXES: List[Dict[str, Any]] = [
+    {"name": "chatId_seq_unique", "keys": [("chatId", 1), ("seq", 1)], "unique": True},
+]
+
+# Chat storage modes:
+# - embedded: one chat document holding the whole messages array (original layout)
+# - bucketed: a chat header document (messageCount, lastMessage, bucketSize) plus
+#   fixed-size message buckets in a separate collection, so no document grows
+#   without bound and appends only touch the header and the last bucket
+STORAGE_EMBEDDED = "embedded"
+STORAGE_BUCKETED = "bucketed"
+
+
+def _strip_position(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop the bucket position field from a stored message"""
+    return {k: v for k, v in message.items() if k != "pos"}
+
+
+def to_chat_history(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Convert stored messages to the role/content chat_history format used in prompts"""
+    return [
+        {
+            "role": "user" if message.get("messageSource") == "user" else "assistant",
+            "content": message.get("message", ""),
+        }
+        for message in messages
+    ]
 
 
 class ChatService:
     """
     Simple Mongo-backed chat storage.
-    Conversations are keyed by conversationId and store an email and messages array.
+    Conversations are keyed by conversationId and store an email and messages array,
+    either embedded in the chat document or split into message buckets.
     """
 
     def __init__(self):
         self.mongo_uri = os.getenv("MONGODB_URI")
         self.db_name = os.getenv("MONGODB_DB_NAME", "agriculture")
         self.collection_name = os.getenv("MONGODB_CHATS_COLLECTION", "chats")
+        self.buckets_collection_name = os.getenv("MONGODB_CHAT_BUCKETS_COLLECTION", "chat_message_buckets")
         self.client = None
         self.collection = None
+        self.buckets = None
+
+        # Storage layout for new chats; existing chats keep the layout they were
+        # created with until migrated (scripts/migrate_chat_buckets.py)
+        self.storage_mode = os.getenv("CHAT_STORAGE_MODE", STORAGE_EMBEDDED).lower()
+        self.bucket_size = int(os.getenv("CHAT_BUCKET_SIZE", "100"))
+        # Whether the server supports transactions (replica set / sharded),
+        # checked on the first bucketed append
+        self._transactions: Optional[bool] = None
+
+        # Optional write-behind buffering of append_message (off by default):
+        # appends are coalesced per chat and flushed with one bulk_write when
+        # CHAT_FLUSH_MAX_MESSAGES are pending or CHAT_FLUSH_INTERVAL_MS elapses
+        self.write_behind = os.getenv("CHAT_WRITE_BEHIND", "false").lower() == "true"
+        self.flush_max_messages = int(os.getenv("CHAT_FLUSH_MAX_MESSAGES", "50"))
+        self.flush_interval = int(os.getenv("CHAT_FLUSH_INTERVAL_MS", "200")) / 1000
+        self._pending: Dict[Tuple[ObjectId, str], List[Dict[str, str]]] = {}
+        self._pending_count = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        # (chatId, email) -> storage mode for chats already verified to exist,
+        # so buffered appends don't need a round trip per message
+        self._known_chats = TTLCache(max_size=10000, ttl=3600)
+        self.flushes = 0
+
+        # Hot cache of each chat's last CHAT_HISTORY_MAX_MESSAGES messages and
+        # rolling summary, used to build prompts from server-side history
+        # (see get_history_context).
+        # Appends made through this service keep cached entries current; a hit
+        # is still checked against the chat header (message count / summary),
+        # since other workers append to the same chats.
+        self.history_max_messages = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "20"))
+        self._history_cache = TTLCache(
+            max_size=int(os.getenv("CHAT_HISTORY_CACHE_SIZE", "5000")),
+            ttl=float(os.getenv("CHAT_HISTORY_CACHE_TTL_SECONDS", "1800")),
+        )
 
         if self.mongo_uri:
             self._initialize_client()
 
     def _initialize_client(self) -> None:
-        self.client = AsyncIOMotorClient(self.mongo_uri)
+        self.client = get_mongo_client()
         self.collection = self.client[self.db_name][self.collection_name]
+        self.buckets = self.client[self.db_name][self.buckets_collection_name]
+
+    def _index_specs(self) -> List[Tuple[str, Any, List[Dict[str, Any]]]]:
+        """(report prefix, collection, expected indexes) for the chats and buckets collections"""
+        return [
+            ("", self.collection, CHAT_INDEXES),
+            (f"{self.buckets_collection_name}.", self.buckets, BUCKET_INDEXES),
+        ]
+
+    async def ensure_indexes(self) -> Dict[str, str]:
+        """
+        Create the chats and message-bucket indexes if missing (idempotent).
+        Returns index name -> "ok" or the error message.
+        """
+        if not self.mongo_uri:
+            raise RuntimeError("MONGODB_URI is not configured")
+        if self.client is None or self.collection is None:
+            self._initialize_client()
+
+        report = {}
+        for prefix, collection, specs in self._index_specs():
+            for spec in specs:
+                name = prefix + spec["name"]
+                try:
+                    await collection.create_index(
+                        spec["keys"], name=spec["name"], unique=spec.get("unique", False)
+                    )
+                    report[name] = "ok"
+                except Exception as e:
+                    report[name] = f"error: {str(e)}"
+        return report
+
+    async def check_indexes(self) -> Dict[str, str]:
+        """Report which expected chats indexes exist: name -> "present" / "missing" / "mismatch" """
+        if not self.mongo_uri:
+            raise RuntimeError("MONGODB_URI is not configured")
+        if self.client is None or self.collection is None:
+            self._initialize_client()
+
+        report = {}
+        for prefix, collection, specs in self._index_specs():
+            existing = await collection.index_information()
+            for spec in specs:
+                report[prefix + spec["name"]] = index_status(spec, existing)
+        return report
+
+    async def get_chats_by_email(
+        self, email: str, limit: int = MAX_PAGE_SIZE, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Full chats (with messages) of a user, newest first, at most limit per
+        call. Pass the returned nextCursor back as cursor for the next page;
+        list_chat_summaries is the lighter way to list chats.
+        """
+        if not self.mongo_uri:
+            raise RuntimeError("MONGODB_URI is not configured")
+        if self.client is None or self.collection is None:
+            self._initialize_client()
+        await self._flush_pending_for(email)
+
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        match: Dict[str, Any] = {"email": email}
+        if cursor:
+            try:
+                match["_id"] = {"$lt": ObjectId(cursor)}
+            except Exception:
+                raise RuntimeError("Invalid cursor")
 
-    async def get_chats_by_email(self, email: str) -> List[Dict[str, Any]]:
+        # The "messages" of bucketed chats live in the buckets; no other fields are needed
+        docs = await self.collection.find(match, {"messages": 1, "storage": 1}).sort("_id", -1).to_list(limit + 1)
+        next_cursor = str(docs[limit - 1]["_id"]) if len(docs) > limit else None
+
+        chats = []
+        bucketed: Dict[ObjectId, Dict[str, Any]] = {}
+        for doc in docs[:limit]:
+            chat = {
+                "chatId": str(doc["_id"]),
+                "messages": doc.get("messages", []),
+            }
+            if doc.get("storage") == STORAGE_BUCKETED:
+                bucketed[doc["_id"]] = chat
+            chats.append(chat)
+
+        if bucketed:
+            # One query for the buckets of every bucketed chat
+            async for bucket in self.buckets.find({"chatId": {"$in": list(bucketed)}}).sort([("chatId", 1), ("seq", 1)]):
+                bucketed[bucket["chatId"]]["messages"].extend(bucket.get("messages", []))
+            for chat in bucketed.values():
+                chat["messages"] = [
+                    _strip_position(m) for m in sorted(chat["messages"], key=lambda m: m.get("pos", 0))
+                ]
+        return {"chats": chats, "nextCursor": next_cursor}
+
+    async def list_chat_summaries(
+        self, email: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        List a user's chats newest first, one page at a time.
+
+        Only a summary is returned per chat (last message, message count,
+        updatedAt), so the full messages arrays never leave the server.
+        Pass the returned nextCursor back as cursor to fetch the next page.
+        """
         if not self.mongo_uri:
             raise RuntimeError("MONGODB_URI is not configured")
         if self.client is None or self.collection is None:
             self._initialize_client()
 
-        cursor = self.collection.find({"email": email})
+        await self._flush_pending_for(email)
+
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        match: Dict[str, Any] = {"email": email}
+        if cursor:
+            try:
+                match["_id"] = {"$lt": ObjectId(cursor)}
+            except Exception:
+                raise RuntimeError("Invalid cursor")
+
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"_id": -1}},
+            {"$limit": limit + 1},
+            {
+                "$project": {
+                    "lastMessage": {
+                        "$cond": [
+                            {"$eq": ["$storage", STORAGE_BUCKETED]},
+                            "$lastMessage",
+                            {"$arrayElemAt": [{"$slice": [{"$ifNull": ["$messages", []]}, -1]}, 0]},
+                        ]
+                    },
+                    "messageCount": {
+                        "$cond": [
+                            {"$eq": ["$storage", STORAGE_BUCKETED]},
+                            "$messageCount",
+                            {"$size": {"$ifNull": ["$messages", []]}},
+                        ]
+                    },
+                    # Chats created before updatedAt was tracked fall back to their creation time
+                    "updatedAt": {"$ifNull": ["$updatedAt", {"$toDate": "$_id"}]},
+                }
+            },
+        ]
+
         chats = []
-        async for doc in cursor:
-            chat_id = str(doc.get("_id"))
+        async for doc in self.collection.aggregate(pipeline):
             chats.append(
                 {
-                    "chatId": chat_id,
-                    "messages": doc.get("messages", []),
+                    "chatId": str(doc["_id"]),
+                    "lastMessage": _strip_position(doc["lastMessage"]) if doc.get("lastMessage") else None,
+                    "messageCount": doc.get("messageCount", 0),
+                    "updatedAt": doc.get("updatedAt"),
+                }
+            )
+
+        next_cursor = None
+        if len(chats) > limit:
+            chats = chats[:limit]
+            next_cursor = chats[-1]["chatId"]
+        return {"chats": chats, "nextCursor": next_cursor}
+
+    async def get_chat_messages(
+        self, chat_id: str, email: str, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Fetch one page of a single chat's messages (oldest first).
+        Uses $slice so only the requested page is transferred.
+        """
+        if not self.mongo_uri:
+            raise RuntimeError("MONGODB_URI is not configured")
+        if self.client is None or self.collection is None:
+            self._initialize_client()
+
+        try:
+            oid = ObjectId(chat_id)
+        except Exception:
+            raise RuntimeError("Invalid chatId")
+
+        await self._flush_pending_for(email)
+
+        offset = max(0, offset)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        pipeline = [
+            {"$match": {"_id": oid, "email": email}},
+            {
+                "$project": {
+                    "storage": 1,
+                    "bucketSize": 1,
+                    "messages": {"$slice": [{"$ifNull": ["$messages", []]}, offset, limit]},
+                    "messageCount": {
+                        "$cond": [
+                            {"$eq": ["$storage", STORAGE_BUCKETED]},
+                            "$messageCount",
+                            {"$size": {"$ifNull": ["$messages", []]}},
+                        ]
+                    },
+                }
+            },
+        ]
+        docs = await self.collection.aggregate(pipeline).to_list(length=1)
+        doc = docs[0] if docs else None
+        if doc is None:
+            raise RuntimeError("Chat not found for this email or chatId")
+
+        messages = doc.get("messages", [])
+        if doc.get("storage") == STORAGE_BUCKETED:
+            messages = await self._read_bucketed(oid, doc.get("bucketSize", self.bucket_size), offset, limit)
+
+        return {
+            "chatId": chat_id,
+            "messages": messages,
+            "offset": offset,
+            "limit": limit,
+            "total": doc.get("messageCount", 0),
+        }
+
+    async def get_history_context(self, chat_id: str, email: str) -> Dict[str, Any]:
+        """
+        Prompt context for a chat: its last CHAT_HISTORY_MAX_MESSAGES messages,
+        the total message count and the rolling summary of older turns
+        ({"messages", "total", "summary", "summaryUpTo"}). Served from the
+        history cache when possible; otherwise only the tail of the chat is
+        read ($slice / last buckets).
+        """
+        if not self.mongo_uri:
+            raise RuntimeError("MONGODB_URI is not configured")
+        if self.client is None or self.collection is None:
+            self._initialize_client()
+
+        try:
+            oid = ObjectId(chat_id)
+        except Exception:
+            raise RuntimeError("Invalid chatId")
+
+        key = (oid, email)
+        await self._flush_pending_for(email)
+        cached = self._history_cache.get(key)
+        if cached is not None:
+            if await self._history_current(oid, email, cached):
+                return self._copy_context(cached)
+            self._history_cache.invalidate(key)
+
+        pipeline = [
+            {"$match": {"_id": oid, "email": email}},
+            {
+                "$project": {
+                    "storage": 1,
+                    "bucketSize": 1,
+                    "summary": 1,
+                    "summaryUpTo": 1,
+                    "messages": {"$slice": [{"$ifNull": ["$messages", []]}, -self.history_max_messages]},
+                    "messageCount": {
+                        "$cond": [
+                            {"$eq": ["$storage", STORAGE_BUCKETED]},
+                            "$messageCount",
+                            {"$size": {"$ifNull": ["$messages", []]}},
+                        ]
+                    },
+                }
+            },
+        ]
+        docs = await self.collection.aggregate(pipeline).to_list(length=1)
+        doc = docs[0] if docs else None
+        if doc is None:
+            raise RuntimeError("Chat not found for this email or chatId")
+
+        total = doc.get("messageCount", 0)
+        messages = doc.get("messages", [])
+        if doc.get("storage") == STORAGE_BUCKETED:
+            start = max(0, total - self.history_max_messages)
+            messages = (
+                await self._read_bucketed(oid, doc.get("bucketSize", self.bucket_size), start, total - start)
+                if total else []
+            )
+
+        context = {
+            "messages": messages,
+            "total": total,
+            "summary": doc.get("summary"),
+            "summaryUpTo": doc.get("summaryUpTo", 0),
+        }
+        self._history_cache.set(key, context)
+        return self._copy_context(context)
+
+    @staticmethod
+    def _copy_context(context: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of a cached history context, so callers can't mutate the cache"""
+        return {**context, "messages": list(context["messages"])}
+
+    async def _history_current(self, oid: ObjectId, email: str, cached: Dict[str, Any]) -> bool:
+        """
+        True if a cached history context still matches the chat header (message
+        count and summary position). Reads only the header fields, so it is
+        much cheaper than re-reading the tail of the chat.
+        """
+        pipeline = [
+            {"$match": {"_id": oid, "email": email}},
+            {
+                "$project": {
+                    "_id": 0,
+                    "summaryUpTo": 1,
+                    "messageCount": {
+                        "$cond": [
+                            {"$eq": ["$storage", STORAGE_BUCKETED]},
+                            "$messageCount",
+                            {"$size": {"$ifNull": ["$messages", []]}},
+                        ]
+                    },
                 }
+            },
+        ]
+        docs = await self.collection.aggregate(pipeline).to_list(length=1)
+        if not docs:
+            return False
+        header = docs[0]
+        return (
+            header.get("messageCount", 0) == cached["total"]
+            and header.get("summaryUpTo", 0) == cached["summaryUpTo"]
+        )
+
+    async def get_recent_messages(
+        self, chat_id: str, email: str, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Return the last `limit` messages of a chat (oldest first), capped at CHAT_HISTORY_MAX_MESSAGES"""
+        limit = max(1, min(limit or self.history_max_messages, self.history_max_messages))
+        context = await self.get_history_context(chat_id, email)
+        return context["messages"][-limit:]
+
+    async def set_summary(self, chat_id: str, email: str, summary: str, up_to: int) -> bool:
+        """
+        Store the rolling summary of a chat's first `up_to` messages.
+        Ignored (returns False) if a summary covering as much or more is already stored.
+        """
+        if not self.mongo_uri:
+            raise RuntimeError("MONGODB_URI is not configured")
+        if self.client is None or self.collection is None:
+            self._initialize_client()
+
+        oid = ObjectId(chat_id)
+        result = await self.collection.update_one(
+            {
+                "_id": oid,
+                "email": email,
+                "$or": [{"summaryUpTo": {"$lt": up_to}}, {"summaryUpTo": {"$exists": False}}],
+            },
+            {"$set": {"summary": summary, "summaryUpTo": up_to, "summaryUpdatedAt": datetime.now(timezone.utc)}},
+        )
+        if result.modified_count == 0:
+            return False
+
+        cached = self._history_cache.get((oid, email))
+        if cached is not None:
+            self._history_cache.set((oid, email), {**cached, "summary": summary, "summaryUpTo": up_to})
+        return True
+
+    def _remember_messages(self, oid: ObjectId, email: str, messages: List[Dict[str, str]]) -> None:
+        """Extend a cached history tail with newly appended messages (no-op if not cached)"""
+        key = (oid, email)
+        cached = self._history_cache.get(key)
+        if cached is not None:
+            self._history_cache.set(
+                key,
+                {
+                    **cached,
+                    "messages": (cached["messages"] + messages)[-self.history_max_messages:],
+                    "total": cached["total"] + len(messages),
+                },
             )
-        return chats
 
     async def create_chat(self, email: str, initial_message: Optional[Dict[str, str]] = None) -> str:
         if not self.mongo_uri:
@@ -49,11 +484,27 @@ class ChatService:
         if self.client is None or self.collection is None:
             self._initialize_client()
 
-        doc: Dict[str, Any] = {"email": email, "messages": []}
-        if initial_message:
-            doc["messages"].append(initial_message)
+        now = datetime.now(timezone.utc)
+        if self.storage_mode == STORAGE_BUCKETED:
+            header = {
+                "email": email,
+                "storage": STORAGE_BUCKETED,
+                "bucketSize": self.bucket_size,
+                "messageCount": 0,
+                "lastMessage": None,
+                "createdAt": now,
+                "updatedAt": now,
+            }
+            insert_result = await self.collection.insert_one(header)
+            if initial_message:
+                await self._append_bucketed(insert_result.inserted_id, email, [initial_message])
+        else:
+            doc: Dict[str, Any] = {"email": email, "messages": [], "createdAt": now, "updatedAt": now}
+            if initial_message:
+                doc["messages"].append(initial_message)
+            insert_result = await self.collection.insert_one(doc)
 
-        insert_result = await self.collection.insert_one(doc)
+        self._known_chats.set((insert_result.inserted_id, email), self.storage_mode)
         return str(insert_result.inserted_id)
 
     async def append_message(
@@ -62,6 +513,17 @@ class ChatService:
         """
         Append a message to an existing chat by chat_id.
         """
+        return await self._append(chat_id, email, [{"messageSource": message_source, "message": message}])
+
+    async def append_turn(self, chat_id: str, email: str, query: str, answer: str) -> str:
+        """Append a user question and the assistant's answer to a chat in one write"""
+        return await self._append(
+            chat_id,
+            email,
+            [{"messageSource": "user", "message": query}, {"messageSource": "assistant", "message": answer}],
+        )
+
+    async def _append(self, chat_id: str, email: str, messages: List[Dict[str, str]]) -> str:
         if not self.mongo_uri:
             raise RuntimeError("MONGODB_URI is not configured")
         if self.client is None or self.collection is None:
@@ -72,14 +534,250 @@ class ChatService:
         except Exception:
             raise RuntimeError("Invalid chatId")
 
-        result = await self.collection.update_one(
-            {"_id": oid, "email": email},
-            {"$push": {"messages": {"messageSource": message_source, "message": message}}},
-        )
-        if result.matched_count == 0:
+        if self.write_behind:
+            for message in messages:
+                await self._buffer_message(oid, email, message)
+        elif not await self._append_messages(oid, email, messages):
             raise RuntimeError("Chat not found for this email or chatId")
+
+        self._remember_messages(oid, email, messages)
         return chat_id
 
+    async def _append_messages(
+        self, oid: ObjectId, email: str, messages: List[Dict[str, str]], storage: Optional[str] = None
+    ) -> bool:
+        """
+        Append messages to a chat in whichever layout it uses, trying the
+        expected layout first. Returns False if the chat doesn't exist.
+        """
+        expected = storage or self.storage_mode
+        layouts = [STORAGE_BUCKETED, STORAGE_EMBEDDED] if expected == STORAGE_BUCKETED else [STORAGE_EMBEDDED, STORAGE_BUCKETED]
 
-chat_service = ChatService()
+        for layout in layouts:
+            if layout == STORAGE_BUCKETED:
+                if await self._append_bucketed(oid, email, messages):
+                    return True
+            else:
+                result = await self.collection.update_one(
+                    {"_id": oid, "email": email, "storage": {"$ne": STORAGE_BUCKETED}},
+                    {
+                        "$push": {"messages": {"$each": messages}},
+                        "$set": {"updatedAt": datetime.now(timezone.utc)},
+                    },
+                )
+                if result.matched_count:
+                    return True
+        return False
+
+    async def _transactions_supported(self) -> bool:
+        """True when the server is a replica set member or mongos (standalone servers have no transactions)"""
+        if self._transactions is None:
+            try:
+                hello = await self.client.admin.command("hello")
+                self._transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+            except Exception:
+                self._transactions = False
+        return self._transactions
+
+    async def _append_bucketed(self, oid: ObjectId, email: str, messages: List[Dict[str, str]]) -> bool:
+        """
+        Append to a bucketed chat: reserve positions on the header ($inc
+        messageCount), then push each message into bucket pos // bucketSize.
+        Both run in one transaction where the server supports it, so a failed
+        bucket write can't leave the header counting messages that were never
+        stored. Returns False if there is no bucketed chat with this id/email.
+        """
+        if not await self._transactions_supported():
+            # Standalone server: a bucket write failing after the $inc leaves a gap
+            return await self._append_bucketed_writes(oid, email, messages, None)
+        async with await self.client.start_session() as session:
+            # Retried as a whole on transient errors (e.g. a write conflict
+            # with a concurrent append to the same chat)
+            return await session.with_transaction(
+                lambda s: self._append_bucketed_writes(oid, email, messages, s)
+            )
+
+    async def _append_bucketed_writes(
+        self, oid: ObjectId, email: str, messages: List[Dict[str, str]], session: Any
+    ) -> bool:
+        header = await self.collection.find_one_and_update(
+            {"_id": oid, "email": email, "storage": STORAGE_BUCKETED},
+            {
+                "$inc": {"messageCount": len(messages)},
+                "$set": {"updatedAt": datetime.now(timezone.utc), "lastMessage": messages[-1]},
+            },
+            projection={"messageCount": 1, "bucketSize": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if header is None:
+            return False
+
+        bucket_size = header.get("bucketSize", self.bucket_size)
+        start = header["messageCount"] - len(messages)
+        by_bucket: Dict[int, List[Dict[str, Any]]] = {}
+        for i, message in enumerate(messages):
+            position = start + i
+            by_bucket.setdefault(position // bucket_size, []).append({**message, "pos": position})
+
+        for seq, items in by_bucket.items():
+            for attempt in range(2):
+                try:
+                    # $sort keeps the bucket ordered if concurrent appends land out of order
+                    await self.buckets.update_one(
+                        {"chatId": oid, "seq": seq},
+                        {
+                            "$push": {"messages": {"$each": items, "$sort": {"pos": 1}}},
+                            "$inc": {"count": len(items)},
+                        },
+                        upsert=True,
+                        session=session,
+                    )
+                    break
+                except DuplicateKeyError:
+                    # Another append created this bucket at the same moment; retry as an
+                    # update (inside a transaction the error aborts it, so let it retry whole)
+                    if attempt == 1 or session is not None:
+                        raise
+        return True
+
+    async def _read_bucketed(self, oid: ObjectId, bucket_size: int, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """Read messages [offset, offset + limit) of a bucketed chat, touching only the buckets that hold them"""
+        first, last = offset // bucket_size, (offset + limit - 1) // bucket_size
+        cursor = self.buckets.find(
+            {"chatId": oid, "seq": {"$gte": first, "$lte": last}}, {"messages": 1}
+        ).sort("seq", 1)
+
+        messages = []
+        async for bucket in cursor:
+            messages.extend(
+                m for m in bucket.get("messages", []) if offset <= m.get("pos", -1) < offset + limit
+            )
+        return [_strip_position(m) for m in messages]
+
+    async def _buffer_message(self, oid: ObjectId, email: str, message: Dict[str, str]) -> None:
+        """Queue a message for the next write-behind flush"""
+        key = (oid, email)
+        if self._known_chats.get(key) is None:
+            exists = await self.collection.find_one({"_id": oid, "email": email}, {"storage": 1})
+            if exists is None:
+                raise RuntimeError("Chat not found for this email or chatId")
+            self._known_chats.set(key, exists.get("storage", STORAGE_EMBEDDED))
+
+        self._pending.setdefault(key, []).append(message)
+        self._pending_count += 1
+
+        if self._pending_count >= self.flush_max_messages:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"❌ Chat write-behind flush failed (will retry): {e}")
+            if self._pending:
+                self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _flush_pending_for(self, email: str) -> None:
+        """Read-your-writes: flush buffered messages before reading this user's chats"""
+        if any(pending_email == email for _, pending_email in self._pending):
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Write all buffered messages: one bulk_write ($push $each per chat) for
+        embedded chats, one header + bucket update per bucketed chat.
+        Returns the number of messages written. On failure the messages that
+        weren't written are put back in the buffer (ahead of anything appended
+        meanwhile) and the error is raised. With an unordered bulk_write only
+        the operations listed in the BulkWriteError are put back; the rest
+        were applied and must not be appended twice.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+
+            batch, self._pending = self._pending, {}
+            count, self._pending_count = self._pending_count, 0
+            now = datetime.now(timezone.utc)
+
+            # Embedded chats go out in one bulk_write; bucketed chats need a
+            # header update first, so they are appended one chat at a time
+            embedded_keys = [
+                key for key in batch if self._known_chats.get(key) != STORAGE_BUCKETED
+            ]
+            bucketed_keys = [key for key in batch if key not in embedded_keys]
+            operations = [
+                UpdateOne(
+                    {"_id": oid, "email": email, "storage": {"$ne": STORAGE_BUCKETED}},
+                    {"$push": {"messages": {"$each": batch[(oid, email)]}}, "$set": {"updatedAt": now}},
+                )
+                for oid, email in embedded_keys
+            ]
+
+            bulk_error = None
+            try:
+                if operations:
+                    try:
+                        result = await self.collection.bulk_write(operations, ordered=False)
+                        matched = result.matched_count
+                    except BulkWriteError as e:
+                        bulk_error = e
+                        # Operations without a write error were applied; only the failed
+                        # chats stay in batch to be put back. (Write concern errors don't
+                        # undo applied updates, so they don't re-queue anything.)
+                        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                        embedded_keys = [key for index, key in enumerate(embedded_keys) if index not in failed]
+                        matched = e.details.get("nMatched", 0)
+                        print(f"⚠️ {len(failed)} buffered chat appends failed and will be retried")
+                    if matched < len(embedded_keys):
+                        # Some chats were migrated to buckets since we cached their layout
+                        migrated = self.collection.find(
+                            {"_id": {"$in": [oid for oid, _ in embedded_keys]}, "storage": STORAGE_BUCKETED},
+                            {"_id": 1},
+                        )
+                        migrated_ids = {doc["_id"] async for doc in migrated}
+                        for key in embedded_keys:
+                            if key[0] in migrated_ids:
+                                self._known_chats.set(key, STORAGE_BUCKETED)
+                                bucketed_keys.append(key)
+                        embedded_keys = [key for key in embedded_keys if key[0] not in migrated_ids]
+                    for key in embedded_keys:
+                        del batch[key]
+                for key in bucketed_keys:
+                    await self._append_messages(key[0], key[1], batch[key], STORAGE_BUCKETED)
+                    del batch[key]
+                if bulk_error is not None:
+                    raise bulk_error
+            except BaseException:
+                # Put back whatever wasn't written, ahead of anything appended meanwhile
+                for key, messages in self._pending.items():
+                    batch.setdefault(key, []).extend(messages)
+                self._pending = batch
+                self._pending_count = sum(len(messages) for messages in batch.values())
+                raise
+
+            self.flushes += 1
+            return count
 
+    async def close(self) -> None:
+        """Flush buffered messages (call on shutdown)"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        if self._pending:
+            written = await self.flush()
+            print(f"Flushed {written} buffered chat messages")
+
+    def write_behind_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.write_behind,
+            "pending_messages": self._pending_count,
+            "pending_chats": len(self._pending),
+            "flushes": self.flushes,
+        }
+
+
+chat_service = ChatService()
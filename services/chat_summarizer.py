@@ -0,0 +1,97 @@
+import os
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.chat_service import chat_service, to_chat_history, MAX_PAGE_SIZE
+from services.rate_limiter import rate_governor, PRIORITY_BATCH
+
+# Summarize once the unsummarized history exceeds this many (estimated) tokens,
+# keeping the newest CHAT_SUMMARY_KEEP_MESSAGES messages verbatim
+SUMMARY_TRIGGER_TOKENS = int(os.getenv("CHAT_SUMMARY_TRIGGER_TOKENS", "1500"))
+SUMMARY_KEEP_MESSAGES = int(os.getenv("CHAT_SUMMARY_KEEP_MESSAGES", "6"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token); good enough for a threshold"""
+    return len(text) // 4 + 1
+
+
+def unsummarized_messages(context: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Messages from a history context that the stored summary doesn't cover yet"""
+    first_position = context["total"] - len(context["messages"])
+    skip = max(0, context.get("summaryUpTo", 0) - first_position)
+    return context["messages"][skip:]
+
+
+class ChatSummarizer:
+    """
+    Rolling summarization of long chats. Requests read the stored summary plus
+    the turns after it; once those turns grow past SUMMARY_TRIGGER_TOKENS, a
+    background task folds all but the newest SUMMARY_KEEP_MESSAGES into the
+    summary, so prompt size stays flat however long the chat gets.
+    """
+
+    def __init__(self, rag_service):
+        self.rag_service = rag_service
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.runs = 0
+        self.failures = 0
+
+    def prompt_history(self, context: Dict[str, Any]) -> Tuple[Optional[str], List[dict]]:
+        """(summary, chat_history) to put in the prompt for a history context"""
+        return context.get("summary"), to_chat_history(unsummarized_messages(context))
+
+    def maybe_summarize(self, chat_id: str, email: str) -> bool:
+        """
+        Schedule a background check-and-summarize of a chat; returns at once,
+        so the history read and the summarization stay off the request path
+        """
+        key = (chat_id, email)
+        if key in self._inflight:
+            return False
+
+        task = asyncio.create_task(self._summarize(chat_id, email))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return True
+
+    async def _summarize(self, chat_id: str, email: str) -> None:
+        """
+        Fold everything between the stored summary and the newest
+        SUMMARY_KEEP_MESSAGES into the summary, one page (MAX_PAGE_SIZE) at a
+        time. The stored summaryUpTo advances after each page, only as far as
+        the messages actually summarized.
+        """
+        try:
+            context = await chat_service.get_history_context(chat_id, email)
+            pending = unsummarized_messages(context)
+            tokens = sum(estimate_tokens(message.get("message", "")) for message in pending)
+            if tokens <= SUMMARY_TRIGGER_TOKENS or len(pending) <= SUMMARY_KEEP_MESSAGES:
+                return
+
+            summary = context.get("summary")
+            start = context.get("summaryUpTo", 0)
+            up_to = context["total"] - SUMMARY_KEEP_MESSAGES
+            while start < up_to:
+                page = await chat_service.get_chat_messages(chat_id, email, start, min(MAX_PAGE_SIZE, up_to - start))
+                messages = page["messages"]
+                if not messages:
+                    break
+                # Background work: yields to interactive requests in the Gemini rate limiter
+                with rate_governor.priority_scope(PRIORITY_BATCH):
+                    summary = await asyncio.to_thread(
+                        self.rag_service.summarize_conversation,
+                        summary,
+                        to_chat_history(messages),
+                    )
+                start += len(messages)
+                if not await chat_service.set_summary(chat_id, email, summary, start):
+                    # Another worker summarized further meanwhile
+                    return
+            self.runs += 1
+        except Exception as e:
+            self.failures += 1
+            print(f"⚠️ Chat summarization failed for {chat_id}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._inflight), "runs": self.runs, "failures": self.failures}
@@ -1,36 +1,62 @@
 import os
 import io
+import time
 import asyncio
-from typing import List, Tuple, Dict, Any, Optional
+import hashlib
+import threading
+from typing import List, Tuple, Dict, Any, Optional, Callable, Hashable
 import requests
+import numpy as np
 from dotenv import load_dotenv
 
-# PDF and Image processing
-import fitz  # pymupdf
+# Image processing (pymupdf is imported where PDFs are opened)
 from PIL import Image
 
-# LangChain imports
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-# from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-# from langchain_pinecone import PineconeVectorStore
-from langchain_core.documents import Document
-from langchain_google_genai import ChatGoogleGenerativeAI
+# LangChain / Gemini / Pinecone - LAZY LOADED in initialize() to speed up server startup
+# (they take seconds to import)
 
 # CLIP Embeddings - LAZY LOADED in _ensure_clip_loaded() to speed up server startup
 # from transformers import CLIPProcessor, CLIPModel  # DO NOT IMPORT HERE
 # import torch  # DO NOT IMPORT HERE
 
-# Pinecone
-from pinecone import Pinecone, ServerlessSpec
+# LangSmith (imported on the first traced call)
+from services.tracing import traceable
 
-# LangSmith
-from langsmith import traceable
-
-# Local Storage (replaces R2)
+# Image storage: local disk by default, R2 with IMAGE_STORAGE_BACKEND=r2
 from services.local_storage_service import local_storage
+from services.storage_io import run_storage
+from services.r2_storage_service import r2_storage
+from services.image_derivatives import browser_safe_image, generate_derivatives, image_url_for
+from services.clip_weights import CLIP_MODEL_NAME, CLIP_WEIGHTS_PATH, load_clip_model, process_memory
+from services.embedding_codec import EmbeddingCache, to_list
+
+# Client-side rate limiting for Gemini / Pinecone
+from services.rate_limiter import rate_governor, PRIORITY_INGESTION
 
 load_dotenv()
 
+LLM_MODEL = "gemini-2.5-flash"
+
+# CLIP embedding size (text and image share the space)
+CLIP_DIMENSION = 512
+
+# Image vectors are upserted to Pinecone in batches of this size
+IMAGE_UPSERT_BATCH = int(os.getenv("CLIP_IMAGE_UPSERT_BATCH", "50"))
+
+# Text chunks / images per CLIP forward pass during ingestion
+CLIP_EMBED_BATCH = int(os.getenv("CLIP_EMBED_BATCH", "16"))
+
+# Load the CLIP weights (torch + transformers) inside initialize(); off by
+# default so initialization stays fast and CLIP loads on first use instead
+CLIP_PRELOAD = os.getenv("CLIP_PRELOAD", "false").lower() in ("1", "true", "yes")
+
+# CLIP embeddings of repeated query texts / identical images (keyed by content
+# hash) are cached in a compact encoding: float16 (half of float32, ~1/16 of a
+# Python float list) or int8 (~1/4 of float32); 0 entries disables the cache
+CLIP_EMBED_CACHE_SIZE = int(os.getenv("CLIP_EMBED_CACHE_SIZE", "10000"))
+CLIP_EMBED_CACHE_TTL = float(os.getenv("CLIP_EMBED_CACHE_TTL", "3600"))
+CLIP_EMBED_CACHE_ENCODING = os.getenv("CLIP_EMBED_CACHE_ENCODING", "float16")
+
 
 class ClipIngestService:
     """
@@ -49,103 +75,182 @@ class ClipIngestService:
         
         self.clip_model = None
         self.clip_processor = None
+        self.clip_load_stats: Optional[Dict[str, Any]] = None
+        self._clip_lock = threading.Lock()
+        self.embedding_cache = EmbeddingCache(
+            max_size=CLIP_EMBED_CACHE_SIZE,
+            ttl=CLIP_EMBED_CACHE_TTL,
+            encoding=CLIP_EMBED_CACHE_ENCODING
+        ) if CLIP_EMBED_CACHE_SIZE > 0 else None
         self.pinecone_client = None
         self.clip_index = None
+        self.clip_index_name = None
         self.llm = None
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
+        self.image_storage = local_storage
+        self._text_splitter = None
         self.initialized = False
+    
+    @property
+    def text_splitter(self):
+        if self._text_splitter is None:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=200,
+                length_function=len,
+            )
+        return self._text_splitter
         
     async def initialize(self):
-        """Initialize all components (CLIP loads lazily on first use)"""
+        """
+        Initialize all components (CLIP loads lazily on first use). Imports
+        and blocking client calls run in a worker thread.
+        """
         print("Initializing CLIP Ingest Service (CLIP-only mode with HuggingFace)...")
-        
         try:
-            # Initialize local storage for images
-            local_storage.initialize()
-            
-            # COMMENTED OUT: Google text embeddings
-            # self.text_embeddings = GoogleGenerativeAIEmbeddings(
-            #     model="models/text-embedding-004",
-            #     google_api_key=os.getenv("GOOGLE_API_KEY")
-            # )
-            # print("Text embeddings initialized (Google text-embedding-004)")
-            
-            # CLIP model will be lazy-loaded on first use to speed up server startup
-            self.clip_model = None  # Lazy loaded
-            self.clip_processor = None  # Lazy loaded
-            print("CLIP model will be loaded on first use (lazy loading with HuggingFace)")
-            
-            # Initialize LLM for generating answers
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-2.5-flash",
-                google_api_key=os.getenv("GOOGLE_API_KEY"),
-                temperature=0.3
-            )
-            print("LLM initialized (gemini-2.5-flash)")
-            
-            # Initialize Pinecone
-            self.pinecone_client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-            
-            # COMMENTED OUT: Google text index setup
-            # text_index_name = os.getenv("PINECONE_INDEX", "agrigpt-backend-rag-index")
-            # self._ensure_index_exists(text_index_name, 768)
-            # self.text_vectorstore = PineconeVectorStore(
-            #     index_name=text_index_name,
-            #     embedding=self.text_embeddings,
-            #     namespace="citrus_crop",
-            #     pinecone_api_key=os.getenv("PINECONE_API_KEY")
-            # )
-            # print(f"Text vector store initialized: {text_index_name} (namespace: citrus_crop)")
-            
-            # Setup CLIP index (512 dimensions for CLIP embeddings - BOTH text and images)
-            clip_index_name = os.getenv("PINECONE_CLIP_INDEX", "agrigpt-backend-rag-clip-index")
-            self._ensure_index_exists(clip_index_name, 512)
-            self.clip_index = self.pinecone_client.Index(clip_index_name)
-            print(f"CLIP index initialized: {clip_index_name} (stores both text and images)")
-            
+            await asyncio.to_thread(self._initialize_clients)
             self.initialized = True
             print("CLIP Ingest Service initialized successfully (CLIP-only mode)!")
 
-                # ADD THIS: Pre-load CLIP model during initialization
-            print("Pre-loading CLIP model (this may take 2-3 minutes)...")
-            self._ensure_clip_loaded()
-            print("✅ CLIP model loaded and ready")
-    
-            self.initialized = True
+            if CLIP_PRELOAD:
+                print("Pre-loading CLIP model (this may take 2-3 minutes)...")
+                await asyncio.to_thread(self._ensure_clip_loaded)
+                print("✅ CLIP model loaded and ready")
             
         except Exception as e:
             print(f"Error initializing CLIP Ingest Service: {str(e)}")
             raise e
     
+    def _initialize_clients(self):
+        """Image storage, LLM and Pinecone CLIP index (blocking)"""
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        from pinecone import Pinecone
+        
+        # Initialize image storage (local disk unless R2 is selected)
+        if os.getenv("IMAGE_STORAGE_BACKEND", "local").lower() == "r2":
+            self.image_storage = r2_storage
+        self.image_storage.initialize()
+        
+        # COMMENTED OUT: Google text embeddings
+        # self.text_embeddings = GoogleGenerativeAIEmbeddings(
+        #     model="models/text-embedding-004",
+        #     google_api_key=os.getenv("GOOGLE_API_KEY")
+        # )
+        # print("Text embeddings initialized (Google text-embedding-004)")
+        
+        # CLIP model will be lazy-loaded on first use to speed up server startup
+        self.clip_model = None  # Lazy loaded
+        self.clip_processor = None  # Lazy loaded
+        print("CLIP model will be loaded on first use (lazy loading with HuggingFace)")
+        
+        # Initialize LLM for generating answers
+        self.llm = ChatGoogleGenerativeAI(
+            model=LLM_MODEL,
+            google_api_key=os.getenv("GOOGLE_API_KEY"),
+            temperature=0.3
+        )
+        print("LLM initialized (gemini-2.5-flash)")
+        
+        # Initialize Pinecone
+        self.pinecone_client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        
+        # COMMENTED OUT: Google text index setup
+        # text_index_name = os.getenv("PINECONE_INDEX", "agrigpt-backend-rag-index")
+        # self._ensure_index_exists(text_index_name, 768)
+        # self.text_vectorstore = PineconeVectorStore(
+        #     index_name=text_index_name,
+        #     embedding=self.text_embeddings,
+        #     namespace="citrus_crop",
+        #     pinecone_api_key=os.getenv("PINECONE_API_KEY")
+        # )
+        # print(f"Text vector store initialized: {text_index_name} (namespace: citrus_crop)")
+        
+        # Setup CLIP index (512 dimensions for CLIP embeddings - BOTH text and images)
+        self.clip_index_name = os.getenv("PINECONE_CLIP_INDEX", "agrigpt-backend-rag-clip-index")
+        self._ensure_index_exists(self.clip_index_name, CLIP_DIMENSION)
+        self.clip_index = self.pinecone_client.Index(self.clip_index_name)
+        print(f"CLIP index initialized: {self.clip_index_name} (stores both text and images)")
+    
     def _ensure_clip_loaded(self):
-        """Lazy load CLIP model on first use using HuggingFace transformers"""
-        if self.clip_model is None or self.clip_processor is None:
+        """
+        Lazy load CLIP model on first use using HuggingFace transformers. With
+        CLIP_WEIGHTS_PATH the weights are memory-mapped and shared between
+        workers; RSS before / after the load is kept in clip_load_stats.
+        """
+        if self.clip_model is not None and self.clip_processor is not None:
+            return
+        # warm_up and the threaded embedding calls can get here at the same
+        # time; only the first loads, the others wait for it
+        with self._clip_lock:
+            if self.clip_model is not None and self.clip_processor is not None:
+                return
             print("Loading CLIP model from HuggingFace (first use, this may take a moment)...")
             # Import here to avoid slow module load at startup
-            from transformers import CLIPProcessor, CLIPModel
+            from transformers import CLIPProcessor
             import torch
             
             # Use openai/clip-vit-base-patch32 (512 dimensions, same as sentence-transformers)
-            model_name = "openai/clip-vit-base-patch32"
-            self.clip_processor = CLIPProcessor.from_pretrained(model_name)
-            self.clip_model = CLIPModel.from_pretrained(model_name)
+            memory_before = process_memory()
+            started = time.perf_counter()
+            processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+            model = load_clip_model(CLIP_MODEL_NAME, CLIP_WEIGHTS_PATH)
             
-            # Set to eval mode and move to appropriate device
-            self.clip_model.eval()
+            # Move to GPU when available (mapped weights are copied to the device)
             if torch.cuda.is_available():
-                self.clip_model = self.clip_model.cuda()
+                model = model.cuda()
                 print("CLIP model loaded on GPU")
             else:
                 print("CLIP model loaded on CPU")
             
-            print(f"CLIP model loaded ({model_name}, 512 dimensions)")
+            memory_after = process_memory()
+            self.clip_load_stats = {
+                "model_name": CLIP_MODEL_NAME,
+                "weights": CLIP_WEIGHTS_PATH or "from_pretrained",
+                "seconds": round(time.perf_counter() - started, 3),
+                "memory_before": memory_before,
+                "memory_after": memory_after,
+            }
+            # Publish the model last: the unlocked check above treats it as "loaded"
+            self.clip_processor = processor
+            self.clip_model = model
+            print(
+                f"CLIP model loaded ({CLIP_MODEL_NAME}, 512 dimensions, "
+                f"weights: {self.clip_load_stats['weights']}, "
+                f"RSS {memory_before.get('rss_mb')} -> {memory_after.get('rss_mb')} MB)"
+            )
+    
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Load CLIP and run one dummy text and one dummy image forward pass (and
+        open the CLIP index connection), so the first real request doesn't pay
+        for weight loading and first-inference setup. Blocking; returns timings.
+        """
+        timings = {}
+        started = time.perf_counter()
+        self._ensure_clip_loaded()
+        timings["load_s"] = round(time.perf_counter() - started, 3)
+        timings["rss_mb"] = process_memory().get("rss_mb")
+        
+        started = time.perf_counter()
+        self.embed_text("warm-up")
+        timings["text_forward_s"] = round(time.perf_counter() - started, 3)
+        
+        buffer = io.BytesIO()
+        Image.new("RGB", (224, 224), (96, 140, 60)).save(buffer, format="PNG")
+        started = time.perf_counter()
+        self.embed_image(buffer.getvalue())
+        timings["image_forward_s"] = round(time.perf_counter() - started, 3)
+        
+        if self.clip_index is not None:
+            started = time.perf_counter()
+            rate_governor.call_sync(lambda: self.clip_index.describe_index_stats(), ("pinecone", self.clip_index_name))
+            timings["index_stats_s"] = round(time.perf_counter() - started, 3)
+        return timings
     
     def _ensure_index_exists(self, index_name: str, dimension: int):
         """Ensure Pinecone index exists, create if not"""
+        from pinecone import ServerlessSpec
+        
         existing_indexes = [idx.name for idx in self.pinecone_client.list_indexes()]
         
         if index_name not in existing_indexes:
@@ -160,8 +265,38 @@ class ClipIngestService:
                 )
             )
     
+    def _query_index(self, **kwargs):
+        """Query the CLIP index under the shared Pinecone rate limit"""
+        if "vector" in kwargs:
+            kwargs["vector"] = to_list(kwargs["vector"])
+        return rate_governor.call_sync(
+            lambda: self.clip_index.query(**kwargs),
+            ("pinecone", self.clip_index_name)
+        )
+    
+    async def _aquery_index(self, **kwargs):
+        """
+        _query_index for async handlers: the rate-limit wait (time.sleep) and
+        the blocking Pinecone call run in a worker thread, off the event loop
+        """
+        return await asyncio.to_thread(self._query_index, **kwargs)
+    
+    def _upsert_vectors(self, vectors: List[Dict[str, Any]]) -> None:
+        """
+        Upsert into the CLIP index at ingestion priority. Embedding arrays
+        become float lists here, where they are serialized for Pinecone.
+        """
+        vectors = [{**vector, "values": to_list(vector["values"])} for vector in vectors]
+        rate_governor.call_sync(
+            lambda: self.clip_index.upsert(vectors=vectors),
+            ("pinecone", self.clip_index_name),
+            priority=PRIORITY_INGESTION
+        )
+    
     def extract_text_from_pdf(self, file_path: str) -> str:
         """Extract all text from PDF"""
+        import fitz  # pymupdf
+        
         doc = fitz.open(file_path)
         text = ""
         for page in doc:
@@ -176,6 +311,8 @@ class ClipIngestService:
         Returns:
             List of dicts with 'image_bytes', 'page_num', 'image_index', 'page_text'
         """
+        import fitz  # pymupdf
+        
         images = []
         doc = fitz.open(file_path)
         
@@ -197,13 +334,10 @@ class ClipIngestService:
                     image_bytes = base_image["image"]
                     image_ext = base_image["ext"]
                     
-                    # Convert to PNG if needed for consistency
+                    # Re-encode formats browsers can't show (JPEG 2000, JBIG2, ...);
+                    # WebP keeps them close to the source size, unlike full-size PNG
                     if image_ext.lower() not in ["png", "jpg", "jpeg"]:
-                        img = Image.open(io.BytesIO(image_bytes))
-                        buffer = io.BytesIO()
-                        img.save(buffer, format="PNG")
-                        image_bytes = buffer.getvalue()
-                        image_ext = "png"
+                        image_bytes, image_ext = browser_safe_image(image_bytes)
                     
                     images.append({
                         "image_bytes": image_bytes,
@@ -221,63 +355,93 @@ class ClipIngestService:
         print(f"Extracted {len(images)} images from PDF with page context")
         return images
     
-    def embed_text(self, text: str) -> List[float]:
+    def _clip_features(self, encode: Callable[..., Any], inputs: Dict[str, Any]) -> np.ndarray:
         """
-        NEW METHOD: Embed text using CLIP model (HuggingFace)
-        CLIP can embed both text and images in the same vector space
+        Run a CLIP encoder and return L2-normalized float32 rows. On CPU the
+        array is a view of the output tensor (no copy).
         """
         import torch
         
-        # Lazy load CLIP model on first use
-        self._ensure_clip_loaded()
-        
-        # Process text with CLIP processor
-        inputs = self.clip_processor(text=[text], return_tensors="pt", padding=True, truncation=True)
-        
         # Move to same device as model
         if torch.cuda.is_available():
             inputs = {k: v.cuda() for k, v in inputs.items()}
         
-        # Get text embedding
         with torch.no_grad():
-            text_features = self.clip_model.get_text_features(**inputs)
+            features = encode(**inputs)
             # Normalize the features
-            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-        
-        # Convert to list and return
-        embedding = text_features.cpu().numpy()[0].tolist()
-        return embedding
+            features = features / features.norm(dim=-1, keepdim=True)
+        return np.ascontiguousarray(features.cpu().numpy(), dtype=np.float32)
     
-    def embed_image(self, image_bytes: bytes) -> List[float]:
-        """Embed image using CLIP model (HuggingFace)"""
-        import torch
-        
-        # Lazy load CLIP model on first use
-        self._ensure_clip_loaded()
-        
-        # Load image from bytes
-        img = Image.open(io.BytesIO(image_bytes))
-        
-        # CLIP expects RGB images
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        
-        # Process image with CLIP processor
-        inputs = self.clip_processor(images=img, return_tensors="pt")
-        
-        # Move to same device as model
-        if torch.cuda.is_available():
-            inputs = {k: v.cuda() for k, v in inputs.items()}
+    def _embed_batch(self, keys: List[Hashable], compute: Callable[[List[int]], np.ndarray]) -> np.ndarray:
+        """
+        (len(keys), 512) float32 matrix: cached rows are filled from the
+        embedding cache, the rest come from one compute(missing_rows) call
+        """
+        matrix = np.empty((len(keys), CLIP_DIMENSION), dtype=np.float32)
+        missing: Dict[Hashable, List[int]] = {}
+        for row, key in enumerate(keys):
+            cached = self.embedding_cache.get(key) if self.embedding_cache is not None else None
+            if cached is None:
+                missing.setdefault(key, []).append(row)
+            else:
+                matrix[row] = cached
         
-        # Get image embedding
-        with torch.no_grad():
-            image_features = self.clip_model.get_image_features(**inputs)
-            # Normalize the features
-            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+        if missing:
+            # Lazy load CLIP model on first use
+            self._ensure_clip_loaded()
+            # Duplicates (e.g. a logo repeated on every page) are embedded once
+            computed = compute([rows[0] for rows in missing.values()])
+            for (key, rows), vector in zip(missing.items(), computed):
+                matrix[rows] = vector
+                if self.embedding_cache is not None:
+                    self.embedding_cache.set(key, vector)
+        return matrix
+    
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts with CLIP in one forward pass; returns an (n, 512)
+        float32 matrix of normalized rows
+        """
+        return self._embed_batch(
+            [("text", text) for text in texts],
+            lambda rows: self._clip_features(
+                self.clip_model.get_text_features,
+                self.clip_processor(text=[texts[row] for row in rows], return_tensors="pt", padding=True, truncation=True)
+            )
+        )
+    
+    def embed_images(self, images_bytes: List[bytes]) -> np.ndarray:
+        """
+        Embed images with CLIP in one forward pass; returns an (n, 512)
+        float32 matrix of normalized rows
+        """
+        def compute(rows: List[int]) -> np.ndarray:
+            images = []
+            for row in rows:
+                img = Image.open(io.BytesIO(images_bytes[row]))
+                # CLIP expects RGB images
+                images.append(img if img.mode == "RGB" else img.convert("RGB"))
+            return self._clip_features(
+                self.clip_model.get_image_features,
+                self.clip_processor(images=images, return_tensors="pt")
+            )
         
-        # Convert to list and return
-        embedding = image_features.cpu().numpy()[0].tolist()
-        return embedding
+        return self._embed_batch(
+            [("image", hashlib.sha256(image_bytes).hexdigest()) for image_bytes in images_bytes],
+            compute
+        )
+    
+    def embed_text(self, text: str) -> np.ndarray:
+        """
+        NEW METHOD: Embed text using CLIP model (HuggingFace)
+        CLIP can embed both text and images in the same vector space.
+        Returns a 512-d float32 array.
+        """
+        return self.embed_texts([text])[0]
+    
+    def embed_image(self, image_bytes: bytes) -> np.ndarray:
+        """Embed image using CLIP model (HuggingFace); returns a 512-d float32 array"""
+        return self.embed_images([image_bytes])[0]
     
     def store_text_embedding(self, text: str, vector_id: str, metadata: Dict[str, Any]) -> None:
         """
@@ -296,13 +460,11 @@ class ClipIngestService:
         metadata["content"] = text[:1000]
         
         # Store in Pinecone CLIP index
-        self.clip_index.upsert(
-            vectors=[{
-                "id": vector_id,
-                "values": clip_embedding,
-                "metadata": metadata
-            }]
-        )
+        self._upsert_vectors([{
+            "id": vector_id,
+            "values": clip_embedding,
+            "metadata": metadata
+        }])
     
     def store_image_embedding(self, image_bytes: bytes, vector_id: str, metadata: Dict[str, Any]) -> None:
         """
@@ -320,13 +482,51 @@ class ClipIngestService:
         metadata["type"] = "image"
         
         # Store in Pinecone CLIP index
-        self.clip_index.upsert(
-            vectors=[{
-                "id": vector_id,
-                "values": clip_embedding,
-                "metadata": metadata
-            }]
-        )
+        self._upsert_vectors([{
+            "id": vector_id,
+            "values": clip_embedding,
+            "metadata": metadata
+        }])
+    
+    async def _persist_images(self, filename: str, images: List[Dict[str, Any]]) -> List[Dict[str, Optional[str]]]:
+        """
+        Store each extracted image plus its preview and thumbnail (generated in
+        the derivative process pool). Returns per image the image_url,
+        preview_url and thumbnail_url (None where a step failed).
+        """
+        derivatives = await generate_derivatives([img_data["image_bytes"] for img_data in images])
+        
+        uploads = []
+        slots = []  # (image position, variant) for each upload
+        for position, (img_data, variants) in enumerate(zip(images, derivatives)):
+            base_name = f"{filename}_p{img_data['page_num']}_i{img_data['image_index']}"
+            uploads.append({
+                "image_bytes": img_data["image_bytes"],
+                "filename": f"{base_name}.{img_data['ext']}",
+                "content_type": f"image/{img_data['ext']}",
+            })
+            slots.append((position, "image_url"))
+            for variant, (variant_bytes, ext) in (variants or {}).items():
+                uploads.append({
+                    "image_bytes": variant_bytes,
+                    "filename": f"{base_name}_{variant}.{ext}",
+                    "content_type": f"image/{ext}",
+                })
+                slots.append((position, f"{variant}_url"))
+        
+        urls = [{"image_url": None, "preview_url": None, "thumbnail_url": None} for _ in images]
+        stored = await self.image_storage.upload_images_async(uploads)
+        for (position, key), url in zip(slots, stored):
+            urls[position][key] = url
+        
+        if self.image_storage is local_storage:
+            # Release the images an earlier ingestion of this file referenced
+            # but this one no longer does
+            current = {upload["filename"]: url for upload, url in zip(uploads, stored) if url}
+            released = await run_storage(local_storage.record_source, filename, current)
+            if released:
+                print(f"Released {released} image references from the previous ingestion of {filename}")
+        return urls
     
     @traceable(run_type="chain")
     async def process_pdf(self, file_path: str, filename: str) -> Dict[str, Any]:
@@ -356,25 +556,27 @@ class ClipIngestService:
                 chunks = self.text_splitter.split_text(text)
                 
                 # CHANGED: Now using CLIP embeddings instead of Google embeddings
-                for i, chunk in enumerate(chunks):
+                for start in range(0, len(chunks), CLIP_EMBED_BATCH):
+                    batch = chunks[start:start + CLIP_EMBED_BATCH]
                     try:
-                        vector_id = f"{filename}_text_{i}"
-                        
-                        # Store text with CLIP embedding
-                        self.store_text_embedding(
-                            text=chunk,
-                            vector_id=vector_id,
-                            metadata={
-                                "source": filename,
-                                "chunk": i,
-                                "total_chunks": len(chunks),
-                                "type": "text",
-                                # NO content in metadata - retrieved via vector search
+                        matrix = await asyncio.to_thread(self.embed_texts, batch)
+                        vectors = [
+                            {
+                                "id": f"{filename}_text_{i}",
+                                "values": matrix[offset],
+                                "metadata": {
+                                    "source": filename,
+                                    "chunk": i,
+                                    "total_chunks": len(chunks),
+                                    "type": "text",
+                                    "content": chunk[:1000]
+                                }
                             }
-                        )
-                        
+                            for offset, (i, chunk) in enumerate(enumerate(batch, start))
+                        ]
+                        await asyncio.to_thread(self._upsert_vectors, vectors)
                     except Exception as e:
-                        error_msg = f"Error storing text chunk {i}: {str(e)}"
+                        error_msg = f"Error storing text chunks {start}-{start + len(batch) - 1}: {str(e)}"
                         print(error_msg)
                         results["errors"].append(error_msg)
                 
@@ -382,44 +584,64 @@ class ClipIngestService:
                 print(f"Stored {len(chunks)} text chunks with CLIP embeddings")
             
             # 2. Extract and process images
-            images = self.extract_images_from_pdf(file_path)
+            images = await asyncio.to_thread(self.extract_images_from_pdf, file_path)
             results["images_processed"] = len(images)
             
-            for img_data in images:
+            # Generate derivatives and persist all images while CLIP embeds them
+            persist_task = asyncio.ensure_future(self._persist_images(filename, images))
+            
+            embeddings = []
+            for start in range(0, len(images), CLIP_EMBED_BATCH):
+                batch = images[start:start + CLIP_EMBED_BATCH]
                 try:
-                    # Save image locally
-                    img_filename = f"{filename}_p{img_data['page_num']}_i{img_data['image_index']}.{img_data['ext']}"
-                    image_url = local_storage.upload_image(
-                        img_data["image_bytes"],
-                        img_filename,
-                        content_type=f"image/{img_data['ext']}"
-                    )
-                    
-                    # Vector ID for image
-                    vector_id = f"{filename}_img_{img_data['page_num']}_{img_data['image_index']}"
-                    
-                    # Truncate page_text to fit Pinecone metadata limits (40KB max)
-                    page_context = img_data.get("page_text", "")[:1000]
-                    
-                    # Store image with CLIP embedding
-                    self.store_image_embedding(
-                        image_bytes=img_data["image_bytes"],
-                        vector_id=vector_id,
-                        metadata={
-                            "source": filename,
-                            "page": img_data["page_num"],
-                            "image_index": img_data["image_index"],
-                            "image_url": image_url or "",
-                            "page_text": page_context,  # Keep for images (helps with context)
-                            "type": "image"
-                        }
-                    )
-                    
-                    results["images_stored"] += 1
-                    print(f"Stored image: {vector_id} -> {image_url}")
-                    
+                    matrix = await asyncio.to_thread(self.embed_images, [img_data["image_bytes"] for img_data in batch])
+                    embeddings.extend(matrix)
+                    continue
+                except Exception as e:
+                    print(f"Batch embedding failed ({str(e)}), embedding images one by one")
+                # One undecodable image fails the whole batch; retry individually
+                for img_data in batch:
+                    try:
+                        embeddings.append(await asyncio.to_thread(self.embed_image, img_data["image_bytes"]))
+                    except Exception as e:
+                        error_msg = f"Error processing image {img_data['page_num']}-{img_data['image_index']}: {str(e)}"
+                        print(error_msg)
+                        results["errors"].append(error_msg)
+                        embeddings.append(None)
+            
+            image_urls = await persist_task
+            
+            vectors = []
+            for img_data, embedding, urls in zip(images, embeddings, image_urls):
+                if embedding is None:
+                    continue
+                image_url = urls["image_url"]
+                vector_id = f"{filename}_img_{img_data['page_num']}_{img_data['image_index']}"
+                vectors.append({
+                    "id": vector_id,
+                    "values": embedding,
+                    "metadata": {
+                        "source": filename,
+                        "page": img_data["page_num"],
+                        "image_index": img_data["image_index"],
+                        "image_url": image_url or "",
+                        "preview_url": urls["preview_url"] or "",
+                        "thumbnail_url": urls["thumbnail_url"] or "",
+                        # Truncate page_text to fit Pinecone metadata limits (40KB max)
+                        "page_text": img_data.get("page_text", "")[:1000],
+                        "type": "image"
+                    }
+                })
+                print(f"Prepared image: {vector_id} -> {image_url}")
+            
+            # Store image embeddings in batches
+            for i in range(0, len(vectors), IMAGE_UPSERT_BATCH):
+                batch = vectors[i:i + IMAGE_UPSERT_BATCH]
+                try:
+                    await asyncio.to_thread(self._upsert_vectors, batch)
+                    results["images_stored"] += len(batch)
                 except Exception as e:
-                    error_msg = f"Error processing image {img_data['page_num']}-{img_data['image_index']}: {str(e)}"
+                    error_msg = f"Error storing image batch {i // IMAGE_UPSERT_BATCH + 1}: {str(e)}"
                     print(error_msg)
                     results["errors"].append(error_msg)
             
@@ -434,7 +656,8 @@ class ClipIngestService:
         self, 
         query: str, 
         top_k: int = 5,
-        filter_type: Optional[str] = None
+        filter_type: Optional[str] = None,
+        image_variant: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         NEW UNIFIED QUERY: Search for similar content (text or images or both)
@@ -443,6 +666,8 @@ class ClipIngestService:
             query: Text query to search for
             top_k: Number of results to return
             filter_type: Optional filter - "text", "image", or None (search both)
+            image_variant: "thumbnail", "preview" or "original" for image_url
+                (defaults to IMAGE_URL_VARIANT)
             
         Returns:
             List of matching results with metadata indicating type
@@ -451,11 +676,8 @@ class ClipIngestService:
             raise Exception("CLIP Ingest Service not initialized")
         
         try:
-            # Lazy load CLIP model on first use
-            self._ensure_clip_loaded()
-            
-            # Embed the query text using CLIP
-            query_embedding = self.embed_text(query)
+            # Embed the query text using CLIP (lazy loads CLIP on first use)
+            query_embedding = await asyncio.to_thread(self.embed_text, query)
             
             # Build filter if type specified
             filter_dict = None
@@ -463,7 +685,7 @@ class ClipIngestService:
                 filter_dict = {"type": {"$eq": filter_type}}
             
             # Search Pinecone CLIP index
-            results = self.clip_index.query(
+            results = await self._aquery_index(
                 vector=query_embedding,
                 top_k=top_k,
                 include_metadata=True,
@@ -482,7 +704,8 @@ class ClipIngestService:
                 # Add type-specific fields
                 if match.metadata.get("type") == "image":
                     result.update({
-                        "image_url": match.metadata.get("image_url", ""),
+                        "image_url": image_url_for(match.metadata, image_variant),
+                        "original_url": match.metadata.get("image_url", ""),
                         "page": match.metadata.get("page", 0),
                         "image_index": match.metadata.get("image_index", 0),
                         "page_text": match.metadata.get("page_text", "")
@@ -502,12 +725,12 @@ class ClipIngestService:
     
     # KEEP EXISTING METHODS for backward compatibility
     @traceable(run_type="chain")
-    async def query_images(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    async def query_images(self, query: str, top_k: int = 5, image_variant: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Query CLIP index for relevant images based on text
         (Uses unified query with image filter)
         """
-        results = await self.query_unified(query, top_k, filter_type="image")
+        results = await self.query_unified(query, top_k, filter_type="image", image_variant=image_variant)
         
         # Format to match existing API
         images = []
@@ -516,6 +739,7 @@ class ClipIngestService:
                 images.append({
                     "score": result["score"],
                     "image_url": result.get("image_url", ""),
+                    "original_url": result.get("original_url", ""),
                     "source": result["source"],
                     "page": result.get("page", 0),
                     "image_index": result.get("image_index", 0)
@@ -596,7 +820,7 @@ class ClipIngestService:
             # Wrap entire operation with timeout
             async def _process():
                 # Lazy load CLIP model on first use
-                self._ensure_clip_loaded()
+                await asyncio.to_thread(self._ensure_clip_loaded)
                 print("🖼️ Step 1: CLIP model loaded, processing image...")
                 
                 # 1. Load and embed the uploaded image with CLIP
@@ -611,12 +835,12 @@ class ClipIngestService:
                 if img.mode != "RGB":
                     img = img.convert("RGB")
                 
-                image_embedding = self.embed_image(image_bytes)
+                image_embedding = await asyncio.to_thread(self.embed_image, image_bytes)
                 print("🔍 Step 3: Searching Pinecone for similar content...")
                 
                 # 2. Search CLIP index for similar content (both images and text)
                 # This is the power of CLIP: image embedding can match both images AND text!
-                clip_results = self.clip_index.query(
+                clip_results = await self._aquery_index(
                     vector=image_embedding,
                     top_k=top_k * 2,  # Get more results to ensure we have both types
                     include_metadata=True
@@ -633,7 +857,7 @@ class ClipIngestService:
                             "source": match.metadata.get("source", ""),
                             "page": match.metadata.get("page", 0),
                             "page_text": match.metadata.get("page_text", ""),
-                            "image_url": match.metadata.get("image_url", ""),
+                            "image_url": image_url_for(match.metadata),
                             "score": match.score
                         })
                     elif match.metadata.get("type") == "text":
@@ -692,7 +916,7 @@ Based on the similar images and text found in the knowledge base:
 
 Be confident in your diagnosis based on the matched content."""
 
-                response = self.llm.invoke(prompt)
+                response = await rate_governor.call(lambda: self.llm.ainvoke(prompt), ("gemini", LLM_MODEL))
                 print("✅ Step 6: Answer generated successfully!")
                 return {
                     "answer": response.content,
@@ -709,7 +933,7 @@ Be confident in your diagnosis based on the matched content."""
             raise Exception(f"Error processing image query: {str(e)}")
     
     @traceable(run_type="chain")
-    async def query_images_by_image(self, image_bytes: bytes, top_k: int = 5) -> List[Dict[str, Any]]:
+    async def query_images_by_image(self, image_bytes: bytes, top_k: int = 5, image_variant: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Query CLIP index for similar images based on an uploaded image
         """
@@ -717,18 +941,11 @@ Be confident in your diagnosis based on the matched content."""
             raise Exception("CLIP Ingest Service not initialized")
         
         try:
-            # Lazy load CLIP model on first use
-            self._ensure_clip_loaded()
-            
-            # Load and embed the uploaded image with CLIP
-            img = Image.open(io.BytesIO(image_bytes))
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-            
-            image_embedding = self.embed_image(image_bytes)
+            # Embed the uploaded image with CLIP (lazy loads CLIP on first use)
+            image_embedding = await asyncio.to_thread(self.embed_image, image_bytes)
             
             # Search Pinecone CLIP index (filter for images only)
-            results = self.clip_index.query(
+            results = await self._aquery_index(
                 vector=image_embedding,
                 top_k=top_k,
                 include_metadata=True,
@@ -740,7 +957,8 @@ Be confident in your diagnosis based on the matched content."""
             for match in results.matches:
                 images.append({
                     "score": match.score,
-                    "image_url": match.metadata.get("image_url", ""),
+                    "image_url": image_url_for(match.metadata, image_variant),
+                    "original_url": match.metadata.get("image_url", ""),
                     "source": match.metadata.get("source", ""),
                     "page": match.metadata.get("page", 0),
                     "image_index": match.metadata.get("image_index", 0)
@@ -752,12 +970,12 @@ Be confident in your diagnosis based on the matched content."""
             raise Exception(f"Error querying images by image: {str(e)}")
     
     @traceable(run_type="chain")
-    async def hybrid_query_images(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    async def hybrid_query_images(self, query: str, top_k: int = 5, image_variant: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Hybrid image query: uses CLIP text embedding to find relevant images
         (Same as query_images - kept for backward compatibility)
         """
-        return await self.query_images(query, top_k)
+        return await self.query_images(query, top_k, image_variant)
 
 
 # Singleton instance
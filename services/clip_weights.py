@@ -0,0 +1,113 @@
+import os
+from typing import Any, Dict, Optional
+
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "openai/clip-vit-base-patch32")
+# Optional pre-exported CLIP weights (.safetensors, or a torch.save'd state dict
+# with .pt / .bin). When set, CLIP is built without allocating its own weights and
+# its tensors point straight into a read-only memory map of this file, so every
+# worker on the box shares the same page-cache copy (scripts/bench_clip_workers.py
+# --export writes it)
+CLIP_WEIGHTS_PATH = os.getenv("CLIP_WEIGHTS_PATH") or None
+
+
+def process_memory() -> Dict[str, Any]:
+    """
+    Memory of the current process in MB from /proc/self/smaps_rollup: rss,
+    pss (shared pages split between the processes mapping them) and the
+    shared / private split. Falls back to peak RSS where /proc isn't available.
+    """
+    fields = {
+        "Rss": "rss_mb",
+        "Pss": "pss_mb",
+        "Shared_Clean": "shared_clean_mb",
+        "Shared_Dirty": "shared_dirty_mb",
+        "Private_Clean": "private_clean_mb",
+        "Private_Dirty": "private_dirty_mb",
+    }
+    report: Dict[str, Any] = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    report[fields[key]] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        import sys
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, KB on Linux
+        report["peak_rss_mb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return report
+
+
+def export_clip_weights(path: str, model_name: str = CLIP_MODEL_NAME) -> int:
+    """
+    Write every CLIP parameter and buffer (non-persistent ones included, so
+    the model can be rebuilt from the file alone) to a safetensors file.
+    Returns the number of tensors written.
+    """
+    from safetensors.torch import save_file
+    from transformers import CLIPModel
+
+    model = CLIPModel.from_pretrained(model_name)
+    tensors = {
+        name: tensor.detach().contiguous().clone()
+        for name, tensor in list(model.named_parameters()) + list(model.named_buffers())
+    }
+    save_file(tensors, path, metadata={"model_name": model_name})
+    return len(tensors)
+
+
+def _read_tensors(path: str) -> Dict[str, Any]:
+    """Memory-mapped tensors from the weights file (no copy into process memory)"""
+    if path.endswith(".safetensors"):
+        # safetensors maps the file copy-on-write; tensors are views into it
+        from safetensors.torch import load_file
+        return load_file(path, device="cpu")
+    import torch
+    return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+
+
+def _assign_tensors(model: Any, tensors: Dict[str, Any]) -> None:
+    """
+    Point each parameter / buffer at the mapped tensor instead of copying into
+    it (the effect of load_state_dict(assign=True), but also covering
+    non-persistent buffers such as position_ids)
+    """
+    import torch
+
+    for name, tensor in tensors.items():
+        module_name, _, attr = name.rpartition(".")
+        module = model.get_submodule(module_name)
+        if attr in module._parameters:
+            module._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        elif attr in module._buffers:
+            module._buffers[attr] = tensor
+
+    missing = [
+        name for name, tensor in list(model.named_parameters()) + list(model.named_buffers())
+        if tensor.is_meta
+    ]
+    if missing:
+        raise ValueError(f"CLIP weights file is missing {len(missing)} tensors, e.g. {missing[:5]}")
+
+
+def load_clip_model(model_name: str = CLIP_MODEL_NAME, weights_path: Optional[str] = CLIP_WEIGHTS_PATH):
+    """
+    CLIP model in eval mode. With a weights file the model skeleton is built
+    on the meta device (no weight allocation) and the mapped tensors are
+    assigned in; otherwise it's the regular from_pretrained load, which
+    gives each process its own private copy of the weights.
+    """
+    from transformers import CLIPConfig, CLIPModel
+
+    if not weights_path:
+        return CLIPModel.from_pretrained(model_name).eval()
+
+    import torch
+
+    config = CLIPConfig.from_pretrained(model_name)
+    with torch.device("meta"):
+        model = CLIPModel(config)
+    _assign_tensors(model, _read_tensors(weights_path))
+    return model.eval()
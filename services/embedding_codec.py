@@ -0,0 +1,320 @@
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.ttl_cache import TTLCache
+
+# Encodings for stored / cached embeddings (bytes per 512-d CLIP vector):
+# float32 2048, float16 1024, int8 516 (codes + one float32 scale), pq M
+FLOAT32 = "float32"
+FLOAT16 = "float16"
+INT8 = "int8"
+PQ = "pq"
+ENCODINGS = (FLOAT32, FLOAT16, INT8, PQ)
+
+
+def as_matrix(vectors: Any) -> np.ndarray:
+    """(n, d) contiguous float32 matrix from a vector, a list of vectors or an array"""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    return matrix.reshape(1, -1) if matrix.ndim == 1 else matrix
+
+
+def as_vector(vector: Any) -> np.ndarray:
+    """1-d contiguous float32 array; no copy when it already is one"""
+    return np.ascontiguousarray(vector, dtype=np.float32).reshape(-1)
+
+
+def to_list(vector: Any) -> List[float]:
+    """
+    Python floats for JSON / network serialization. Embeddings stay float32
+    arrays everywhere else and only become lists at that boundary.
+    """
+    return vector.tolist() if isinstance(vector, np.ndarray) else list(vector)
+
+
+def cosine_similarities(query: Any, vectors: Any) -> np.ndarray:
+    """Cosine similarity of one query vector with each row of a matrix"""
+    q = as_vector(query)
+    matrix = as_matrix(vectors)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(q)
+    return (matrix @ q) / np.where(norms == 0, 1.0, norms)
+
+
+def quantize_int8(vectors: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization: each row is scaled so its largest
+    absolute component maps to 127. Returns (int8 codes, float32 scales).
+    """
+    matrix = as_matrix(vectors)
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None]
+
+
+class ProductQuantizer:
+    """
+    Product quantization: the vector is split into `subspaces` chunks and each
+    chunk is replaced by the index (uint8) of its nearest of 256 k-means
+    centroids, so a vector costs `subspaces` bytes. Inner products against a
+    query are computed from a per-query lookup table without decoding.
+    """
+
+    def __init__(self, subspaces: int = 64, centroids: int = 256, iterations: int = 20, seed: int = 0):
+        if centroids > 256:
+            raise ValueError("PQ codes are uint8, so at most 256 centroids per subspace")
+        self.subspaces = subspaces
+        self.centroids = centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.codebooks: Optional[np.ndarray] = None  # (subspaces, centroids, sub_dim)
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _split(self, matrix: np.ndarray) -> np.ndarray:
+        n, dim = matrix.shape
+        if dim % self.subspaces:
+            raise ValueError(f"Dimension {dim} is not divisible into {self.subspaces} subspaces")
+        return matrix.reshape(n, self.subspaces, dim // self.subspaces)
+
+    def train(self, vectors: Any) -> "ProductQuantizer":
+        """k-means per subspace (needs at least `centroids` training vectors)"""
+        chunks = self._split(as_matrix(vectors))
+        if chunks.shape[0] < self.centroids:
+            raise ValueError(f"PQ training needs at least {self.centroids} vectors, got {chunks.shape[0]}")
+        rng = np.random.default_rng(self.seed)
+        codebooks = []
+        for s in range(self.subspaces):
+            data = chunks[:, s, :]
+            centers = data[rng.choice(len(data), self.centroids, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = self._nearest(data, centers)
+                for c in range(self.centroids):
+                    members = data[assignment == c]
+                    if len(members):
+                        centers[c] = members.mean(axis=0)
+            codebooks.append(centers)
+        self.codebooks = np.stack(codebooks).astype(np.float32)
+        return self
+
+    @staticmethod
+    def _nearest(data: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        # argmin ||x - c||^2 = argmin (||c||^2 - 2 x.c)
+        distances = (centers * centers).sum(axis=1)[None, :] - 2.0 * data @ centers.T
+        return distances.argmin(axis=1)
+
+    def encode(self, vectors: Any) -> np.ndarray:
+        if not self.trained:
+            raise RuntimeError("ProductQuantizer.train must be called before encode")
+        chunks = self._split(as_matrix(vectors))
+        codes = np.empty((chunks.shape[0], self.subspaces), dtype=np.uint8)
+        for s in range(self.subspaces):
+            codes[:, s] = self._nearest(chunks[:, s, :], self.codebooks[s])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.codebooks[s][codes[:, s]] for s in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def inner_products(self, query: Any, codes: np.ndarray) -> np.ndarray:
+        """Approximate query . vector for every code row (asymmetric distance)"""
+        chunks = self._split(as_matrix(query))[0]
+        table = np.einsum("sd,scd->sc", chunks, self.codebooks)  # (subspaces, centroids)
+        return table[np.arange(self.subspaces), codes].sum(axis=1)
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self.codebooks is None else self.codebooks.nbytes
+
+
+class EmbeddingBatch:
+    """
+    NumPy-backed container for many embeddings in one encoding, instead of a
+    list of Python float lists (~28 bytes per float plus list overhead).
+    Supports appending (storage grows geometrically), decoding back to
+    float32 and brute-force top-k by inner product (cosine for normalized
+    vectors such as CLIP's).
+    """
+
+    def __init__(self, dim: int, encoding: str = FLOAT16, quantizer: Optional[ProductQuantizer] = None):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding!r}; expected one of {ENCODINGS}")
+        if encoding == PQ and (quantizer is None or not quantizer.trained):
+            raise ValueError("PQ encoding needs a trained ProductQuantizer")
+        self.dim = dim
+        self.encoding = encoding
+        self.quantizer = quantizer
+        code_shape, code_dtype = {
+            FLOAT32: (dim, np.float32),
+            FLOAT16: (dim, np.float16),
+            INT8: (dim, np.int8),
+            PQ: (quantizer.subspaces if quantizer else 0, np.uint8),
+        }[encoding]
+        self._codes = np.empty((0, code_shape), dtype=code_dtype)
+        self._scales = np.empty((0,), dtype=np.float32)
+        self._size = 0
+
+    @classmethod
+    def from_vectors(
+        cls,
+        vectors: Any,
+        encoding: str = FLOAT16,
+        quantizer: Optional[ProductQuantizer] = None,
+    ) -> "EmbeddingBatch":
+        matrix = as_matrix(vectors)
+        batch = cls(matrix.shape[1], encoding, quantizer)
+        batch.extend(matrix)
+        return batch
+
+    def extend(self, vectors: Any) -> None:
+        matrix = as_matrix(vectors)
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d vectors, got {matrix.shape[1]}-d")
+        scales = None
+        if self.encoding == INT8:
+            codes, scales = quantize_int8(matrix)
+        elif self.encoding == PQ:
+            codes = self.quantizer.encode(matrix)
+        else:
+            codes = matrix.astype(self._codes.dtype)
+
+        end = self._size + len(codes)
+        if end > len(self._codes):
+            capacity = max(end, 2 * len(self._codes), 16)
+            self._codes = np.resize(self._codes, (capacity, self._codes.shape[1]))
+            if self.encoding == INT8:
+                self._scales = np.resize(self._scales, capacity)
+        self._codes[self._size:end] = codes
+        if scales is not None:
+            self._scales[self._size:end] = scales
+        self._size = end
+
+    def append(self, vector: Any) -> None:
+        self.extend(vector)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self._codes[:self._size]
+
+    @property
+    def scales(self) -> np.ndarray:
+        """Per-vector scales (int8 only; empty otherwise)"""
+        return self._scales[:self._size]
+
+    def decode(self, rows: Optional[Sequence[int]] = None) -> np.ndarray:
+        """float32 (n, dim) matrix (all rows, or the given row indices)"""
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.encoding == INT8:
+            scales = self.scales if rows is None else self.scales[rows]
+            return dequantize_int8(codes, scales)
+        if self.encoding == PQ:
+            return self.quantizer.decode(codes)
+        return codes.astype(np.float32)
+
+    def scores(self, query: Any) -> np.ndarray:
+        """Inner product of the query with every stored vector"""
+        q = as_matrix(query)[0]
+        if self.encoding == PQ:
+            return self.quantizer.inner_products(q, self.codes)
+        if self.encoding == INT8:
+            return (self.codes @ q) * self.scales
+        return self.codes.astype(np.float32) @ q
+
+    def top_k(self, query: Any, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """(row indices, scores) of the k best matches, best first"""
+        scores = self.scores(query)
+        k = min(k, len(scores))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return best, scores[best]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the encoded vectors (codebooks excluded)"""
+        return self.codes.nbytes + self.scales.nbytes
+
+
+class EncodedVector:
+    """One embedding stored compactly (float16 or int8 + scale)"""
+
+    __slots__ = ("codes", "scale")
+
+    def __init__(self, vector: Any, encoding: str = FLOAT16):
+        if encoding == INT8:
+            codes, scales = quantize_int8(vector)
+            self.codes, self.scale = codes[0], float(scales[0])
+        elif encoding in (FLOAT16, FLOAT32):
+            self.codes, self.scale = as_matrix(vector)[0].astype(encoding), None
+        else:
+            raise ValueError(f"Single vectors support {FLOAT32}, {FLOAT16} or {INT8}, not {encoding!r}")
+
+    def decode(self) -> np.ndarray:
+        if self.scale is None:
+            return self.codes.astype(np.float32)
+        return self.codes.astype(np.float32) * self.scale
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (4 if self.scale is not None else 0)
+
+
+class EmbeddingCache:
+    """
+    LRU/TTL cache of embeddings (e.g. CLIP text queries, or images keyed by
+    content hash) that stores each vector in a compact encoding and hands
+    back float32 on hit.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600.0, encoding: str = FLOAT16):
+        if encoding not in (FLOAT32, FLOAT16, INT8):
+            raise ValueError(f"Cache encoding must be {FLOAT32}, {FLOAT16} or {INT8}, not {encoding!r}")
+        self.encoding = encoding
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        self._entry_bytes = 0
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        entry = self._cache.get(key)
+        return None if entry is None else entry.decode()
+
+    def set(self, key: Hashable, vector: Any) -> None:
+        entry = EncodedVector(vector, self.encoding)
+        self._cache.set(key, entry)
+        self._entry_bytes = entry.nbytes
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        stats["encoding"] = self.encoding
+        stats["vector_bytes"] = stats["size"] * self._entry_bytes
+        return stats
+
+
+def encoding_sizes(dim: int, pq_subspaces: int = 64) -> Dict[str, int]:
+    """Bytes per vector for each encoding (plus a list of Python floats for reference)"""
+    return {
+        "python_list": 56 + 8 * dim + 24 * dim,  # list header + pointers + float objects
+        FLOAT32: 4 * dim,
+        FLOAT16: 2 * dim,
+        INT8: dim + 4,
+        PQ: pq_subspaces,
+    }
+
+
+def recall_at_k(exact: np.ndarray, approx: np.ndarray) -> float:
+    """Share of the exact top-k rows (per query) that the approximate top-k also found"""
+    hits = sum(len(set(e) & set(a)) for e, a in zip(exact, approx))
+    return hits / max(1, sum(len(e) for e in exact))
+
@@ -0,0 +1,120 @@
+import io
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, features
+
+# Derivatives generated for every stored PDF image: a capped-dimension
+# preview and a small thumbnail (longest side, pixels)
+PREVIEW_MAX_DIM = int(os.getenv("IMAGE_PREVIEW_MAX_DIM", "1024"))
+THUMBNAIL_MAX_DIM = int(os.getenv("IMAGE_THUMBNAIL_MAX_DIM", "256"))
+DERIVATIVE_QUALITY = int(os.getenv("IMAGE_DERIVATIVE_QUALITY", "80"))
+# "webp" (default) or "avif" (used only if this Pillow build has AVIF support)
+DERIVATIVE_FORMAT = os.getenv("IMAGE_DERIVATIVE_FORMAT", "webp").lower()
+DERIVATIVE_WORKERS = int(os.getenv("IMAGE_DERIVATIVE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Variants of a stored image; query responses use IMAGE_URL_VARIANT by default
+IMAGE_VARIANTS = ("thumbnail", "preview", "original")
+DEFAULT_IMAGE_VARIANT = os.getenv("IMAGE_URL_VARIANT", "thumbnail")
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def derivative_format() -> Tuple[str, str]:
+    """(Pillow format, file extension) for derivatives, falling back to WebP, then PNG"""
+    if DERIVATIVE_FORMAT == "avif" and features.check_module("avif"):
+        return "AVIF", "avif"
+    if features.check_module("webp"):
+        return "WEBP", "webp"
+    return "PNG", "png"
+
+
+def _normalize_mode(img: Image.Image) -> Image.Image:
+    if img.mode in ("RGB", "RGBA"):
+        return img
+    return img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+
+
+def _encode(img: Image.Image, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        img.save(buffer, format="PNG", optimize=True)
+    else:
+        img.save(buffer, format=image_format, quality=DERIVATIVE_QUALITY)
+    return buffer.getvalue()
+
+
+def browser_safe_image(image_bytes: bytes) -> Tuple[bytes, str]:
+    """
+    Re-encode a PDF image that browsers can't display (JPEG 2000, JBIG2,
+    TIFF, ...) in the derivative format instead of full-size PNG, which is
+    usually much larger than the source
+    """
+    image_format, ext = derivative_format()
+    img = _normalize_mode(Image.open(io.BytesIO(image_bytes)))
+    return _encode(img, image_format), ext
+
+
+def make_derivatives(image_bytes: bytes) -> Dict[str, Tuple[bytes, str]]:
+    """
+    Build the preview and thumbnail for one image: variant -> (bytes, ext).
+    Runs in a worker process; images are never upscaled.
+    """
+    image_format, ext = derivative_format()
+    source = _normalize_mode(Image.open(io.BytesIO(image_bytes)))
+
+    derivatives = {}
+    for variant, max_dim in (("preview", PREVIEW_MAX_DIM), ("thumbnail", THUMBNAIL_MAX_DIM)):
+        img = source.copy()
+        img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+        derivatives[variant] = (_encode(img, image_format), ext)
+    return derivatives
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: never fork a process that may hold torch / driver threads
+        _executor = ProcessPoolExecutor(
+            max_workers=DERIVATIVE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def generate_derivatives(images: List[bytes]) -> List[Optional[Dict[str, Tuple[bytes, str]]]]:
+    """Generate derivatives for a batch of images in the process pool (None where one fails)"""
+    if not images:
+        return []
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    results = await asyncio.gather(
+        *[loop.run_in_executor(executor, make_derivatives, image_bytes) for image_bytes in images],
+        return_exceptions=True,
+    )
+    derivatives = []
+    for result in results:
+        if isinstance(result, BaseException):
+            print(f"Error generating image derivatives: {result}")
+            derivatives.append(None)
+        else:
+            derivatives.append(result)
+    return derivatives
+
+
+def image_url_for(metadata: Dict[str, str], variant: Optional[str] = None) -> str:
+    """URL of the requested image variant, falling back to the original (older vectors have no derivatives)"""
+    variant = variant or DEFAULT_IMAGE_VARIANT
+    if variant == "original":
+        return metadata.get("image_url", "")
+    return metadata.get(f"{variant}_url") or metadata.get("image_url", "")
+
+
+def shutdown_derivative_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,99 +1,449 @@
 import os
-import uuid
-from typing import Optional
+import re
+import json
+import time
+import hashlib
+import tempfile
+import asyncio
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 from pathlib import Path
 
+from services.storage_io import run_storage
+
+try:
+    import fcntl
+except ImportError:  # Windows: references are only serialized within one process
+    fcntl = None
+
 # Directory for storing images
 STATIC_DIR = Path(__file__).parent.parent / "static" / "images"
 
+# Per-image reference sidecars and per-source manifests live outside the
+# served static directory
+REFS_DIR = Path(os.getenv(
+    "LOCAL_STORAGE_REFS_DIR",
+    str(Path(__file__).parent.parent / "data" / "image_refs")
+))
+
+# Single JSON file of counts used before per-image sidecars; migrated on startup
+LEGACY_REFS_PATH = Path(os.getenv("LOCAL_STORAGE_REFS_PATH", str(REFS_DIR.parent / "image_refs.json")))
+
+URL_PREFIX = "/static/images/"
+
+# ab/cd/<sha256>.<ext> - anything else under STATIC_DIR is a legacy (uuid) file
+CONTENT_PATH_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+$")
+
+
+def content_path(digest: str, ext: str) -> str:
+    """Sharded relative path for a content hash, e.g. ab/cd/abcd....png"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
 
 class LocalStorageService:
-    """Local file storage service for images (replaces R2)"""
-    
+    """
+    Local file storage service for images (replaces R2).
+
+    Files are content-addressed: the name is the SHA-256 of the bytes, sharded
+    into two directory levels. Each file has a sidecar under REFS_DIR listing
+    the names that reference it (the upload filename, e.g.
+    doc.pdf_p3_i0.png), so re-uploading the same image under the same name
+    is idempotent. Sidecars are updated under an exclusive per-shard lock
+    file, so several workers can share the directory, and are removed along
+    with their file. delete_image removes the file once no name references
+    it; record_source / release_source drop the references of a re-ingested
+    or deleted source document.
+    """
+
     def __init__(self):
         self.static_dir = STATIC_DIR
+        self.refs_dir = REFS_DIR
         self.initialized = False
-        
+        self.writes = 0
+        self.deduplicated = 0
+        self.released = 0
+        self._lock = threading.Lock()
+
     def initialize(self):
-        """Initialize local storage directory"""
+        """Initialize the local storage and reference directories"""
         try:
             # Create directory if it doesn't exist
             self.static_dir.mkdir(parents=True, exist_ok=True)
+            self.refs_dir.mkdir(parents=True, exist_ok=True)
+            self._migrate_legacy_refs()
             self.initialized = True
-            print(f"✅ Local storage initialized: {self.static_dir}")
+            print(f"✅ Local storage initialized: {self.static_dir} (references in {self.refs_dir})")
         except Exception as e:
             print(f"Error initializing local storage: {e}")
             self.initialized = False
-    
+
+    def _migrate_legacy_refs(self) -> None:
+        """Turn the old single-file counts into sidecars (one placeholder name per count)"""
+        try:
+            with open(LEGACY_REFS_PATH, "r", encoding="utf-8") as f:
+                counts = json.load(f)
+        except FileNotFoundError:
+            return
+        # Placeholder names are deterministic, so a concurrent migration by
+        # another worker adds nothing twice
+        for relative_path, count in counts.items():
+            self._update_refs(relative_path, lambda refs, count=count: refs.update(f"legacy-{i}" for i in range(count)))
+        try:
+            LEGACY_REFS_PATH.rename(LEGACY_REFS_PATH.with_suffix(".json.migrated"))
+        except FileNotFoundError:
+            pass
+        print(f"Migrated reference counts of {len(counts)} images to sidecars")
+
+    def _atomic_write(self, path: Path, data: bytes) -> None:
+        """Write to a temp file in the target directory, then rename over the target"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @contextmanager
+    def _directory_lock(self, directory: Path) -> Iterator[None]:
+        """
+        Exclusive lock on directory/.lock. The lock file is never unlinked,
+        so every process locks the same inode, while the JSON files it guards
+        can be replaced or removed freely.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock if fcntl is None else nullcontext():
+            with open(directory / ".lock", "a") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _read_json(self, path: Path, default: Any) -> Any:
+        """Current contents of a JSON file (default if missing); writes are atomic renames, so no lock is needed"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return default
+        return json.loads(raw) if raw.strip() else default
+
+    @contextmanager
+    def _locked_json(self, path: Path, default: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Read-modify-write a small JSON file under its directory lock. Yields
+        {"value": parsed}; on exit a changed "value" is written back
+        atomically, and None removes the file.
+        """
+        with self._directory_lock(path.parent):
+            current = self._read_json(path, default)
+            holder = {"value": current}
+            yield holder
+            if holder["value"] is None:
+                if path.exists():
+                    path.unlink()
+            elif holder["value"] != current or not path.exists():
+                self._atomic_write(path, json.dumps(holder["value"]).encode("utf-8"))
+
+    def _sidecar(self, relative_path: str) -> Path:
+        return self.refs_dir / f"{relative_path}.refs"
+
+    def _update_refs(self, relative_path: str, change: Callable[[Set[str]], Any]) -> Any:
+        """
+        Apply change(refs) to a file's reference names under its shard's lock.
+        The sidecar is removed once it lists no names and the file is gone.
+        """
+        with self._locked_json(self._sidecar(relative_path), []) as holder:
+            refs = set(holder["value"])
+            result = change(refs)
+            if refs or (self.static_dir / relative_path).exists():
+                holder["value"] = sorted(refs)
+            else:
+                holder["value"] = None
+            return result
+
+    def _reserve(self, items: List[Tuple[bytes, str]]) -> Tuple[List[str], Dict[str, bool]]:
+        """
+        Add each upload filename as a reference to its content and report
+        which contents are already on disk. The reference is taken before any
+        write, so a concurrent delete of the same content can't remove the
+        file between the check and the return.
+
+        Returns:
+            The relative path of each item, and for each distinct path whether
+            it is already stored (identical items share one path and one write)
+        """
+        paths = []
+        names: Dict[str, Set[str]] = {}
+        for image_bytes, filename in items:
+            ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else "png"
+            if not ext.isalnum():
+                ext = "png"
+            relative_path = content_path(hashlib.sha256(image_bytes).hexdigest(), ext)
+            paths.append(relative_path)
+            names.setdefault(relative_path, set()).add(filename)
+
+        existing = {}
+        for relative_path, filenames in names.items():
+            file_path = self.static_dir / relative_path
+
+            def add(refs: Set[str], filenames=filenames, file_path=file_path) -> bool:
+                refs.update(filenames)
+                return file_path.exists()
+
+            existing[relative_path] = self._update_refs(relative_path, add)
+        return paths, existing
+
+    def _store(self, relative_path: str, exists: bool, image_bytes: bytes) -> str:
+        """Write a reserved image unless its content is already stored; returns its URL"""
+        if exists:
+            self.deduplicated += 1
+        else:
+            self._atomic_write(self.static_dir / relative_path, image_bytes)
+            self.writes += 1
+
+        # Return relative URL path (will be served by FastAPI static files)
+        relative_url = f"{URL_PREFIX}{relative_path}"
+        print(f"{'Reused' if exists else 'Saved'} image: {relative_url}")
+        return relative_url
+
+    def _relative_path(self, image_url: str) -> str:
+        return image_url.split(URL_PREFIX, 1)[-1] if URL_PREFIX in image_url else image_url.split("/")[-1]
+
     def upload_image(self, image_bytes: bytes, filename: str, content_type: str = "image/png") -> Optional[str]:
         """
         Save image locally and return relative URL path
-        
+
         Args:
             image_bytes: Image data as bytes
-            filename: Original filename
+            filename: Name referencing the image (its extension is used for the file)
             content_type: MIME type (unused, kept for API compatibility)
-            
+
         Returns:
-            Relative URL path to the image (e.g., /static/images/abc123.png)
+            Relative URL path to the image (e.g., /static/images/ab/cd/abcd...png)
         """
         if not self.initialized:
             print("Local storage not initialized, initializing now...")
             self.initialize()
-        
+
+        try:
+            [relative_path], existing = self._reserve([(image_bytes, filename)])
+            exists = existing[relative_path]
+        except Exception as e:
+            print(f"Error saving image locally: {e}")
+            return None
+
         try:
-            # Generate unique filename
-            ext = filename.split(".")[-1] if "." in filename else "png"
-            unique_filename = f"{uuid.uuid4().hex}.{ext}"
-            file_path = self.static_dir / unique_filename
-            
-            # Write image to file
-            with open(file_path, "wb") as f:
-                f.write(image_bytes)
-            
-            # Return relative URL path (will be served by FastAPI static files)
-            relative_url = f"/static/images/{unique_filename}"
-            print(f"Saved image: {relative_url}")
-            return relative_url
-            
+            return self._store(relative_path, exists, image_bytes)
         except Exception as e:
             print(f"Error saving image locally: {e}")
+            self.delete_image(f"{URL_PREFIX}{relative_path}", ref=filename)
             return None
-    
-    def delete_image(self, image_url: str) -> bool:
+
+    async def upload_images_async(self, items: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Save a batch of images without blocking the event loop: references for
+        the whole batch are taken first, then new files are written in
+        parallel on the storage I/O pool. Identical images in the batch (e.g.
+        a logo on every page) are written once and share a URL.
+
+        Args:
+            items: Dicts with image_bytes, filename and (optional) content_type
+
+        Returns:
+            URLs in the same order as items (None where a write failed)
+        """
+        if not items:
+            return []
+        if not self.initialized:
+            print("Local storage not initialized, initializing now...")
+            await run_storage(self.initialize)
+
+        try:
+            paths, existing = await run_storage(
+                self._reserve, [(item["image_bytes"], item["filename"]) for item in items]
+            )
+        except Exception as e:
+            print(f"Error saving images locally: {e}")
+            return [None] * len(items)
+
+        # First item carrying each distinct path supplies the bytes to write
+        first: Dict[str, Dict[str, Any]] = {}
+        for relative_path, item in zip(paths, items):
+            first.setdefault(relative_path, item)
+        self.deduplicated += len(items) - len(first)
+
+        results = await asyncio.gather(
+            *[
+                run_storage(self._store, relative_path, existing[relative_path], item["image_bytes"])
+                for relative_path, item in first.items()
+            ],
+            return_exceptions=True,
+        )
+        stored = dict(zip(first, results))
+
+        urls = []
+        for relative_path, item in zip(paths, items):
+            result = stored[relative_path]
+            if isinstance(result, BaseException):
+                print(f"Error saving image locally: {result}")
+                # Give back the reference taken for the failed write
+                await run_storage(self.delete_image, f"{URL_PREFIX}{relative_path}", item["filename"])
+                urls.append(None)
+            else:
+                urls.append(result)
+        return urls
+
+    def delete_image(self, image_url: str, ref: Optional[str] = None) -> bool:
         """
-        Delete image from local storage
-        
+        Drop a reference to an image, deleting the file when none remain
+
         Args:
             image_url: Relative URL path of the image
-            
+            ref: Reference name to drop (the upload filename); any one if omitted
+
         Returns:
-            True if deleted successfully
+            True if a reference was released (or an unreferenced file deleted)
         """
         try:
-            # Extract filename from URL
-            filename = image_url.split("/")[-1]
-            file_path = self.static_dir / filename
-            
-            if file_path.exists():
-                file_path.unlink()
-                print(f"Deleted image: {filename}")
-                return True
-            return False
-            
+            relative_path = self._relative_path(image_url)
+            file_path = self.static_dir / relative_path
+
+            if not CONTENT_PATH_RE.match(relative_path):
+                # Legacy uuid-named file: not reference counted
+                if file_path.exists():
+                    file_path.unlink()
+                    print(f"Deleted image: {relative_path}")
+                    return True
+                return False
+
+            def release(refs: Set[str]) -> bool:
+                if ref is not None:
+                    released = ref in refs
+                    refs.discard(ref)
+                else:
+                    released = bool(refs)
+                    if refs:
+                        refs.remove(next(iter(refs)))
+                # The file is removed under the sidecar lock, so a concurrent
+                # upload either sees it gone or has its reference counted here
+                if not refs and file_path.exists():
+                    file_path.unlink()
+                    print(f"Deleted image: {relative_path}")
+                    return True
+                return released
+
+            released = self._update_refs(relative_path, release)
+            if released:
+                self.released += 1
+            return released
+
         except Exception as e:
             print(f"Error deleting image: {e}")
             return False
-    
+
+    def _source_manifest(self, source: str) -> Path:
+        return self.refs_dir / "sources" / f"{hashlib.sha256(source.encode('utf-8')).hexdigest()}.json"
+
+    def record_source(self, source: str, urls: Dict[str, str]) -> int:
+        """
+        Record which images a source document (e.g. an ingested PDF) now
+        references ({reference name: URL}) and release the references its
+        previous ingestion held that are no longer current. Returns the number
+        of references released.
+        """
+        with self._locked_json(self._source_manifest(source), {}) as holder:
+            previous: Dict[str, str] = holder["value"]
+            stale = [(ref, url) for ref, url in previous.items() if urls.get(ref) != url]
+            holder["value"] = dict(urls)
+        return sum(1 for ref, url in stale if self.delete_image(url, ref=ref))
+
+    def release_source(self, source: str) -> int:
+        """Release every image reference held by a deleted source document"""
+        return self.record_source(source, {})
+
+    def collect_garbage(self, temp_max_age: float = 3600.0, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Delete content-addressed files that no name references, stale temp
+        files and empty sidecars of files that are gone. dry_run only reports. Legacy uuid-named files are never touched: they predate
+        reference tracking and Pinecone metadata may still point at them.
+        """
+        report = {"removed": 0, "temp_removed": 0, "legacy_skipped": 0, "referenced": 0, "sidecars_removed": 0}
+        now = time.time()
+        for file in self.static_dir.rglob("*"):
+            if not file.is_file():
+                continue
+            relative_path = file.relative_to(self.static_dir).as_posix()
+            if file.name.startswith(".tmp-"):
+                # Temp files may belong to a write still in progress
+                if now - file.stat().st_mtime >= temp_max_age:
+                    if not dry_run:
+                        file.unlink()
+                    report["temp_removed"] += 1
+                continue
+            if not CONTENT_PATH_RE.match(relative_path):
+                report["legacy_skipped"] += 1
+                continue
+
+            if dry_run:
+                # Read only: no lock, no sidecar created or rewritten
+                unreferenced = not self._read_json(self._sidecar(relative_path), [])
+            else:
+                def sweep(refs: Set[str]) -> bool:
+                    if refs:
+                        return False
+                    if file.exists():
+                        file.unlink()
+                    return True
+
+                unreferenced = self._update_refs(relative_path, sweep)
+            if unreferenced:
+                report["removed"] += 1
+            else:
+                report["referenced"] += 1
+
+        # Empty sidecars left behind for files that are already gone
+        for sidecar in self.refs_dir.rglob("*.refs"):
+            relative_path = sidecar.relative_to(self.refs_dir).as_posix()[:-len(".refs")]
+            if (self.static_dir / relative_path).exists() or self._read_json(sidecar, []):
+                continue
+            if not dry_run:
+                # Re-checked under the lock; _update_refs drops the empty sidecar
+                self._update_refs(relative_path, lambda refs: None)
+            report["sidecars_removed"] += 1
+        print(f"Garbage collection{' (dry run)' if dry_run else ''}: {report}")
+        return report
+
     def clear_all(self):
-        """Clear all stored images"""
+        """Clear all stored images and their references"""
         try:
-            for file in self.static_dir.glob("*"):
-                file.unlink()
+            for directory in (self.static_dir, self.refs_dir):
+                for file in sorted(directory.rglob("*"), reverse=True):
+                    if file.is_file():
+                        file.unlink()
+                    elif file.is_dir():
+                        file.rmdir()
             print("Cleared all stored images")
         except Exception as e:
             print(f"Error clearing images: {e}")
 
+    def stats(self) -> Dict[str, int]:
+        """Per-process write / dedupe / release counters"""
+        return {
+            "writes": self.writes,
+            "deduplicated": self.deduplicated,
+            "released": self.released,
+        }
+
 
 # Singleton instance
 local_storage = LocalStorageService()
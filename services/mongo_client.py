@@ -0,0 +1,211 @@
+import os
+import threading
+import importlib.util
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+# Wire compressors and the modules that can back each one. The zstd backend
+# differs between pymongo releases (zstandard, later the stdlib / backported
+# zstd module), so the driver's own checks are preferred when it still has them
+COMPRESSOR_MODULES = {
+    "zstd": ("zstandard", "compression.zstd", "backports.zstd"),
+    "snappy": ("snappy",),
+    "zlib": ("zlib",),
+}
+
+
+def _module_installed(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ImportError:
+        # find_spec imports the parent package of a dotted name
+        return False
+
+
+try:
+    # Private driver helpers: may move or disappear in any pymongo release
+    from pymongo.compression_support import _have_snappy, _have_zlib, _have_zstd
+    COMPRESSOR_CHECKS = {"zstd": _have_zstd, "snappy": _have_snappy, "zlib": _have_zlib}
+except ImportError:
+    COMPRESSOR_CHECKS = {
+        name: (lambda modules=modules: any(_module_installed(module) for module in modules))
+        for name, modules in COMPRESSOR_MODULES.items()
+    }
+
+
+def available_compressors(requested: str) -> List[str]:
+    """
+    Filter a comma-separated compressor list (MONGODB_COMPRESSORS) down to the
+    ones whose library is installed, so a missing optional package doesn't
+    make the driver warn on every connection.
+    """
+    compressors = []
+    for name in (c.strip().lower() for c in requested.split(",")):
+        check = COMPRESSOR_CHECKS.get(name)
+        if check is not None and check():
+            compressors.append(name)
+    return compressors
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener recording how long operations wait to check out
+    a connection, plus checkout failures and connections currently in use.
+    Event callbacks run on driver threads, hence the lock.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=window)
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.in_use = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.pools_cleared = 0
+
+    def _record_wait(self, event) -> None:
+        # pymongo >= 4.7 reports the checkout duration (seconds) on the event
+        duration = getattr(event, "duration", None)
+        if duration is None:
+            return
+        wait_ms = duration * 1000
+        self._waits.append(wait_ms)
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_checked_out(self, event) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self._record_wait(event)
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self.checkout_failures += 1
+            self._record_wait(event)
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.pools_cleared += 1
+
+    # Remaining pool events aren't needed for the metrics
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        pass
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            count = len(waits)
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "in_use": self.in_use,
+                "pools_cleared": self.pools_cleared,
+                "wait_ms_avg": round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_p50": round(waits[count // 2], 3) if count else 0.0,
+                "wait_ms_p99": round(waits[min(count - 1, int(count * 0.99))], 3) if count else 0.0,
+                "wait_ms_max": round(self.max_wait_ms, 3),
+            }
+
+
+class MongoClientFactory:
+    """
+    One AsyncIOMotorClient (one connection pool, one set of monitor threads)
+    shared by every Mongo-backed service. The client is created with
+    connect=False, so nothing touches the network until connect() is awaited
+    at startup or the first operation runs.
+    """
+
+    def __init__(self):
+        self._client: Optional[AsyncIOMotorClient] = None
+        self._lock = threading.Lock()
+        self.monitor = PoolMonitor()
+        self.connected = False
+
+    def client_options(self) -> Dict[str, Any]:
+        """Driver options from the environment (pool sizes, timeouts, compression)"""
+        options: Dict[str, Any] = {
+            "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL_SIZE", "100")),
+            "minPoolSize": int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+            "maxIdleTimeMS": int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000")),
+            "waitQueueTimeoutMS": int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+            "connectTimeoutMS": int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "10000")),
+            "serverSelectionTimeoutMS": int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "10000")),
+            "socketTimeoutMS": int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "30000")),
+        }
+        compressors = available_compressors(os.getenv("MONGODB_COMPRESSORS", "zstd,snappy"))
+        if compressors:
+            options["compressors"] = ",".join(compressors)
+        return options
+
+    def get_client(self) -> AsyncIOMotorClient:
+        """Return the shared client, creating it on first use"""
+        mongo_uri = os.getenv("MONGODB_URI")
+        if not mongo_uri:
+            raise RuntimeError("MONGODB_URI is not configured")
+        with self._lock:
+            if self._client is None:
+                self._client = AsyncIOMotorClient(
+                    mongo_uri,
+                    connect=False,
+                    event_listeners=[self.monitor],
+                    **self.client_options(),
+                )
+            return self._client
+
+    async def connect(self) -> None:
+        """Open the pool and verify the server is reachable (called from app startup)"""
+        client = self.get_client()
+        await client.admin.command("ping")
+        self.connected = True
+        options = self.client_options()
+        print(f"🍃 MongoDB connected (pool max {options['maxPoolSize']}, "
+              f"compressors: {options.get('compressors', 'none')})")
+
+    def close(self) -> None:
+        """Close the shared client (called on shutdown)"""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            self.connected = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool checkout wait times and usage (for /metrics)"""
+        stats = {"connected": self.connected}
+        stats.update(self.monitor.stats())
+        return stats
+
+
+# Singleton instance
+mongo_client_factory = MongoClientFactory()
+
+
+def get_mongo_client() -> AsyncIOMotorClient:
+    return mongo_client_factory.get_client()
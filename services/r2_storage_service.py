@@ -1,16 +1,32 @@
 import os
 import io
+import math
 import uuid
-from typing import Optional
-import boto3
-from botocore.config import Config
+import asyncio
+from typing import Any, BinaryIO, Dict, List, Optional
 from dotenv import load_dotenv
 
+from services.storage_io import run_storage, STORAGE_WORKERS
+
 load_dotenv()
 
+# Presigned URLs let clients PUT/GET objects directly against R2, so large
+# uploads never pass through this process; the API only receives the key
+PRESIGN_EXPIRES_SECONDS = int(os.getenv("R2_PRESIGN_EXPIRES_SECONDS", "900"))
+# Objects above the threshold go up in parts (R2/S3 need >= 5 MiB per part, except the last)
+MULTIPART_THRESHOLD = int(os.getenv("R2_MULTIPART_THRESHOLD_MB", "16")) * 1024 * 1024
+MULTIPART_PART_SIZE = max(5, int(os.getenv("R2_MULTIPART_PART_SIZE_MB", "8"))) * 1024 * 1024
+MAX_PARTS = 10000
+# Prefix for client-uploaded objects; only keys under it are accepted back for ingestion
+UPLOAD_PREFIX = os.getenv("R2_UPLOAD_PREFIX", "uploads").strip("/")
+
 
 class R2StorageService:
-    """Cloudflare R2 Storage Service (S3-compatible)"""
+    """
+    Cloudflare R2 Storage Service (S3-compatible).
+    One boto3 client (thread-safe, with its own HTTP connection pool) is
+    shared by every upload, including concurrent batch uploads.
+    """
     
     def __init__(self):
         self.client = None
@@ -18,8 +34,21 @@ class R2StorageService:
         self.public_url = None
         self.initialized = False
         
-    def initialize(self):
-        """Initialize R2 client"""
+    def initialize(self, client=None):
+        """
+        Initialize R2 client
+
+        Args:
+            client: Optional pre-built S3-compatible client (e.g. the filesystem
+                fake in tests/fake_s3.py); the R2 credentials are then not needed
+        """
+        if client is not None:
+            self.client = client
+            self.bucket_name = os.getenv("R2_BUCKET_NAME", "test-bucket")
+            self.public_url = os.getenv("R2_PUBLIC_URL", "").rstrip("/")
+            self.initialized = True
+            return
+
         account_id = os.getenv("R2_ACCOUNT_ID")
         access_key = os.getenv("R2_ACCESS_KEY_ID")
         secret_key = os.getenv("R2_SECRET_ACCESS_KEY")
@@ -31,6 +60,10 @@ class R2StorageService:
             self.initialized = False
             return
         
+        # boto3 is only needed once R2 is actually configured
+        import boto3
+        from botocore.config import Config
+        
         # R2 endpoint format
         endpoint_url = f"https://{account_id}.r2.cloudflarestorage.com"
         
@@ -41,7 +74,9 @@ class R2StorageService:
             aws_secret_access_key=secret_key,
             config=Config(
                 signature_version="s3v4",
-                retries={"max_attempts": 3, "mode": "adaptive"}
+                retries={"max_attempts": 3, "mode": "adaptive"},
+                # Enough connections for every storage I/O worker to upload at once
+                max_pool_connections=int(os.getenv("R2_MAX_POOL_CONNECTIONS", str(max(10, STORAGE_WORKERS))))
             )
         )
         
@@ -86,6 +121,220 @@ class R2StorageService:
             print(f"Error uploading to R2: {str(e)}")
             return None
     
+    async def upload_images_async(self, items: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Upload a batch of images concurrently on the storage I/O pool
+        (bounded by STORAGE_IO_WORKERS), sharing the pooled client.
+
+        Args:
+            items: Dicts with image_bytes, filename and (optional) content_type
+
+        Returns:
+            Public URLs in the same order as items (None where an upload failed)
+        """
+        return await asyncio.gather(*[
+            run_storage(self.upload_image, item["image_bytes"], item["filename"], item.get("content_type", "image/png"))
+            for item in items
+        ])
+    
+    def new_key(self, filename: str, prefix: str = UPLOAD_PREFIX) -> str:
+        """Unique object key under prefix, keeping the file's extension"""
+        ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else "bin"
+        if not ext.isalnum():
+            ext = "bin"
+        return f"{prefix}/{uuid.uuid4().hex}.{ext}"
+
+    def is_upload_key(self, key: str) -> bool:
+        """True for keys handed out by presign_upload (guards ingestion of arbitrary objects)"""
+        return key.startswith(f"{UPLOAD_PREFIX}/") and ".." not in key
+
+    def _require_client(self):
+        if not self.initialized:
+            raise RuntimeError("R2 storage is not configured")
+
+    def presign_upload(
+        self,
+        filename: str,
+        content_type: str = "application/octet-stream",
+        size: Optional[int] = None,
+        expires_in: int = PRESIGN_EXPIRES_SECONDS,
+    ) -> Dict[str, Any]:
+        """
+        Presign a direct client upload. Small objects get one PUT URL; objects
+        larger than MULTIPART_THRESHOLD get a multipart upload with one PUT URL
+        per part (finish with complete_multipart_upload).
+
+        Args:
+            filename: Client filename (only its extension is kept in the key)
+            content_type: MIME type the client must send with the PUT
+            size: Object size in bytes, if known
+            expires_in: URL lifetime in seconds
+
+        Returns:
+            {"key", "method", "url", "headers", "expires_in"} for a single PUT, or
+            {"key", "upload_id", "part_size", "parts": [{"part_number", "url"}], "expires_in"}
+        """
+        self._require_client()
+        key = self.new_key(filename)
+
+        if size is not None and size > MULTIPART_THRESHOLD:
+            return self.presign_multipart_upload(key, size, content_type, expires_in)
+
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket_name, "Key": key, "ContentType": content_type},
+            ExpiresIn=expires_in,
+        )
+        return {
+            "key": key,
+            "method": "PUT",
+            "url": url,
+            "headers": {"Content-Type": content_type},
+            "expires_in": expires_in,
+        }
+
+    def presign_multipart_upload(
+        self,
+        key: str,
+        size: int,
+        content_type: str = "application/octet-stream",
+        expires_in: int = PRESIGN_EXPIRES_SECONDS,
+    ) -> Dict[str, Any]:
+        """Start a multipart upload for key and presign a PUT URL for every part"""
+        self._require_client()
+        part_size = max(MULTIPART_PART_SIZE, math.ceil(size / MAX_PARTS))
+        part_count = max(1, math.ceil(size / part_size))
+
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=key, ContentType=content_type
+        )["UploadId"]
+        parts = [
+            {
+                "part_number": part_number,
+                "url": self.client.generate_presigned_url(
+                    "upload_part",
+                    Params={
+                        "Bucket": self.bucket_name,
+                        "Key": key,
+                        "UploadId": upload_id,
+                        "PartNumber": part_number,
+                    },
+                    ExpiresIn=expires_in,
+                ),
+            }
+            for part_number in range(1, part_count + 1)
+        ]
+        return {
+            "key": key,
+            "upload_id": upload_id,
+            "part_size": part_size,
+            "parts": parts,
+            "expires_in": expires_in,
+        }
+
+    def complete_multipart_upload(self, key: str, upload_id: str, parts: List[Dict[str, Any]]) -> None:
+        """
+        Finish a multipart upload
+
+        Args:
+            parts: [{"part_number", "etag"}] - the ETag header R2 returned for each part PUT
+        """
+        self._require_client()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": int(part["part_number"]), "ETag": part["etag"]}
+                    for part in sorted(parts, key=lambda part: int(part["part_number"]))
+                ]
+            },
+        )
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        """Drop the parts of an unfinished multipart upload"""
+        self._require_client()
+        self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+
+    def presign_download(self, key: str, expires_in: int = PRESIGN_EXPIRES_SECONDS) -> str:
+        """Presigned GET URL for a (private) object"""
+        self._require_client()
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket_name, "Key": key},
+            ExpiresIn=expires_in,
+        )
+
+    def object_info(self, key: str) -> Optional[Dict[str, Any]]:
+        """Size / content type / ETag of an object, or None if it doesn't exist"""
+        self._require_client()
+        try:
+            head = self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except Exception:
+            return None
+        return {
+            "size": head.get("ContentLength", 0),
+            "content_type": head.get("ContentType"),
+            "etag": head.get("ETag"),
+        }
+
+    def delete_object(self, key: str) -> None:
+        """Delete an object by key (e.g. a rejected client upload)"""
+        self._require_client()
+        self.client.delete_object(Bucket=self.bucket_name, Key=key)
+
+    def upload_fileobj(
+        self,
+        fileobj: BinaryIO,
+        key: str,
+        content_type: str = "application/octet-stream",
+        size: Optional[int] = None,
+    ) -> str:
+        """
+        Server-side upload of a file object, in MULTIPART_PART_SIZE parts when
+        it is larger than MULTIPART_THRESHOLD (memory use stays at one part).
+        Unfinished multipart uploads are aborted on error. Returns the key.
+        """
+        self._require_client()
+        if size is not None and size <= MULTIPART_THRESHOLD:
+            self.client.put_object(Bucket=self.bucket_name, Key=key, Body=fileobj.read(), ContentType=content_type)
+            return key
+
+        first = fileobj.read(MULTIPART_PART_SIZE)
+        if len(first) < MULTIPART_PART_SIZE:
+            self.client.put_object(Bucket=self.bucket_name, Key=key, Body=first, ContentType=content_type)
+            return key
+
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=key, ContentType=content_type
+        )["UploadId"]
+        try:
+            parts = []
+            chunk, part_number = first, 1
+            while chunk:
+                response = self.client.upload_part(
+                    Bucket=self.bucket_name, Key=key, UploadId=upload_id, PartNumber=part_number, Body=chunk
+                )
+                parts.append({"part_number": part_number, "etag": response["ETag"]})
+                chunk, part_number = fileobj.read(MULTIPART_PART_SIZE), part_number + 1
+            self.complete_multipart_upload(key, upload_id, parts)
+        except BaseException:
+            self.abort_multipart_upload(key, upload_id)
+            raise
+        return key
+
+    def download_to_file(self, key: str, path: str) -> None:
+        """Stream an object to a local file (e.g. a client-uploaded PDF for ingestion)"""
+        self._require_client()
+        body = self.client.get_object(Bucket=self.bucket_name, Key=key)["Body"]
+        try:
+            with open(path, "wb") as f:
+                for chunk in iter(lambda: body.read(1024 * 1024), b""):
+                    f.write(chunk)
+        finally:
+            body.close()
+
     def delete_image(self, image_url: str) -> bool:
         """
         Delete image from R2
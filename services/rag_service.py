@@ -1,40 +1,101 @@
 import os
-from typing import List, Tuple, Optional, Any, Dict
+import time
+import asyncio
+import hashlib
+from typing import List, Tuple, Optional, Any, Dict, Union
 from dotenv import load_dotenv
 
-# LangChain imports
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_pinecone import PineconeVectorStore
-from langchain_core.documents import Document
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, AIMessage
+# LangChain, Gemini, Pinecone and pypdf are imported where they are first
+# used (initialize / ingestion / prompting): together they take seconds to
+# import and would otherwise delay the server opening its port
 
-# LangSmith imports
-from langsmith import traceable
+# LangSmith tracing (langsmith itself is imported on the first traced call)
+from services.tracing import traceable
 
-# PDF processing
-from pypdf import PdfReader
-
-# Pinecone
-from pinecone import Pinecone, ServerlessSpec
+# Client-side rate limiting for Gemini / Pinecone
+from services.rate_limiter import rate_governor, PRIORITY_INGESTION
 
 load_dotenv()
 
+EMBEDDING_MODEL = "models/text-embedding-004"
+LLM_MODEL = "gemini-2.5-flash"
+EMBEDDING_DIMENSION = 768
+
+# One pooled Pinecone index handle per process (HTTP connections are reused);
+# maintenance calls use the asyncio client when pinecone[asyncio] is installed
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "8"))
+PINECONE_ASYNC = os.getenv("PINECONE_ASYNC", "true").lower() in ("1", "true", "yes")
+DELETE_BATCH_SIZE = 1000  # Pinecone limit per delete call
+LIST_PAGE_SIZE = 100  # Pinecone limit per list page
+# Query-and-delete rounds for legacy (unprefixed) files when filter deletes
+# aren't supported; deletes are eventually consistent, so stale matches repeat
+# and rounds that find nothing new wait (doubling up to the max) before querying again
+LEGACY_DELETE_MAX_ROUNDS = 100
+LEGACY_DELETE_BACKOFF_SECONDS = 0.5
+LEGACY_DELETE_MAX_BACKOFF_SECONDS = 5.0
+
+# document_type -> Pinecone namespace / prompt topic
+NAMESPACES = {
+    "citrus": "citrus_crop",
+    "schemes": "government_schemes",
+}
+TOPIC_NAMES = {
+    "citrus": "Citrus Crop cultivation and management",
+    "schemes": "Government agricultural schemes and programs",
+}
+
+
+def namespace_for(document_type: str) -> str:
+    """Pinecone namespace for a document type (anything but citrus maps to schemes)"""
+    return NAMESPACES["citrus"] if document_type == "citrus" else NAMESPACES["schemes"]
+
+
+def source_id_prefix(filename: str) -> str:
+    """
+    ID prefix shared by every chunk of a source file (chunk i is
+    <prefix><i>), so a file's vectors can be found by ID-prefix listing
+    """
+    return f"{hashlib.sha256(filename.encode('utf-8')).hexdigest()[:32]}#"
+
 class RAGService:
     def __init__(self):
         self.embeddings = None
         self.vectorstore_citrus = None
         self.vectorstore_schemes = None
         self.llm = None
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
+        self.index_name = os.getenv("PINECONE_INDEX", "agrigpt-backend-rag-index")
+        self.index = None
+        self.async_index = None
+        self._text_splitter = None
+    
+    @property
+    def text_splitter(self):
+        if self._text_splitter is None:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=200,
+                length_function=len,
+            )
+        return self._text_splitter
         
     async def initialize(self):
-        """Initialize all components"""
+        """
+        Initialize all components. Imports and the blocking client / index
+        calls run in a worker thread so the event loop keeps serving requests
+        (e.g. /health) while this runs in the background.
+        """
+        pc, host = await asyncio.to_thread(self._initialize_clients)
+        # The asyncio client binds to the running loop, so it is opened here
+        self.async_index = self._open_async_index(pc, host)
+        print(f"✅ Async index client: {self.async_index is not None}")
+
+    def _initialize_clients(self):
+        """Create the Gemini / Pinecone clients and vector stores; returns (Pinecone client, index host)"""
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+        from langchain_pinecone import PineconeVectorStore
+        from pinecone import Pinecone, ServerlessSpec
+        
         try:
             print("Step 1: Checking environment variables...")
             google_api_key = os.getenv("GOOGLE_API_KEY")
@@ -49,14 +110,14 @@ class RAGService:
         
             print("Step 2: Initializing embeddings...")
             self.embeddings = GoogleGenerativeAIEmbeddings(
-                model="models/text-embedding-004",
+                model=EMBEDDING_MODEL,
                 google_api_key=google_api_key
             )
             print("✅ Embeddings initialized successfully")
         
             print("Step 3: Initializing LLM...")
             self.llm = ChatGoogleGenerativeAI(
-                model="gemini-2.5-flash",
+                model=LLM_MODEL,
                 google_api_key=google_api_key,
                 temperature=0.3,
                 convert_system_message_to_human=True
@@ -64,10 +125,10 @@ class RAGService:
             print("✅ LLM initialized successfully")
         
             print("Step 4: Initializing Pinecone...")
-            pc = Pinecone(api_key=pinecone_api_key)
+            pc = Pinecone(api_key=pinecone_api_key, pool_threads=PINECONE_POOL_THREADS)
             print("✅ Pinecone client created")
         
-            index_name = os.getenv("PINECONE_INDEX", "agrigpt-backend-rag-index")
+            index_name = self.index_name
             print(f"Step 5: Checking index: {index_name}")
         
             # Check if index exists, create if not
@@ -78,7 +139,7 @@ class RAGService:
                 print(f"Creating new index: {index_name}")
                 pc.create_index(
                     name=index_name,
-                    dimension=768,
+                    dimension=EMBEDDING_DIMENSION,
                     metric="cosine",
                     spec=ServerlessSpec(
                         cloud="aws",
@@ -89,28 +150,32 @@ class RAGService:
             else:
                 print(f"✅ Index {index_name} already exists")
         
+            # Long-lived index handles shared by the vector stores and maintenance paths
+            host = pc.describe_index(index_name).host
+            self.index = pc.Index(host=host, pool_threads=PINECONE_POOL_THREADS)
+            print("✅ Index handle opened")
+        
             print("Step 6: Initializing vector store for citrus...")
             self.vectorstore_citrus = PineconeVectorStore(
-                index_name=index_name,
+                index=self.index,
                 embedding=self.embeddings,
-                namespace="citrus_crop",
-                pinecone_api_key=pinecone_api_key
+                namespace=NAMESPACES["citrus"]
             )
             print("✅ Citrus vector store initialized")
         
             print("Step 7: Initializing vector store for schemes...")
             self.vectorstore_schemes = PineconeVectorStore(
-                index_name=index_name,
+                index=self.index,
                 embedding=self.embeddings,
-                namespace="government_schemes",
-                pinecone_api_key=pinecone_api_key
-            )   
+                namespace=NAMESPACES["schemes"]
+            )
             print("✅ Schemes vector store initialized")
         
             if self.vectorstore_citrus is None or self.vectorstore_schemes is None:
                 raise ValueError("Vector store initialization failed")
         
             print("✅✅✅ ALL COMPONENTS INITIALIZED SUCCESSFULLY ✅✅✅")
+            return pc, host
         
         except Exception as e:
             print(f"❌ Initialization failed")
@@ -119,42 +184,149 @@ class RAGService:
             traceback.print_exc()
             raise e
 
-    async def remove_existing_file(self, filename: str, document_type: str) -> int:
+    async def warm_up_pinecone(self) -> Dict[str, float]:
+        """Open the index connections (TLS + HTTP pool) with a cheap stats call; returns timings"""
+        timings = {}
+        started = time.perf_counter()
+        await asyncio.to_thread(
+            rate_governor.call_sync, lambda: self.index.describe_index_stats(), ("pinecone", self.index_name)
+        )
+        timings["index_stats_s"] = round(time.perf_counter() - started, 3)
+        if self.async_index is not None:
+            started = time.perf_counter()
+            await self._index_call("describe_index_stats")
+            timings["async_index_stats_s"] = round(time.perf_counter() - started, 3)
+        return timings
+
+    async def warm_up_gemini(self) -> Dict[str, float]:
+        """Open the Gemini connection with one query embedding (what the first chat request needs); returns timings"""
+        started = time.perf_counter()
+        await asyncio.to_thread(
+            rate_governor.call_sync,
+            lambda: self.embeddings.embed_query("warm-up"),
+            ("gemini", EMBEDDING_MODEL)
+        )
+        return {"embed_query_s": round(time.perf_counter() - started, 3)}
+
+    def _vectorstore_for(self, document_type: str):
+        """Vector store for a document type (anything but citrus maps to schemes)"""
+        return self.vectorstore_citrus if document_type == "citrus" else self.vectorstore_schemes
+
+    def _open_async_index(self, pc, host: str):
+        """asyncio index client (needs pinecone[asyncio]); None falls back to the sync handle in threads"""
+        if not PINECONE_ASYNC:
+            return None
+        try:
+            return pc.IndexAsyncio(host=host)
+        except Exception as e:
+            print(f"⚠️ Pinecone asyncio client unavailable, using the sync index in threads: {e}")
+            return None
+
+    async def close(self):
+        """Close the asyncio index client (its HTTP session is bound to the event loop)"""
+        if self.async_index is not None:
+            await self.async_index.close()
+            self.async_index = None
+
+    async def _index_call(self, method: str, priority: Optional[int] = None, **kwargs) -> Any:
+        """Call an index method on the shared handle (async client if open), under the Pinecone rate limit"""
+        if self.index is None:
+            raise RuntimeError("RAG service not initialized")
+        target = ("pinecone", self.index_name)
+        if self.async_index is not None:
+            return await rate_governor.call(
+                lambda: getattr(self.async_index, method)(**kwargs), target, priority=priority
+            )
+        return await asyncio.to_thread(
+            rate_governor.call_sync, lambda: getattr(self.index, method)(**kwargs), target, priority=priority
+        )
+
+    async def _list_ids(self, prefix: str, namespace: str) -> List[str]:
+        """All vector IDs starting with prefix in a namespace (paginated ID listing)"""
+        ids: List[str] = []
+        token = None
+        while True:
+            page = await self._index_call(
+                "list_paginated", priority=PRIORITY_INGESTION,
+                prefix=prefix, namespace=namespace, limit=LIST_PAGE_SIZE, pagination_token=token
+            )
+            ids.extend(vector.id for vector in page.vectors)
+            token = page.pagination.next if page.pagination else None
+            if not token:
+                return ids
+
+    async def _delete_ids(self, ids: List[str], namespace: str) -> None:
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            await self._index_call(
+                "delete", priority=PRIORITY_INGESTION, ids=ids[i:i + DELETE_BATCH_SIZE], namespace=namespace
+            )
+
+    async def _delete_by_source_filter(self, filename: str, namespace: str) -> int:
         """
-        Check if vectors with the given filename exist and delete them.
-        Returns the number of vectors deleted.
+        Delete chunks of a file stored without prefixed IDs (ingested before
+        source_id_prefix). Uses a metadata-filter delete; indexes that reject
+        it fall back to querying for matching IDs page by page. Deletes are
+        eventually consistent, so already-deleted IDs can come back from the
+        query (a whole page of them can hide IDs still to delete): the loop
+        runs until a query returns no matches, backing off while rounds find
+        nothing new, for at most LEGACY_DELETE_MAX_ROUNDS rounds. Returns the
+        number deleted when known (0 for the filter delete).
+
+        Raises:
+            RuntimeError: matches were still returned after the last round
         """
+        source_filter = {"source": {"$eq": filename}}
         try:
-            index_name = os.getenv("PINECONE_INDEX", "agrigpt-backend-rag-index")
-            pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-            index = pc.Index(index_name)
-            
-            # Determine namespace based on document type
-            namespace = "citrus_crop" if document_type == "citrus" else "government_schemes"
-            
-            # Query to find all vectors with this filename in metadata
-            query_response = index.query(
-                vector=[0.0] * 768,  # Dummy vector (must match dimension)
-                filter={"source": {"$eq": filename}},
-                top_k=10000,  # Max results to find all matches
-                include_metadata=True,
-                namespace=namespace
+            await self._index_call("delete", priority=PRIORITY_INGESTION, filter=source_filter, namespace=namespace)
+            return 0
+        except Exception as e:
+            print(f"Metadata-filter delete not available ({e}), deleting {filename} page by page")
+
+        seen: set = set()
+        backoff = LEGACY_DELETE_BACKOFF_SECONDS
+        for _ in range(LEGACY_DELETE_MAX_ROUNDS):
+            response = await self._index_call(
+                "query", priority=PRIORITY_INGESTION,
+                vector=[0.0] * EMBEDDING_DIMENSION, filter=source_filter,
+                top_k=DELETE_BATCH_SIZE, include_metadata=False, namespace=namespace
             )
+            if not response.matches:
+                return len(seen)
+            ids = [match.id for match in response.matches if match.id not in seen]
+            if ids:
+                await self._delete_ids(ids, namespace)
+                seen.update(ids)
+                backoff = LEGACY_DELETE_BACKOFF_SECONDS
+            else:
+                # Only deleted-but-still-visible IDs: give the deletes time to apply
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, LEGACY_DELETE_MAX_BACKOFF_SECONDS)
+        raise RuntimeError(
+            f"{filename} still has matching vectors after {LEGACY_DELETE_MAX_ROUNDS} delete rounds "
+            f"({len(seen)} deleted); delete incomplete"
+        )
+
+    async def remove_existing_file(self, filename: str, document_type: str) -> int:
+        """
+        Delete every vector of a source file from its namespace.
+        Chunks are found by ID-prefix listing (no result cap, unlike a top_k
+        query); files ingested before prefixed IDs (the listing finds nothing)
+        are removed by metadata filter instead.
+        Returns the number of vectors deleted (as far as it is known).
+        """
+        try:
+            namespace = namespace_for(document_type)
             
-            # Extract IDs of vectors to delete
-            ids_to_delete = [match['id'] for match in query_response['matches']]
-            
+            ids_to_delete = await self._list_ids(source_id_prefix(filename), namespace)
             if ids_to_delete:
-                # Delete in batches (Pinecone limit is 1000 per batch)
-                batch_size = 1000
-                for i in range(0, len(ids_to_delete), batch_size):
-                    batch = ids_to_delete[i:i + batch_size]
-                    index.delete(ids=batch, namespace=namespace)
-                
-                print(f"Deleted {len(ids_to_delete)} vectors for file: {filename} in namespace: {namespace}")
-                return len(ids_to_delete)
+                await self._delete_ids(ids_to_delete, namespace)
+                deleted = len(ids_to_delete)
+            else:
+                deleted = await self._delete_by_source_filter(filename, namespace)
             
-            return 0
+            if deleted:
+                print(f"Deleted {deleted} vectors for file: {filename} in namespace: {namespace}")
+            return deleted
             
         except Exception as e:
             raise Exception(f"Error removing existing file: {str(e)}")
@@ -167,6 +339,9 @@ class RAGService:
             if deleted_count > 0:
                 print(f"Removed {deleted_count} existing chunks for {filename}")
             
+            from pypdf import PdfReader
+            from langchain_core.documents import Document
+            
             # Read PDF
             reader = PdfReader(file_path)
             text = ""
@@ -190,11 +365,19 @@ class RAGService:
                 )
                 documents.append(doc)
             
-            # Add documents to the appropriate vector store
-            if document_type == "citrus":
-                self.vectorstore_citrus.add_documents(documents)
-            else:
-                self.vectorstore_schemes.add_documents(documents)
+            # Add documents to the appropriate vector store (ingestion yields to chat traffic);
+            # IDs share the file's prefix so remove_existing_file can list them
+            vectorstore = self._vectorstore_for(document_type)
+            index_name = self.index_name
+            prefix = source_id_prefix(filename)
+            ids = [f"{prefix}{i}" for i in range(len(documents))]
+            await asyncio.to_thread(
+                rate_governor.call_sync,
+                lambda: vectorstore.add_documents(documents, ids=ids),
+                ("gemini", EMBEDDING_MODEL),
+                ("pinecone", index_name),
+                priority=PRIORITY_INGESTION
+            )
             
             return len(documents)
             
@@ -205,23 +388,17 @@ class RAGService:
     def retrieve_documents(self, query: str, document_type: str) -> List[Dict[str, Any]]:
         """Retrieve documents relevant to the query from the appropriate namespace"""
         print(f"begin retrieve_documents for {document_type}")
-        import time
-        retries = 3
-        docs = []
         
         # Select the appropriate vectorstore
-        vectorstore = self.vectorstore_citrus if document_type == "citrus" else self.vectorstore_schemes
+        vectorstore = self._vectorstore_for(document_type)
+        index_name = self.index_name
         
-        for attempt in range(retries):
-            try:
-                docs = vectorstore.similarity_search(query, k=5)
-                break
-            except Exception as e:
-                if "429" in str(e) and attempt < retries - 1:
-                    print(f"Rate limit hit, retrying in {2 * (attempt + 1)} seconds...")
-                    time.sleep(2 * (attempt + 1))  # Exponential backoff
-                    continue
-                raise e
+        # similarity_search embeds the query (Gemini) and then queries Pinecone
+        docs = rate_governor.call_sync(
+            lambda: vectorstore.similarity_search(query, k=5),
+            ("gemini", EMBEDDING_MODEL),
+            ("pinecone", index_name)
+        )
         print(f"end retrieve_documents for {document_type}")
         return [
             {
@@ -232,15 +409,86 @@ class RAGService:
             for doc in docs
         ]
 
+    def _search_by_vector(self, document_type: str, embedding: List[float], k: int) -> List[Dict[str, Any]]:
+        """Search one namespace with a precomputed query embedding"""
+        vectorstore = self._vectorstore_for(document_type)
+        index_name = self.index_name
+        
+        docs_and_scores = rate_governor.call_sync(
+            lambda: vectorstore.similarity_search_by_vector_with_score(embedding, k=k),
+            ("pinecone", index_name)
+        )
+        return [
+            {
+                "page_content": doc.page_content,
+                "type": "Document",
+                "metadata": {**doc.metadata, "namespace": namespace_for(document_type)},
+                "score": score
+            }
+            for doc, score in docs_and_scores
+        ]
+
+    @traceable(run_type="retriever")
+    async def retrieve_documents_multi(self, query: str, document_types: List[str], k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Retrieve documents from several namespaces concurrently.
+        The query is embedded once and shared by every namespace search; results
+        are merged by score and deduplicated, keeping the top k overall.
+        """
+        print(f"begin retrieve_documents_multi for {document_types}")
+        
+        embedding = await asyncio.to_thread(
+            rate_governor.call_sync,
+            lambda: self.embeddings.embed_query(query),
+            ("gemini", EMBEDDING_MODEL)
+        )
+        
+        per_namespace = await asyncio.gather(*[
+            asyncio.to_thread(self._search_by_vector, document_type, embedding, k)
+            for document_type in document_types
+        ])
+        
+        merged = sorted(
+            (doc for docs in per_namespace for doc in docs),
+            key=lambda doc: doc["score"],
+            reverse=True
+        )
+        
+        # Same chunk can come back from more than one namespace if a file was ingested twice
+        seen = set()
+        results = []
+        for doc in merged:
+            metadata = doc["metadata"]
+            key = (metadata.get("source"), metadata.get("chunk"), doc["page_content"][:200])
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append(doc)
+            if len(results) == k:
+                break
+        
+        print(f"end retrieve_documents_multi for {document_types}")
+        return results
+
     @traceable(run_type="prompt")
-    def create_prompt(self, query: str, context: List[Dict[str, Any]], chat_history: List[dict] = None, document_type: str = "citrus") -> List[Any]:
+    def create_prompt(self, query: str, context: List[Dict[str, Any]], chat_history: List[dict] = None, document_type: Union[str, List[str]] = "citrus", summary: Optional[str] = None) -> List[Any]:
         """Create the prompt for the LLM with strict scope enforcement"""
         
         # Format context
         context_str = "\n\n".join([doc["page_content"] for doc in context])
         
-        # Determine the topic name
-        topic_name = "Citrus Crop cultivation and management" if document_type == "citrus" else "Government agricultural schemes and programs"
+        # Rolling summary of turns older than chat_history (braces escaped for the template)
+        summary_str = ""
+        if summary:
+            escaped = summary.replace("{", "{{").replace("}", "}}")
+            summary_str = f"Summary of the earlier conversation:\n{escaped}\n\n"
+        
+        # Determine the topic name (several when retrieving across namespaces)
+        document_types = [document_type] if isinstance(document_type, str) else document_type
+        topic_name = " and ".join(
+            TOPIC_NAMES["citrus"] if doc_type == "citrus" else TOPIC_NAMES["schemes"]
+            for doc_type in document_types
+        )
         
         # STRICT system prompt with guardrails
         system_prompt = (
@@ -257,6 +505,7 @@ class RAGService:
             "5. DO NOT make up or infer information that isn't in the context.\n"
             "6. Stay focused and professional. No small talk.\n\n"
             
+            f"{summary_str}"
             f"Context from knowledge base:\n{context_str}\n\n"
             
             "Remember: If the question is off-topic, politely redirect the user. Only answer what's in the context."
@@ -274,6 +523,7 @@ class RAGService:
         messages.append(("human", query))
         
         # Create prompt template to format messages properly
+        from langchain_core.prompts import ChatPromptTemplate
         prompt_template = ChatPromptTemplate.from_messages(messages)
         return prompt_template.format_messages()
 
@@ -281,36 +531,80 @@ class RAGService:
     def call_llm(self, messages: List[Any]) -> str:
         """Call the LLM with the messages"""
         print("begin call_llm")
-        import time
-        retries = 3
-        
-        for attempt in range(retries):
-            try:
-                response = self.llm.invoke(messages)
-                print("end call_llm")
-                return response.content
-            except Exception as e:
-                if "429" in str(e) and attempt < retries - 1:
-                    print(f"Rate limit hit on LLM, retrying in {2 * (attempt + 1)} seconds...")
-                    time.sleep(2 * (attempt + 1))
-                    continue
-                raise e
+        response = rate_governor.call_sync(lambda: self.llm.invoke(messages), ("gemini", LLM_MODEL))
+        print("end call_llm")
+        return response.content
+
+    @traceable(run_type="llm")
+    def summarize_conversation(self, summary: Optional[str], chat_history: List[dict]) -> str:
+        """Fold conversation turns into a rolling summary (used for long chats)"""
+        from langchain_core.messages import HumanMessage, SystemMessage
+        
+        transcript = "\n".join(
+            f"{'User' if item.get('role') == 'user' else 'Assistant'}: {item.get('content', '')}"
+            for item in chat_history
+        )
+        messages = [
+            SystemMessage(content=(
+                "You maintain a running summary of a conversation between a farmer and an agricultural assistant. "
+                "Update the summary with the new turns. Keep facts the user shared (crops, location, symptoms, "
+                "land size, schemes discussed), questions asked and answers given. "
+                "Write at most 200 words of plain prose."
+            )),
+            HumanMessage(content=(
+                f"Current summary:\n{summary or '(none)'}\n\n"
+                f"New turns:\n{transcript}\n\n"
+                "Updated summary:"
+            )),
+        ]
+        return self.call_llm(messages)
 
     @traceable(run_type="chain")
-    async def query(self, query: str, document_type: str, chat_history: List[dict] = None) -> Tuple[str, List[str]]:
+    async def query(self, query: str, document_type: str, chat_history: List[dict] = None, summary: Optional[str] = None) -> Tuple[str, List[str]]:
         """Query the RAG system with the appropriate document type"""
         try:
             print(f"Query for {document_type}: ", query)
             
             # 1. Retrieve documents from the appropriate namespace
-            retrieved_docs = self.retrieve_documents(query, document_type)
+            # (off the event loop, so waiting on the rate limiter doesn't block other requests)
+            retrieved_docs = await asyncio.to_thread(self.retrieve_documents, query, document_type)
             print("Retrieved documents: ", len(retrieved_docs))
             
             # 2. Create prompt with strict scope
-            messages = self.create_prompt(query, retrieved_docs, chat_history, document_type)
+            messages = self.create_prompt(query, retrieved_docs, chat_history, document_type, summary)
+            
+            # 3. Call LLM
+            answer = await asyncio.to_thread(self.call_llm, messages)
+            print("Answer: ", answer)
+            
+            # Extract sources
+            sources = []
+            for doc in retrieved_docs:
+                metadata = doc.get("metadata", {})
+                source = metadata.get("source", "Unknown")
+                chunk = metadata.get("chunk", 0)
+                sources.append(f"{source} (chunk {chunk + 1})")
+            
+            return answer, sources
+            
+        except Exception as e:
+            raise Exception(f"Error querying RAG system: {str(e)}")
+    
+    @traceable(run_type="chain")
+    async def query_multi(self, query: str, document_types: List[str], chat_history: List[dict] = None, summary: Optional[str] = None) -> Tuple[str, List[str]]:
+        """Query several namespaces at once (shared embedding, merged context, one LLM call)"""
+        try:
+            print(f"Query for {document_types}: ", query)
+            
+            # 1. Retrieve and merge documents from all namespaces
+            retrieved_docs = await self.retrieve_documents_multi(query, document_types)
+            print("Retrieved documents: ", len(retrieved_docs))
+            
+            # 2. Create prompt covering every requested topic
+            messages = self.create_prompt(query, retrieved_docs, chat_history, document_types, summary)
             
             # 3. Call LLM
-            answer = self.call_llm(messages)
+            answer = await asyncio.to_thread(self.call_llm, messages)
             print("Answer: ", answer)
             
             # Extract sources
@@ -329,19 +623,17 @@ class RAGService:
     async def clear_knowledge_base(self, document_type: Optional[str] = None):
         """Clear all documents from the vector store or specific namespace"""
         try:
-            index_name = os.getenv("PINECONE_INDEX", "agrigpt-backend-rag-index")
-            pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-            index = pc.Index(index_name)
-            
             if document_type:
                 # Clear specific namespace
-                namespace = "citrus_crop" if document_type == "citrus" else "government_schemes"
-                index.delete(delete_all=True, namespace=namespace)
+                namespace = namespace_for(document_type)
+                await self._index_call("delete", delete_all=True, namespace=namespace)
                 print(f"Cleared namespace: {namespace}")
             else:
                 # Clear both namespaces
-                index.delete(delete_all=True, namespace="citrus_crop")
-                index.delete(delete_all=True, namespace="government_schemes")
+                await asyncio.gather(*[
+                    self._index_call("delete", delete_all=True, namespace=namespace)
+                    for namespace in NAMESPACES.values()
+                ])
                 print("Cleared all namespaces")
             
         except Exception as e:
@@ -0,0 +1,241 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Request priorities (lower value is served first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_INGESTION = 2
+
+# Default (requests per second, burst) per provider; override with
+# RATE_LIMIT_<PROVIDER>_RPS / RATE_LIMIT_<PROVIDER>_BURST
+DEFAULT_LIMITS = {
+    "gemini": (5.0, 10),
+    "pinecone": (20.0, 40),
+}
+
+# AIMD tuning: on a 429 the rate is multiplied by AIMD_DECREASE and the
+# bucket pauses for THROTTLE_PAUSE seconds; each success adds
+# AIMD_INCREASE * max rate back, up to the configured max
+AIMD_DECREASE = float(os.getenv("RATE_LIMIT_AIMD_DECREASE", "0.5"))
+AIMD_INCREASE = float(os.getenv("RATE_LIMIT_AIMD_INCREASE", "0.05"))
+THROTTLE_PAUSE = float(os.getenv("RATE_LIMIT_THROTTLE_PAUSE", "1.0"))
+
+_current_priority: ContextVar[int] = ContextVar("rate_limit_priority", default=PRIORITY_INTERACTIVE)
+
+Target = Tuple[str, str]
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check whether an upstream error is a rate-limit / quota response"""
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message or "rate limit" in message.lower()
+
+
+class TokenBucket:
+    """
+    Token bucket for a single (provider, model) with AIMD rate adaptation
+    and a priority queue of waiters. Thread-safe, so it can be shared by
+    the event loop and worker threads.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = max(rate * 0.05, 0.05)
+        self.rate = rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waiters: List[Tuple[int, int]] = []
+        self.granted = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def enqueue(self, ticket: Tuple[int, int]) -> None:
+        with self._lock:
+            heapq.heappush(self.waiters, ticket)
+
+    def cancel(self, ticket: Tuple[int, int]) -> None:
+        with self._lock:
+            if ticket in self.waiters:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+
+    def try_acquire(self, ticket: Tuple[int, int]) -> float:
+        """
+        Take a token if this ticket is at the head of the queue.
+        Returns 0 on success, otherwise the number of seconds to wait.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.waiters and self.waiters[0] == ticket and self.tokens >= 1:
+                heapq.heappop(self.waiters)
+                self.tokens -= 1
+                self.granted += 1
+                return 0.0
+            return max((1 - self.tokens) / self.rate, 1 / self.rate, 0.005)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * AIMD_INCREASE)
+
+    def record_throttle(self) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * AIMD_DECREASE)
+            # Drain the bucket so every caller pauses, not just the one that got the 429
+            self.tokens = min(self.tokens, 0.0) - self.rate * THROTTLE_PAUSE
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "tokens": round(self.tokens, 3),
+                "queue_depth": len(self.waiters),
+                "granted": self.granted,
+                "throttled": self.throttled,
+            }
+
+
+class RateGovernor:
+    """
+    Process-wide client-side rate limiter for upstream providers
+    (Gemini, Pinecone). One TokenBucket per (provider, model).
+    """
+
+    def __init__(self):
+        self._buckets: Dict[Target, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def bucket(self, provider: str, model: str) -> TokenBucket:
+        """Get (or create) the bucket for a provider/model"""
+        key = (provider, model)
+        with self._lock:
+            if key not in self._buckets:
+                default_rate, default_burst = DEFAULT_LIMITS.get(provider, (10.0, 20))
+                rate = float(os.getenv(f"RATE_LIMIT_{provider.upper()}_RPS", default_rate))
+                burst = int(os.getenv(f"RATE_LIMIT_{provider.upper()}_BURST", default_burst))
+                self._buckets[key] = TokenBucket(f"{provider}/{model}", rate, burst)
+            return self._buckets[key]
+
+    def _ticket(self, priority: Optional[int]) -> Tuple[int, int]:
+        return (_current_priority.get() if priority is None else priority, next(self._seq))
+
+    @contextmanager
+    def priority_scope(self, priority: int):
+        """Set the default priority for calls made within this context (and tasks it spawns)"""
+        token = _current_priority.set(priority)
+        try:
+            yield
+        finally:
+            _current_priority.reset(token)
+
+    async def acquire(self, provider: str, model: str, priority: Optional[int] = None) -> None:
+        """Wait (without blocking the event loop) for a token"""
+        bucket = self.bucket(provider, model)
+        ticket = self._ticket(priority)
+        bucket.enqueue(ticket)
+        try:
+            while True:
+                wait = bucket.try_acquire(ticket)
+                if wait == 0:
+                    return
+                await asyncio.sleep(wait)
+        except BaseException:
+            bucket.cancel(ticket)
+            raise
+
+    def acquire_sync(self, provider: str, model: str, priority: Optional[int] = None) -> None:
+        """Blocking variant of acquire() for synchronous code paths"""
+        bucket = self.bucket(provider, model)
+        ticket = self._ticket(priority)
+        bucket.enqueue(ticket)
+        try:
+            while True:
+                wait = bucket.try_acquire(ticket)
+                if wait == 0:
+                    return
+                time.sleep(wait)
+        except BaseException:
+            bucket.cancel(ticket)
+            raise
+
+    def _record(self, targets: Tuple[Target, ...], error: Optional[Exception]) -> None:
+        for provider, model in targets:
+            if error is None:
+                self.bucket(provider, model).record_success()
+            else:
+                self.bucket(provider, model).record_throttle()
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        *targets: Target,
+        priority: Optional[int] = None,
+        retries: int = 3
+    ) -> Any:
+        """
+        Run an async upstream call under the rate limit of every target,
+        retrying on 429 (the throttled bucket paces the retry).
+        """
+        for attempt in range(retries):
+            for provider, model in targets:
+                await self.acquire(provider, model, priority)
+            try:
+                result = await fn()
+                self._record(targets, None)
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                self._record(targets, e)
+                if attempt == retries - 1:
+                    raise
+                print(f"Rate limit hit on {', '.join(p for p, _ in targets)}, retrying (attempt {attempt + 2}/{retries})...")
+
+    def call_sync(
+        self,
+        fn: Callable[[], Any],
+        *targets: Target,
+        priority: Optional[int] = None,
+        retries: int = 3
+    ) -> Any:
+        """Blocking variant of call() for synchronous code paths"""
+        for attempt in range(retries):
+            for provider, model in targets:
+                self.acquire_sync(provider, model, priority)
+            try:
+                result = fn()
+                self._record(targets, None)
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                self._record(targets, e)
+                if attempt == retries - 1:
+                    raise
+                print(f"Rate limit hit on {', '.join(p for p, _ in targets)}, retrying (attempt {attempt + 2}/{retries})...")
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-bucket rate, queue depth and counters (for /metrics)"""
+        with self._lock:
+            buckets = list(self._buckets.values())
+        return {bucket.name: bucket.stats() for bucket in buckets}
+
+
+# Singleton instance
+rate_governor = RateGovernor()
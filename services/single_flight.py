@@ -0,0 +1,64 @@
+import json
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+def coalesce_key(
+    route: str,
+    document_type: str,
+    query: str,
+    chat_history: Optional[List[dict]] = None,
+    summary: Optional[str] = None
+) -> Tuple[str, str, str, str]:
+    """
+    Key for deduplicating identical RAG requests:
+    (route, document_type, normalized query, chat history + summary hash)
+    """
+    normalized_query = " ".join(query.lower().split())
+    history_hash = hashlib.sha256(
+        json.dumps([summary, chat_history or []], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return (route, document_type, normalized_query, history_hash)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one upstream execution.
+    Every caller waiting on a key receives the same result (or exception).
+    Nothing is cached once the call completes.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() for this key, or join the call already in flight"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            # Run as its own task so a disconnecting caller doesn't cancel
+            # the work for everyone else waiting on it
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._inflight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,157 @@
+import os
+import re
+from mimetypes import guess_type
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+# Content-addressed files (name = SHA-256 of the bytes, see LocalStorageService)
+# never change, so browsers and CDNs may keep them for a year without revalidating
+IMMUTABLE_MAX_AGE = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE", "31536000"))
+# Anything else under /static can change in place and is revalidated via its ETag
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+# Serve file.br / file.gz next to file when the client accepts that encoding
+PRECOMPRESSED = os.getenv("STATIC_PRECOMPRESSED", "false").lower() in ("1", "true", "yes")
+
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}$")
+
+# Precompressed siblings, most preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def is_content_addressed(path: str) -> bool:
+    stem = os.path.basename(path).split(".", 1)[0]
+    return CONTENT_ADDRESSED.match(stem) is not None
+
+
+def strong_etag(path: str, stat_result: os.stat_result, encoding: Optional[str] = None) -> str:
+    """
+    Strong validator: the content hash for content-addressed files, otherwise
+    the nanosecond mtime and size (files are replaced atomically, never
+    rewritten in place). Each encoding of a file gets its own tag.
+    """
+    if is_content_addressed(path):
+        tag = os.path.basename(path).split(".", 1)[0]
+    else:
+        tag = f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+    if encoding:
+        tag = f"{tag}-{encoding}"
+    return f'"{tag}"'
+
+
+def cache_control(path: str) -> str:
+    if is_content_addressed(path):
+        return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return f"public, max-age={STATIC_MAX_AGE}"
+
+
+def accepted_encodings(request_headers: Headers) -> set:
+    """Codings the client accepts (q=0 entries excluded)"""
+    accepted = set()
+    for part in request_headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        params = params.replace(" ", "")
+        if not coding:
+            continue
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding)
+    return accepted
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles with cache-friendly responses:
+
+    - strong ETags (the content hash for content-addressed images) and
+      If-None-Match / If-Modified-Since handling (304 with no body)
+    - Cache-Control: immutable with a long max-age for content-addressed
+      files, a short max-age for everything else
+    - byte ranges (Range / If-Range, 206 and 416) via FileResponse
+    - optional precompressed siblings (file.br, file.gz) when
+      STATIC_PRECOMPRESSED is set
+    - zero-copy sends when the server supports the ASGI pathsend extension
+      (FileResponse uses it automatically for full-body responses)
+    """
+
+    def __init__(self, *args, precompressed: bool = PRECOMPRESSED, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.precompressed = precompressed
+        self.served = 0
+        self.not_modified = 0
+        self.partial = 0
+        self.compressed = 0
+
+    def _precompressed_variant(
+        self, full_path: str, request_headers: Headers
+    ) -> Tuple[str, Optional[os.stat_result], Optional[str]]:
+        """(path, stat, encoding) of the best precompressed sibling the client accepts"""
+        accepted = accepted_encodings(request_headers)
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                return full_path + suffix, os.stat(full_path + suffix), encoding
+            except OSError:
+                continue
+        return full_path, None, None
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+
+        serve_path, serve_stat, encoding = full_path, stat_result, None
+        if self.precompressed and status_code == 200:
+            variant_path, variant_stat, variant_encoding = self._precompressed_variant(full_path, request_headers)
+            if variant_stat is not None:
+                serve_path, serve_stat, encoding = variant_path, variant_stat, variant_encoding
+
+        headers: Dict[str, str] = {
+            "cache-control": cache_control(full_path),
+            "etag": strong_etag(full_path, stat_result, encoding),
+        }
+        if self.precompressed:
+            headers["vary"] = "Accept-Encoding"
+        if encoding:
+            headers["content-encoding"] = encoding
+
+        response = FileResponse(
+            serve_path,
+            status_code=status_code,
+            headers=headers,
+            # Type of the original file, not of the .br/.gz sibling
+            media_type=guess_type(full_path)[0] or "application/octet-stream",
+            stat_result=serve_stat,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            self.not_modified += 1
+            return NotModifiedResponse(response.headers)
+
+        self.served += 1
+        if encoding:
+            self.compressed += 1
+        if "range" in request_headers:
+            self.partial += 1
+        return response
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "served": self.served,
+            "not_modified": self.not_modified,
+            "range_requests": self.partial,
+            "precompressed": self.compressed,
+        }
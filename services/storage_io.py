@@ -0,0 +1,16 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# Bounded pool for blocking storage I/O (local disk writes, R2 uploads), so
+# persisting images never runs on the event loop and can't spawn unbounded threads
+STORAGE_WORKERS = int(os.getenv("STORAGE_IO_WORKERS", "8"))
+
+storage_executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix="storage-io")
+
+
+async def run_storage(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run a blocking storage call on the shared storage pool"""
+    return await asyncio.get_running_loop().run_in_executor(storage_executor, fn, *args)
+
@@ -0,0 +1,33 @@
+import inspect
+import functools
+from typing import Any, Callable
+
+
+def traceable(*decorator_args: Any, **decorator_kwargs: Any) -> Callable:
+    """
+    Drop-in for langsmith.traceable that defers importing langsmith (about
+    half a second, mostly its run-tree models) until the decorated function
+    is first called, so decorating methods doesn't slow down app startup.
+    """
+    def decorate(fn: Callable) -> Callable:
+        traced = None
+
+        def resolve() -> Callable:
+            nonlocal traced
+            if traced is None:
+                from langsmith import traceable as langsmith_traceable
+                traced = langsmith_traceable(*decorator_args, **decorator_kwargs)(fn)
+            return traced
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                return await resolve()(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return resolve()(*args, **kwargs)
+        return wrapper
+
+    return decorate
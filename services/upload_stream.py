@@ -0,0 +1,118 @@
+import os
+import asyncio
+import hashlib
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+# Uploads larger than this are rejected (HTTP 413). UploadLimitMiddleware
+# enforces it on the request body before Starlette parses the form, so an
+# oversized upload is cut off instead of being spooled in full; saved_upload
+# re-checks the exact file size
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE_KB", "1024")) * 1024
+# Allowance on top of MAX_UPLOAD_BYTES for multipart boundaries and the other
+# form fields when limiting the raw request body
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the {limit // (1024 * 1024)} MB limit")
+        self.limit = limit
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware capping multipart/form-data request bodies at
+    max_bytes + UPLOAD_FORM_OVERHEAD. A declared Content-Length over the cap
+    is refused with 413 before any of the body is read; otherwise the body
+    is counted as it is received and the request is aborted with 413 as
+    soon as it passes the cap (covers chunked uploads).
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_body = max_bytes + UPLOAD_FORM_OVERHEAD
+        self.detail = str(UploadTooLarge(max_bytes))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            declared = int(headers.get(b"content-length", b""))
+        except ValueError:
+            declared = None
+        if declared is not None and declared > self.max_body:
+            await JSONResponse({"detail": self.detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    # Raised inside the form parser, so FastAPI turns it into a 413
+                    raise HTTPException(status_code=413, detail=self.detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+@dataclass
+class SavedUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+@asynccontextmanager
+async def saved_upload(
+    file: UploadFile,
+    suffix: str = "",
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> AsyncIterator[SavedUpload]:
+    """
+    Copy an UploadFile to a named temp file in UPLOAD_CHUNK_SIZE chunks,
+    hashing as it goes. Starlette has already spooled the form file (to disk
+    past 1 MB), so this is a second copy; it's needed because the PDF loaders
+    take a path and the spool file has none. Memory stays at one chunk. The
+    temp file is removed when the block exits, including on errors.
+
+    Raises:
+        UploadTooLarge: the upload is (or turns out to be) over max_bytes
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        yield SavedUpload(path=path, size=size, sha256=digest.hexdigest())
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
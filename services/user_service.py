@@ -1,7 +1,16 @@
 import os
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from services.ttl_cache import TTLCache
+from services.mongo_client import get_mongo_client
+
+# Indexes bootstrapped at startup (see ensure_indexes)
+USER_INDEXES: List[Dict[str, Any]] = [
+    {"name": "email_unique", "keys": [("email", 1)], "unique": True},
+]
 
 
 class UserService:
@@ -16,35 +25,99 @@ class UserService:
         self.collection_name = os.getenv("MONGODB_USERS_COLLECTION", "users")
         self.client = None
         self.collection = None
+        # email -> userType, so repeated logins skip Mongo entirely.
+        # A changed userType is picked up once the entry expires.
+        self.user_type_cache = TTLCache(
+            max_size=int(os.getenv("USER_CACHE_MAX_SIZE", "10000")),
+            ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "300")),
+        )
 
         if self.mongo_uri:
             self._initialize_client()
 
     def _initialize_client(self) -> None:
         """Create the Mongo client and cache the collection handle."""
-        self.client = AsyncIOMotorClient(self.mongo_uri)
+        self.client = get_mongo_client()
         self.collection = self.client[self.db_name][self.collection_name]
 
+    async def ensure_indexes(self) -> Dict[str, str]:
+        """
+        Create the users indexes if missing (idempotent).
+        Returns index name -> "ok" or the error message.
+        """
+        if not self.mongo_uri:
+            raise RuntimeError("MONGODB_URI is not configured")
+        if self.client is None or self.collection is None:
+            self._initialize_client()
+
+        report = {}
+        for spec in USER_INDEXES:
+            try:
+                await self.collection.create_index(
+                    spec["keys"], name=spec["name"], unique=spec.get("unique", False)
+                )
+                report[spec["name"]] = "ok"
+            except Exception as e:
+                # e.g. duplicate emails already stored prevent the unique index
+                report[spec["name"]] = f"error: {str(e)}"
+        return report
+
+    async def check_indexes(self) -> Dict[str, str]:
+        """Report which expected users indexes exist: name -> "present" / "missing" / "mismatch" """
+        if not self.mongo_uri:
+            raise RuntimeError("MONGODB_URI is not configured")
+        if self.client is None or self.collection is None:
+            self._initialize_client()
+
+        existing = await self.collection.index_information()
+        return {spec["name"]: index_status(spec, existing) for spec in USER_INDEXES}
+
     async def ensure_user(self, email: str) -> str:
         """
         Ensure a user record exists for the given email.
 
         Returns the userType (existing value if present, otherwise "user"
-        after inserting a new record).
+        after inserting a new record). Uses a single atomic upsert, so
+        parallel calls for a new email can't create duplicate users.
         """
         if not self.mongo_uri:
             raise RuntimeError("MONGODB_URI is not configured")
 
+        cached = self.user_type_cache.get(email)
+        if cached is not None:
+            return cached
+
         if self.client is None or self.collection is None:
             self._initialize_client()
 
-        doc = await self.collection.find_one({"email": email})
-        if doc:
-            return doc.get("userType", "user")
+        try:
+            # Insert new user with default type "user" only if missing
+            doc = await self.collection.find_one_and_update(
+                {"email": email},
+                {"$setOnInsert": {"email": email, "userType": "user"}},
+                projection={"_id": 0, "userType": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Two upserts raced on the unique email index; the other one inserted
+            doc = await self.collection.find_one({"email": email}, {"_id": 0, "userType": 1})
+
+        user_type = (doc or {}).get("userType", "user")
+        self.user_type_cache.set(email, user_type)
+        return user_type
+
 
-        # Insert new user with default type "user"
-        await self.collection.insert_one({"email": email, "userType": "user"})
-        return "user"
+def index_status(spec: Dict[str, Any], existing: Dict[str, Any]) -> str:
+    """Compare an expected index spec with the output of index_information()"""
+    info = existing.get(spec["name"])
+    if info is None:
+        return "missing"
+    if [tuple(k) for k in info["key"]] != [tuple(k) for k in spec["keys"]]:
+        return "mismatch"
+    if bool(info.get("unique", False)) != spec.get("unique", False):
+        return "mismatch"
+    return "present"
 
 
 user_service = UserService()
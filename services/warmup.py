@@ -0,0 +1,122 @@
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class WarmupStage:
+    """
+    Background warm-up run after the port opens: each component (client,
+    model, cache) is a named async step, optionally depending on others.
+    Independent steps run concurrently. Per-component status, errors and
+    timings back the /ready endpoint; the app is ready once every required
+    component is ready.
+    """
+
+    def __init__(self):
+        self._steps: Dict[str, Dict[str, Any]] = {}
+        self._done: Dict[str, asyncio.Event] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def register(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[Any]],
+        depends_on: Optional[List[str]] = None,
+        required: bool = True,
+        enabled: bool = True,
+        reason: str = "not configured",
+    ) -> None:
+        """
+        Add a warm-up step. Disabled steps are reported as skipped and don't
+        hold up readiness; optional (required=False) steps are reported but
+        readiness doesn't wait for them.
+        """
+        self._steps[name] = {
+            "fn": fn,
+            "depends_on": depends_on or [],
+            "required": required and enabled,
+            "status": PENDING if enabled else SKIPPED,
+            "detail": None if enabled else reason,
+            "error": None,
+            "seconds": None,
+        }
+
+    async def _run_step(self, name: str) -> None:
+        step = self._steps[name]
+        try:
+            if step["status"] in (SKIPPED, FAILED):
+                return
+            for dependency in step["depends_on"]:
+                await self._done[dependency].wait()
+                if self._steps[dependency]["status"] != READY:
+                    step["status"] = SKIPPED
+                    step["detail"] = f"{dependency} is not ready"
+                    return
+
+            step["status"] = RUNNING
+            started = time.perf_counter()
+            try:
+                detail = await step["fn"]()
+                step["status"] = READY
+                step["detail"] = detail
+            except Exception as e:
+                step["status"] = FAILED
+                step["error"] = str(e)
+                print(f"❌ Warm-up step {name} failed: {e}")
+            finally:
+                step["seconds"] = round(time.perf_counter() - started, 3)
+            if step["status"] == READY:
+                print(f"🔥 Warm-up step {name} ready in {step['seconds']}s")
+        finally:
+            self._done[name].set()
+
+    async def run(self) -> None:
+        """
+        Run every registered step (dependencies first); never raises. A step
+        depending on an unregistered step is reported as failed.
+        """
+        self.started_at = time.time()
+        self._done = {name: asyncio.Event() for name in self._steps}
+        for name, step in self._steps.items():
+            missing = [d for d in step["depends_on"] if d not in self._steps]
+            if missing and step["status"] != SKIPPED:
+                step["status"] = FAILED
+                step["error"] = f"depends on unknown steps {missing}"
+                print(f"❌ Warm-up step {name} {step['error']}")
+        started = time.perf_counter()
+        await asyncio.gather(*[self._run_step(name) for name in self._steps])
+        self.finished_at = time.time()
+        print(f"✅ Warm-up finished in {time.perf_counter() - started:.2f}s (ready: {self.ready})")
+
+    @property
+    def ready(self) -> bool:
+        return all(step["status"] == READY for step in self._steps.values() if step["required"])
+
+    @property
+    def failed(self) -> List[str]:
+        return [name for name, step in self._steps.items() if step["required"] and step["status"] in (FAILED, SKIPPED)]
+
+    def report(self) -> Dict[str, Any]:
+        """Per-component status / timings for /ready"""
+        return {
+            "ready": self.ready,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "components": {
+                name: {
+                    "status": step["status"],
+                    "required": step["required"],
+                    "seconds": step["seconds"],
+                    "detail": step["detail"],
+                    "error": step["error"],
+                }
+                for name, step in self._steps.items()
+            },
+        }
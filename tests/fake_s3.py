@@ -0,0 +1,187 @@
+"""
+Filesystem stand-in for the S3 API subset R2StorageService uses, so the
+presigned / multipart upload paths can be exercised without R2 credentials.
+
+Objects live under root/<bucket>/<key>; presigned URLs point at a fake host
+and are "fetched" with FakeS3Client.request(), which checks the signature,
+expiry and method the way R2 would.
+"""
+import os
+import json
+import hmac
+import time
+import uuid
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+
+from botocore.exceptions import ClientError
+
+# Presigned client method -> HTTP method
+PRESIGN_METHODS = {"put_object": "PUT", "upload_part": "PUT", "get_object": "GET"}
+
+
+def _error(code: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+def _etag(data: bytes) -> str:
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+class FakeS3Client:
+    def __init__(self, root: str, base_url: str = "http://fake-s3.local", secret: str = "fake-secret"):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+        self.secret = secret.encode("utf-8")
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    # -- storage layout ------------------------------------------------------
+
+    def _object_path(self, bucket: str, key: str) -> Path:
+        path = (self.root / bucket / key).resolve()
+        if not str(path).startswith(str((self.root / bucket).resolve())):
+            raise _error("InvalidObjectName", "PutObject")
+        return path
+
+    def _meta_path(self, bucket: str, key: str) -> Path:
+        return self.root / ".meta" / bucket / f"{quote(key, safe='')}.json"
+
+    def _upload_dir(self, upload_id: str) -> Path:
+        return self.root / ".multipart" / upload_id
+
+    def _write(self, bucket: str, key: str, data: bytes, content_type: Optional[str], etag: str) -> None:
+        path = self._object_path(bucket, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        meta_path = self._meta_path(bucket, key)
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        meta_path.write_text(json.dumps({"ContentType": content_type or "binary/octet-stream", "ETag": etag}))
+
+    # -- object API ----------------------------------------------------------
+
+    def put_object(self, Bucket: str, Key: str, Body: Any, ContentType: Optional[str] = None, **_) -> Dict[str, Any]:
+        data = Body.read() if hasattr(Body, "read") else bytes(Body)
+        etag = _etag(data)
+        self._write(Bucket, Key, data, ContentType, etag)
+        return {"ETag": etag}
+
+    def head_object(self, Bucket: str, Key: str, **_) -> Dict[str, Any]:
+        path = self._object_path(Bucket, Key)
+        if not path.is_file():
+            raise _error("404", "HeadObject")
+        meta = json.loads(self._meta_path(Bucket, Key).read_text())
+        return {"ContentLength": path.stat().st_size, "ContentType": meta["ContentType"], "ETag": meta["ETag"]}
+
+    def get_object(self, Bucket: str, Key: str, **_) -> Dict[str, Any]:
+        head = self.head_object(Bucket, Key)
+        head["Body"] = open(self._object_path(Bucket, Key), "rb")
+        return head
+
+    def delete_object(self, Bucket: str, Key: str, **_) -> Dict[str, Any]:
+        for path in (self._object_path(Bucket, Key), self._meta_path(Bucket, Key)):
+            if path.exists():
+                path.unlink()
+        return {}
+
+    # -- multipart API -------------------------------------------------------
+
+    def create_multipart_upload(self, Bucket: str, Key: str, ContentType: Optional[str] = None, **_) -> Dict[str, Any]:
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._upload_dir(upload_id)
+        upload_dir.mkdir(parents=True)
+        (upload_dir / "upload.json").write_text(json.dumps({"Bucket": Bucket, "Key": Key, "ContentType": ContentType}))
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def _upload(self, Bucket: str, Key: str, UploadId: str) -> Tuple[Path, Dict[str, Any]]:
+        upload_dir = self._upload_dir(UploadId)
+        if not upload_dir.is_dir():
+            raise _error("NoSuchUpload", "UploadPart")
+        upload = json.loads((upload_dir / "upload.json").read_text())
+        if (upload["Bucket"], upload["Key"]) != (Bucket, Key):
+            raise _error("NoSuchUpload", "UploadPart")
+        return upload_dir, upload
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: Any, **_) -> Dict[str, Any]:
+        upload_dir, _ = self._upload(Bucket, Key, UploadId)
+        data = Body.read() if hasattr(Body, "read") else bytes(Body)
+        (upload_dir / f"{int(PartNumber):05d}.part").write_bytes(data)
+        return {"ETag": _etag(data)}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: Dict[str, Any], **_) -> Dict[str, Any]:
+        upload_dir, upload = self._upload(Bucket, Key, UploadId)
+        data = b""
+        digests = b""
+        for part in MultipartUpload["Parts"]:
+            part_path = upload_dir / f"{int(part['PartNumber']):05d}.part"
+            if not part_path.is_file():
+                raise _error("InvalidPart", "CompleteMultipartUpload")
+            chunk = part_path.read_bytes()
+            if _etag(chunk) != part["ETag"]:
+                raise _error("InvalidPart", "CompleteMultipartUpload")
+            data += chunk
+            digests += hashlib.md5(chunk).digest()
+        etag = f'"{hashlib.md5(digests).hexdigest()}-{len(MultipartUpload["Parts"])}"'
+        self._write(Bucket, Key, data, upload["ContentType"], etag)
+        shutil.rmtree(upload_dir)
+        return {"Bucket": Bucket, "Key": Key, "ETag": etag}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **_) -> Dict[str, Any]:
+        upload_dir, _ = self._upload(Bucket, Key, UploadId)
+        shutil.rmtree(upload_dir)
+        return {}
+
+    def pending_uploads(self) -> int:
+        multipart_dir = self.root / ".multipart"
+        return len(os.listdir(multipart_dir)) if multipart_dir.is_dir() else 0
+
+    # -- presigned URLs ------------------------------------------------------
+
+    def _signature(self, method: str, path: str, query: Dict[str, str]) -> str:
+        message = "\n".join([method, path] + [f"{k}={query[k]}" for k in sorted(query)])
+        return hmac.new(self.secret, message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def generate_presigned_url(self, ClientMethod: str, Params: Dict[str, Any], ExpiresIn: int = 3600, **_) -> str:
+        method = PRESIGN_METHODS[ClientMethod]
+        path = f"/{Params['Bucket']}/{quote(Params['Key'])}"
+        query = {"X-Amz-Expires-At": str(int(time.time()) + int(ExpiresIn))}
+        if ClientMethod == "upload_part":
+            query["uploadId"] = Params["UploadId"]
+            query["partNumber"] = str(Params["PartNumber"])
+        if "ContentType" in Params:
+            query["content-type"] = Params["ContentType"]
+        query["X-Amz-Signature"] = self._signature(method, path, query)
+        return f"{self.base_url}{path}?{urlencode(query)}"
+
+    def request(self, method: str, url: str, data: bytes = b"", headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """Perform an HTTP request against a presigned URL: (status, headers, body)"""
+        parts = urlsplit(url)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        signature = query.pop("X-Amz-Signature", "")
+        if not hmac.compare_digest(signature, self._signature(method, parts.path, query)):
+            return 403, {}, b"SignatureDoesNotMatch"
+        if int(query["X-Amz-Expires-At"]) < time.time():
+            return 403, {}, b"Request has expired"
+
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if "content-type" in query and headers.get("content-type") != query["content-type"]:
+            return 403, {}, b"SignatureDoesNotMatch"
+
+        bucket, key = parts.path.lstrip("/").split("/", 1)
+        key = unquote(key)
+        try:
+            if method == "GET":
+                response = self.get_object(Bucket=bucket, Key=key)
+                with response["Body"] as body:
+                    return 200, {"ETag": response["ETag"]}, body.read()
+            if "uploadId" in query:
+                response = self.upload_part(
+                    Bucket=bucket, Key=key, UploadId=query["uploadId"], PartNumber=int(query["partNumber"]), Body=data
+                )
+            else:
+                response = self.put_object(Bucket=bucket, Key=key, Body=data, ContentType=headers.get("content-type"))
+            return 200, {"ETag": response["ETag"]}, b""
+        except ClientError as e:
+            return 404, {}, e.response["Error"]["Code"].encode("utf-8")
@@ -0,0 +1,101 @@
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.r2_storage_service as r2_module
+from services.r2_storage_service import R2StorageService
+from tests.fake_s3 import FakeS3Client
+
+
+def make_service():
+    root = tempfile.mkdtemp()
+    fake = FakeS3Client(root)
+    service = R2StorageService()
+    service.initialize(client=fake)
+    return service, fake
+
+
+def test_presigned_put_then_get():
+    service, fake = make_service()
+    upload = service.presign_upload("leaf.JPG", "image/jpeg", size=1234)
+    assert upload["method"] == "PUT"
+    assert service.is_upload_key(upload["key"]) and upload["key"].endswith(".jpg")
+
+    status, headers, _ = fake.request("PUT", upload["url"], b"x" * 1234, upload["headers"])
+    assert status == 200
+    # The signed content type must be sent back
+    assert fake.request("PUT", upload["url"], b"x", {"Content-Type": "text/plain"})[0] == 403
+
+    info = service.object_info(upload["key"])
+    assert info["size"] == 1234 and info["content_type"] == "image/jpeg"
+
+    status, _, body = fake.request("GET", service.presign_download(upload["key"]))
+    assert status == 200 and body == b"x" * 1234
+
+
+def test_expired_url_rejected():
+    service, fake = make_service()
+    upload = service.presign_upload("a.pdf", "application/pdf", expires_in=-1)
+    assert fake.request("PUT", upload["url"], b"%PDF", upload["headers"])[0] == 403
+
+
+def test_presigned_multipart_upload():
+    service, fake = make_service()
+    size = r2_module.MULTIPART_THRESHOLD + 3
+    data = os.urandom(size)
+    upload = service.presign_upload("manual.pdf", "application/pdf", size=size)
+    assert "upload_id" in upload and len(upload["parts"]) == -(-size // upload["part_size"])
+
+    parts = []
+    for part in upload["parts"]:
+        start = (part["part_number"] - 1) * upload["part_size"]
+        status, headers, _ = fake.request("PUT", part["url"], data[start:start + upload["part_size"]])
+        assert status == 200
+        parts.append({"part_number": part["part_number"], "etag": headers["ETag"]})
+
+    service.complete_multipart_upload(upload["key"], upload["upload_id"], list(reversed(parts)))
+    assert fake.pending_uploads() == 0
+
+    path = os.path.join(tempfile.mkdtemp(), "out.pdf")
+    service.download_to_file(upload["key"], path)
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+
+def test_server_side_multipart_aborts_on_failure():
+    service, fake = make_service()
+    data = os.urandom(r2_module.MULTIPART_PART_SIZE * 2 + 10)
+    key = service.upload_fileobj(io.BytesIO(data), service.new_key("big.pdf"), "application/pdf")
+    assert service.object_info(key)["size"] == len(data)
+    assert service.object_info(key)["etag"].endswith('-3"')
+
+    original_upload_part = fake.upload_part
+
+    def failing_upload_part(**kwargs):
+        if kwargs["PartNumber"] == 2:
+            raise IOError("connection reset")
+        return original_upload_part(**kwargs)
+
+    fake.upload_part = failing_upload_part
+    try:
+        service.upload_fileobj(io.BytesIO(data), service.new_key("big.pdf"), "application/pdf")
+        assert False, "expected the upload to fail"
+    except IOError:
+        pass
+    assert fake.pending_uploads() == 0
+
+
+def test_upload_key_guard():
+    service, _ = make_service()
+    assert not service.is_upload_key("images/abc.png")
+    assert not service.is_upload_key("uploads/../images/abc.png")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")